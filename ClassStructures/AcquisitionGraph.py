@@ -1,13 +1,29 @@
 import pyqtgraph as pg
 import numpy as np
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QComboBox
+from PyQt5.QtWidgets import QComboBox, QStylePainter, QStyleOptionComboBox, QStyle
+from ClassStructures.PlotDecimation import EnvelopeDecimator
+from ClassStructures.PlotWorker import PlotPreparationWorker
+
+# Colors of the traces, in the order of selection
+TRACE_COLORS = ['#fbbf24', '#38bdf8', '#f472b6', '#4ade80', '#a78bfa', '#fb923c', '#f87171', '#2dd4bf']
+
+# View modes: time shown in seconds, None for the whole run ("Live" is the plot buffer of TimeWindowLength)
+HISTORY_VIEWS = {"Last 30 min": 1800, "Whole run": None}
+
 
 class ChannelSelectorComboBox(QComboBox):
+    """Combo box with a checkable list of all the channels of the DAQ tasks, several channels can be selected."""
+    selection_changed = pyqtSignal()
 
     def __init__(self, DAQ_TASKS, AcquisitionGraphReference, preferred_label=None):
         super().__init__()
 
+        # The popup stays open while the channels are checked
+        self._keep_popup_open = False
+        self.view().pressed.connect(self._toggle_item)
+
         # Generate a dictionary with all channels and corresponding tasks
         self.ALL_CHANNELS = {}
         for n, task in enumerate(DAQ_TASKS):
@@ -15,16 +31,27 @@ class ChannelSelectorComboBox(QComboBox):
                 self.ALL_CHANNELS[f"{task['NAME']} - {channel_name}"] = [channel_value[-1], task["DAQ_TASK_REFERENCE"]]
 
         # Create the channel display list
-        self._populate_signal_selector(self.ALL_CHANNELS, preferred_label=preferred_label)
-        self.setToolTip("Select the channel to display")
+        self._populate_signal_selector(self.ALL_CHANNELS,
+                                       preferred_labels=[preferred_label] if preferred_label else None)
+        self.setToolTip("Select the channels to display")
 
         # Connect with the Acquisition Graph
         self.AcquisitionGraphReference = AcquisitionGraphReference
-        self.currentIndexChanged.connect(AcquisitionGraphReference.update_DAQ_Plot_Buffer)
+        self.selection_changed.connect(AcquisitionGraphReference.update_DAQ_Plot_Buffer)
         self.AcquisitionGraphReference.signal_selector = self
 
     def value(self):
-        return self.currentData()
+        """First selected channel [index, DAQ task], or None."""
+        values = self.values()
+        return values[0][1] if values else None
+
+    def values(self):
+        """Selected channels as a list of (label, [index, DAQ task])."""
+        return [(self.itemText(idx), self.itemData(idx)) for idx in range(self.count())
+                if self.model().item(idx).checkState() == Qt.Checked]
+
+    def checked_labels(self):
+        return [label for label, _ in self.values()]
 
     def rebuild_signal_selector(self, DAQ_TASKS, preferred_label=None):
         self.ALL_CHANNELS.clear()
@@ -33,115 +60,247 @@ class ChannelSelectorComboBox(QComboBox):
                 self.ALL_CHANNELS[f"{task['NAME']} - {channel_name}"] = [channel_value[-1], task["DAQ_TASK_REFERENCE"]]
 
         # Create the channel display list
-        self._populate_signal_selector(self.ALL_CHANNELS, preferred_label=preferred_label)
+        self._populate_signal_selector(self.ALL_CHANNELS,
+                                       preferred_labels=[preferred_label] if preferred_label else None)
 
-    def _populate_signal_selector(self, total_tasks, preferred_label=None):
-        current_label = preferred_label or self.currentText()
+    def _populate_signal_selector(self, total_tasks, preferred_labels=None):
+        checked_labels = preferred_labels or self.checked_labels()
         self.blockSignals(True)
         self.clear()
 
-        for label, channel_value in total_tasks.items():
+        for idx, (label, channel_value) in enumerate(total_tasks.items()):
             self.addItem(label, channel_value)
+            item = self.model().item(idx)
+            item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if label in checked_labels else Qt.Unchecked)
 
-        if current_label:
-            idx = self.findText(current_label)
-            if idx >= 0:
-                self.setCurrentIndex(idx)
-            elif self.count() > 0:
-                self.setCurrentIndex(0)
-        elif self.count() > 0:
-            self.setCurrentIndex(0)
+        # Keep at least one channel on screen (the previous channels might not exist in the new profile)
+        if not self.values() and self.count() > 0:
+            self.model().item(0).setCheckState(Qt.Checked)
 
         self.blockSignals(False)
+        self.update()
+
+    def _toggle_item(self, index):
+        item = self.model().itemFromIndex(index)
+        item.setCheckState(Qt.Unchecked if item.checkState() == Qt.Checked else Qt.Checked)
+        self._keep_popup_open = True
+        self.update()
+        self.selection_changed.emit()
+
+    def hidePopup(self):
+        if self._keep_popup_open:
+            self._keep_popup_open = False
+            return
+        super().hidePopup()
+
+    def paintEvent(self, event):
+        # Show the selected channels instead of the current item
+        labels = self.checked_labels()
+        painter = QStylePainter(self)
+        option = QStyleOptionComboBox()
+        self.initStyleOption(option)
+        option.currentText = ", ".join(labels) if labels else "No channel selected"
+        painter.drawComplexControl(QStyle.CC_ComboBox, option)
+        painter.drawControl(QStyle.CE_ComboBoxLabel, option)
+
+
+class AcquisitionGraph(pg.GraphicsLayoutWidget):
+    """
+    Live plot of the selected channels, overlaid in one plot or stacked in one plot per channel.
+
+    Each trace is the min/max envelope of its channel computed from the plot buffer of its DAQ task, in the
+    engineering units of its conversion factor, and the traces are aligned with the acquisition time of each task.
+    The points drawn per frame are limited to MAX_PLOT_POINTS.
+    In the history views the traces are read from the decimation pyramid of each task, the view follows the
+    acquisition until the user zooms or pans, and zooming in shows finer levels down to the raw samples.
+    The frames are prepared by a PlotPreparationWorker in its own thread, the GUI thread only draws them.
+    """
+    MAX_PLOT_POINTS = 40000
 
-class AcquisitionGraph(pg.PlotWidget):
     def __init__(self, TimeWindowLength, parent=None):
         super(AcquisitionGraph, self).__init__(parent)
 
         self.TimeWindowLength = TimeWindowLength
         self.signal_selector = None
 
-        self.setLabel('left', 'Amplitude', units='V', color='#e5e7eb', size='11pt', autoSIPrefix=False)
-        self.setLabel('bottom', 'Time', units='s', color='#e5e7eb', size='11pt', autoSIPrefix=False)
-        self.curve = self.plot([], pen=pg.mkPen('#fbbf24', width=2.5))
-        self.display_data = np.array([], dtype=np.float64)
+        # "overlaid" (all the traces in one plot) or "stacked" (one plot per trace)
+        self.layout_mode = "overlaid"
+
+        # "Live" (last TimeWindowLength seconds) or one of HISTORY_VIEWS
+        self.view_mode = "Live"
+        self.follow_acquisition = True
+
+        # Displayed traces: label, DAQ task, envelope decimator and curve
+        self.traces = []
+        self.plots = []
+
+        # Incremented when the traces change, the frames of the previous traces are not drawn
+        self.generation = 0
+
+        # Plot preparation worker, the frames are drawn when it signals that one is ready
+        self.plot_worker = PlotPreparationWorker(TimeWindowLength, HISTORY_VIEWS)
+        self.plot_thread = QThread()
+        self.plot_worker.moveToThread(self.plot_thread)
+        self.plot_worker.frame_ready.connect(self.draw_frame)
+
         self.setBackground("#111827")
-        self.showGrid(x=True, y=True, alpha=0.35)
-        self.getAxis('left').setPen(pg.mkPen('#64748b', width=1.5))
-        self.getAxis('left').setTextPen(pg.mkPen('#cbd5e1'))
+        self.setMinimumHeight(420)
+        self._add_plot(last=True)
+
+    def _add_plot(self, last):
+        plot = self.addPlot(row=len(self.plots), col=0)
+        plot.showGrid(x=True, y=True, alpha=0.35)
+        plot.getAxis('left').setPen(pg.mkPen('#64748b', width=1.5))
+        plot.getAxis('left').setTextPen(pg.mkPen('#cbd5e1'))
         axis_font = QFont('Segoe UI', 11)
         axis_font.setWeight(QFont.Medium)
-        self.getAxis('left').setStyle(tickFont=axis_font)
-        self.setMinimumHeight(420)
+        plot.getAxis('left').setStyle(tickFont=axis_font)
+        if last:
+            plot.setLabel('bottom', 'Time', units='s', color='#e5e7eb', size='11pt', autoSIPrefix=False)
+        else:
+            plot.getAxis('bottom').setStyle(showValues=False)
 
         # Set initial axis ranges: Y-axis from -10 to 10V, X-axis from 0 to TimeWindowLength
-        self.setYRange(-10, 10)
-        self.setXRange(0, self.TimeWindowLength)
-        self.time_axis = None
+        plot.setYRange(-10, 10)
+        plot.setXRange(0, self.TimeWindowLength)
+        if self.plots:
+            plot.setXLink(self.plots[0])
 
+        # In the history views, a zoom or pan of the user stops following the acquisition
+        plot.getViewBox().sigRangeChangedManually.connect(self._stop_following)
+        plot.getViewBox().sigXRangeChanged.connect(self._publish_view)
 
-    def update_DAQ_Plot_Buffer(self):
-        selected = self.signal_selector.value()
-        if not selected:
-            self.actual_plotter = None
-            self.index_pointer = None
-            self.curve.setData([])
-            return
+        self.plots.append(plot)
+        return plot
 
-        # Obtain the DAQ Task Reference
-        DAQ_Task_Reference = selected[1]
-
-        # Adjust axis and labels depending on task/channel type
-        task_type = getattr(DAQ_Task_Reference, 'task_type', None)
-        if task_type == 'analog':
-            # Analog: voltage between -10 and 10
-            try:
-                self.setYRange(-10, 10)
-            except Exception:
-                pass
-            self.setLabel('left', 'Amplitude', units='V', color='#e5e7eb', size='11pt', autoSIPrefix=False)
+    @staticmethod
+    def _set_amplitude_axis(plot, channels):
+        """channels: list of (DAQ task, channel index) drawn in the plot."""
+        analog = [(task, index) for task, index in channels if getattr(task, 'task_type', None) == 'analog']
+        if analog:
+            # Analog: engineering units of the conversion factors, the range follows the signal
+            units = {task.channel_units[index] for task, index in analog}
+            plot.setLabel('left', 'Amplitude', units=units.pop() if len(units) == 1 else '', color='#e5e7eb',
+                          size='11pt')
+            plot.enableAutoRange(axis='y')
         else:
             # Digital: values 0 or 1, not voltage
-            try:
-                self.setYRange(0, 1)
-            except Exception:
-                pass
-            self.setLabel('left', 'Digital signal', units='', color='#e5e7eb', size='11pt', autoSIPrefix=False)
+            plot.setYRange(0, 1)
+            plot.setLabel('left', 'Digital signal', units='', color='#e5e7eb', size='11pt', autoSIPrefix=False)
 
-        # Disconnect the plotter from the screen
-        self.actual_plotter = None
+    def _envelope_bins(self):
+        """One min/max bin per horizontal pixel of the plot area, within the MAX_PLOT_POINTS budget."""
+        width = int(self.plots[0].getViewBox().width()) if self.plots else self.width()
+        budget = self.MAX_PLOT_POINTS // (2 * max(1, len(self.traces)))
+        return max(50, min(width, budget))
 
-        # Reshape the display_data buffer
-        if self.display_data.size != DAQ_Task_Reference.PLOT_BUFFER_SIZE:
-            self.display_data = np.empty(DAQ_Task_Reference.PLOT_BUFFER_SIZE, dtype=np.float64)
+    def set_layout_mode(self, layout_mode):
+        self.layout_mode = layout_mode.lower()
+        self.update_DAQ_Plot_Buffer()
 
-        # Calculate the array index corresponding to the selected signal
-        self.index_pointer = selected[0]
+    def set_view_mode(self, view_mode):
+        """Selecting a view (even the current one) follows the acquisition again."""
+        self.view_mode = view_mode
+        self.follow_acquisition = True
+        if view_mode == "Live":
+            for plot in self.plots:
+                plot.setXRange(0, self.TimeWindowLength, padding=0)
+        self._publish_view()
 
-        # Select the actual plotter
-        self.actual_plotter = DAQ_Task_Reference
+    def _stop_following(self, *args):
+        if self.view_mode != "Live":
+            self.follow_acquisition = False
+            self._publish_view()
 
-        # Remake the time axis from 0 to TimeWindowLength
-        plot_buffer_size = self.actual_plotter.PLOT_BUFFER_SIZE
-        self.time_axis = np.linspace(0, self.TimeWindowLength, plot_buffer_size)
+    def _publish_view(self, *args):
+        # Also called by the GraphicsView constructor through resizeEvent, before the worker exists
+        if getattr(self, "plot_worker", None) is None or not self.plots:
+            return
+        self.plot_worker.set_view(mode=self.view_mode, follow=self.follow_acquisition,
+                                  x_range=tuple(self.plots[0].getViewBox().viewRange()[0]),
+                                  n_bins=self._envelope_bins())
 
-    def flush_screen(self):
-        self.actual_plotter = None
-        self.curve.setData([])
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # Also called by the GraphicsView constructor, before the traces exist
+        traces = getattr(self, "traces", None)
+        if traces and traces[0]["decimator"].requested_bins != self._envelope_bins():
+            self._rebuild_decimators()
+        self._publish_view()
 
-    def update_plot(self):
-        if self.actual_plotter is None:
-            return
-        if self.display_data.size == 0:
+    def _rebuild_decimators(self):
+        n_bins = self._envelope_bins()
+        for trace in self.traces:
+            trace["decimator"] = EnvelopeDecimator(trace["task"], trace["index"], n_bins)
+        self._publish_traces()
+
+    def _publish_traces(self):
+        self.generation += 1
+        self.plot_worker.set_traces(self.traces, self.generation)
+        self._publish_view()
+
+    def start_plot_worker(self, interval):
+        """Prepare a frame every interval ms in the worker thread."""
+        self.plot_thread.start()
+        self.plot_worker.start_signal.emit(interval)
+
+    def stop_plot_worker(self):
+        self.plot_worker.stop_signal.emit()
+        self.plot_thread.quit()
+        self.plot_thread.wait()
+
+    def update_DAQ_Plot_Buffer(self):
+        selected = self.signal_selector.values() if self.signal_selector is not None else []
+
+        # Disconnect the plotter from the screen and remake the plots
+        self.traces = []
+        self.clear()
+        self.plots = []
+
+        if not selected:
+            self._add_plot(last=True)
+            self._publish_traces()
             return
 
-        plot_buffer = self.actual_plotter.plot_buffer
-        plot_buffer_size = self.actual_plotter.PLOT_BUFFER_SIZE
-        write_index = self.actual_plotter.write_index
+        stacked = self.layout_mode == "stacked" and len(selected) > 1
+        if not stacked:
+            plot = self._add_plot(last=True)
+            if len(selected) > 1:
+                plot.addLegend(offset=(10, 10), labelTextColor='#e5e7eb')
+            self._set_amplitude_axis(plot, [(task, index) for _, (index, task) in selected])
+
+        for n, (label, (index, DAQ_Task_Reference)) in enumerate(selected):
+            if stacked:
+                plot = self._add_plot(last=n == len(selected) - 1)
+                plot.setTitle(label, color='#e5e7eb', size='10pt')
+                self._set_amplitude_axis(plot, [(DAQ_Task_Reference, index)])
+
+            curve = plot.plot([], pen=pg.mkPen(TRACE_COLORS[n % len(TRACE_COLORS)],
+                                               width=2.5 if len(selected) == 1 else 1.5), name=label)
+            self.traces.append({"label": label, "task": DAQ_Task_Reference, "index": index, "decimator": None,
+                                "curve": curve})
+
+        # Min/max envelope of the selected signals, computed incrementally from the plot buffers
+        self._rebuild_decimators()
+
+    def flush_screen(self):
+        for trace in self.traces:
+            trace["curve"].setData([])
+        self.traces = []
+        self._publish_traces()
+
+    def draw_frame(self):
+        """Draw the last frame of the plot worker (GUI thread), the arrays are ready to be drawn."""
+        frame = self.plot_worker.take_frame()
+        if frame is None:
+            return
 
-        tail_size = plot_buffer_size - write_index
-        self.display_data[:tail_size] = plot_buffer[write_index:, self.index_pointer]
-        self.display_data[tail_size:] = plot_buffer[:write_index, self.index_pointer]
+        if frame["generation"] == self.generation:
+            for trace, (x, y) in zip(self.traces, frame["curves"]):
+                trace["curve"].setData(x, y)
+            if frame["x_range"] is not None and self.follow_acquisition and self.view_mode != "Live":
+                self.plots[0].setXRange(*frame["x_range"], padding=0)
 
-        # Set the data to the curve for plotting
-        self.curve.setData(self.time_axis, self.display_data)
\ No newline at end of file
+        # The worker can prepare the next frame
+        self.plot_worker.frame_drawn()
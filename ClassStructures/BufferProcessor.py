@@ -1,14 +1,204 @@
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from datetime import datetime
 import numpy as np
 import logging
-import pandas as pd
+import time
+import h5py
+from openpyxl import Workbook
+import json
 import os
 
+from ClassStructures.DaqBackend import BACKEND
+
+# Chunk length (samples) and compression of the channel datasets of the HDF5 DAQ files
+HDF5_CHUNK_SAMPLES = 65536
+HDF5_COMPRESSION = "gzip"
+HDF5_COMPRESSION_LEVEL = 4
+
+# Block length (samples) used to stream the .bin files at the end of the run and Excel sheet row limit
+SAVE_DATA_CHUNK_SAMPLES = 1_000_000
+EXCEL_MAX_ROWS = 1_048_576
+
+
+def _channel_config(channel_config_data):
+    """The channel configuration might be [config_dict, index] after DaqInterface initialization."""
+    if isinstance(channel_config_data, list):
+        return channel_config_data[0]
+    return channel_config_data
+
+
+# Engineering units of the channels converted with the Keithley range, by keithley_sense
+KEITHLEY_SENSE_UNITS = {"voltage": "V", "current": "A", "impedance": "Ω", "charge": "C"}
+
+
+def conversion_scale(channel_config_data):
+    """Factor from the raw DAQ volts to engineering units (1 if the channel has no conversion factor)."""
+    factor = _channel_config(channel_config_data).get("conversion_factor", None)
+    try:
+        factor = float(factor)
+    except (TypeError, ValueError):
+        return 1.0
+    return factor if np.isfinite(factor) else 1.0
+
+
+def conversion_unit(channel_config_data, task_type):
+    """Unit of the scaled values of a channel: the Keithley sense unit, volts without conversion, '' if custom."""
+    if task_type == "digital":
+        return ""
+    config = _channel_config(channel_config_data)
+    source = str(config.get("conversion_source", "none")).strip().lower()
+    if source == "keithley":
+        return KEITHLEY_SENSE_UNITS.get(str(config.get("keithley_sense", "none")).strip().lower(), "")
+    if source == "custom":
+        return ""
+    return "V"
+
+
+def _dataset_name(channel_name):
+    """HDF5 uses '/' as group separator, the original name is kept in the dataset 'name' attribute."""
+    return channel_name.replace("/", "_")
+
+
+def create_hdf5_file(file_path, task_name, task_type, fs, channel_config, start_timestamp, synchronization=None,
+                     daq_backend=BACKEND):
+    """Create the self-describing HDF5 container of a DAQ task, one chunked dataset per channel."""
+    h5_file = h5py.File(file_path, "w")
+    h5_file.attrs["format"] = "pyTENG-DAQ"
+    h5_file.attrs["version"] = 2
+    h5_file.attrs["task_name"] = task_name
+    h5_file.attrs["task_type"] = task_type
+    h5_file.attrs["sample_rate"] = fs
+    h5_file.attrs["channel_names"] = json.dumps(list(channel_config.keys()))
+    h5_file.attrs["start_timestamp"] = start_timestamp
+    h5_file.attrs["daq_backend"] = daq_backend
+    h5_file.attrs["n_samples"] = 0
+
+    # Digital lines are stored as 0/1 bytes, analog channels as raw volts (the "unit" attribute is the unit after
+    # applying the conversion factor)
+    dtype = np.uint8 if task_type == "digital" else np.float64
+
+    group = h5_file.create_group("channels")
+    for name, config_data in channel_config.items():
+        dataset = group.create_dataset(_dataset_name(name),
+                                       shape=(0,),
+                                       maxshape=(None,),
+                                       dtype=dtype,
+                                       chunks=(HDF5_CHUNK_SAMPLES,),
+                                       compression=HDF5_COMPRESSION,
+                                       compression_opts=HDF5_COMPRESSION_LEVEL,
+                                       shuffle=True)
+        dataset.attrs["name"] = name
+        dataset.attrs["port"] = str(_channel_config(config_data).get("port", ""))
+        dataset.attrs["unit"] = conversion_unit(config_data, task_type)
+
+    write_conversion_attributes(h5_file, channel_config)
+    write_synchronization_attributes(h5_file, synchronization)
+    return h5_file
+
+
+def append_hdf5_block(h5_file, channel_names, data):
+    """Append a block of samples (samples x channels) at the end of each channel dataset."""
+    datasets = h5_file["channels"]
+    n_samples = int(h5_file.attrs["n_samples"])
+    for idx, name in enumerate(channel_names):
+        dataset = datasets[_dataset_name(name)]
+        dataset.resize((n_samples + len(data),))
+        dataset[n_samples:] = data[:, idx]
+    h5_file.attrs["n_samples"] = n_samples + len(data)
+
+    # Keep the file readable if the program crashes during the acquisition
+    h5_file.flush()
+
+
+def write_conversion_attributes(h5_file, channel_config):
+    """
+    The conversion factors are resolved after opening the file (Keithley), so they are written again on close.
+    The datasets keep the raw values, the scaled values are computed when reading (read_DAQ_file(scaled=True)).
+    """
+    conversion_factors = {}
+    for name, config_data in channel_config.items():
+        config = _channel_config(config_data)
+        factor = config.get("conversion_factor", None)
+        conversion_factors[name] = factor
+
+        dataset = h5_file["channels"][_dataset_name(name)]
+        dataset.attrs["conversion_factor"] = np.nan if factor is None else float(factor)
+        dataset.attrs["conversion_source"] = str(config.get("conversion_source", "none"))
+        dataset.attrs["keithley_sense"] = str(config.get("keithley_sense", "none"))
+
+    h5_file.attrs["conversion_factors"] = json.dumps(conversion_factors)
+
+
+def write_synchronization_attributes(h5_file, synchronization):
+    """
+    Start trigger and sample clock shared with the other tasks ('' if none) and index of the first saved sample
+    counted from the start trigger. The files of the tasks started by the same trigger are aligned by this index
+    (merge_DAQ_data), the start sample is only known once the first block is saved.
+    """
+    synchronization = synchronization or {}
+    start_sample = synchronization.get("start_sample", None)
+    h5_file.attrs["start_trigger"] = synchronization.get("start_trigger", "") or ""
+    h5_file.attrs["sample_clock"] = synchronization.get("sample_clock", "") or ""
+    h5_file.attrs["start_sample"] = 0 if start_sample is None else int(start_sample)
+
+
+def convert_bin_file(bin_path, h5_path, task_name, task_type, fs, channel_config, start_timestamp,
+                     excel_path=None, chunk_samples=SAVE_DATA_CHUNK_SAMPLES, synchronization=None,
+                     daq_backend=BACKEND):
+    """
+    Convert a raw .bin DAQ file into the HDF5 container in constant memory.
+
+    The .bin file is accessed through a memory map and streamed in blocks of chunk_samples samples.
+    If excel_path is given, an Excel copy is also written (capped to the Excel row limit), the time column
+    is computed for each block.
+    """
+    channel_names = list(channel_config.keys())
+    n_channels = len(channel_names)
+    n_samples = os.path.getsize(bin_path) // (8 * n_channels)
+
+    # np.memmap cannot map an empty file
+    if n_samples > 0:
+        data = np.memmap(bin_path, dtype=np.float64, mode="r", shape=(n_samples, n_channels))
+    else:
+        data = np.empty((0, n_channels), dtype=np.float64)
+
+    excel_samples = 0
+    if excel_path:
+        excel_samples = min(n_samples, EXCEL_MAX_ROWS - 1)
+        if excel_samples < n_samples:
+            print(f"Warning: the Excel file only contains the first {excel_samples} samples of {n_samples} "
+                  f"(Excel row limit), all the samples are saved in the HDF5 file.")
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        worksheet.append(["Time (s)"] + channel_names)
+
+    h5_file = create_hdf5_file(h5_path, task_name, task_type, fs, channel_config, start_timestamp,
+                               synchronization=synchronization, daq_backend=daq_backend)
+    try:
+        for start in range(0, n_samples, chunk_samples):
+            block = np.asarray(data[start:start + chunk_samples])
+            append_hdf5_block(h5_file, channel_names, block)
+
+            if start < excel_samples:
+                block = block[:excel_samples - start]
+                t = np.arange(start, start + len(block)) / fs
+                for row in np.column_stack((t, block)).tolist():
+                    worksheet.append(row)
+    finally:
+        h5_file.close()
+        del data
+
+    if excel_path:
+        workbook.save(excel_path)
+
+    return n_samples
+
+
 # ---------------- BUFFER PROCESSING THREAD ----------------
 class BufferProcessor(QObject):
     process_buffer_signal = pyqtSignal(object)
 
-    def __init__(self, TASK, mainWindowReference, parent=None):
+    def __init__(self, TASK, mainWindowReference, STORAGE_FORMAT="hdf5", parent=None):
         super().__init__(parent)
 
         self.fs = TASK["SAMPLE_RATE"]
@@ -16,13 +206,25 @@ class BufferProcessor(QObject):
         self.task_name = TASK["NAME"]
         self.task_type = TASK["TYPE"]
 
+        # "hdf5": chunked and compressed file written incrementally, no conversion at the end of the run
+        # "bin": raw numpy binary file converted to HDF5 at the end of the run with Save_Data()
+        if STORAGE_FORMAT not in ("hdf5", "bin"):
+            raise ValueError(f"Unknown STORAGE_FORMAT '{STORAGE_FORMAT}', use 'hdf5' or 'bin'")
+        self.STORAGE_FORMAT = STORAGE_FORMAT
+
         self.process_buffer_signal.connect(self.save_data)
         self.mainWindow = mainWindowReference
         self.local_path = self.mainWindow.local_path
-        self.isSaving = False
 
         self.file_handle = None
         self.file_path = None
+        self.start_timestamp = None
+
+        # Save slots ring, callback statistics and synchronization of the DAQ task, assigned by the DAQ task when
+        # it is created
+        self.save_ring = None
+        self.stats = None
+        self.synchronization = None
 
         # Create a list of names and a list of indices
         self.channel_names = list(self.channel_config.keys())
@@ -30,15 +232,19 @@ class BufferProcessor(QObject):
     @pyqtSlot(object)
     def save_data(self, data):
 
-        # Initialize the saving process
-        self.isSaving = True
-
         # Try to save the data into the disk
+        start_time = time.perf_counter()
         try:
-            # NumPy's tofile() method writes the array data directly to the file object,
-            # avoiding the creation of an intermediate bytes buffer (python bytes object) and thus minimizing
-            # unnecessary memory copies for maximum performance. (It does not use the file_handle.write() method)
-            data.tofile(self.file_handle)
+            if self.STORAGE_FORMAT == "hdf5":
+                # The start sample is known once the DAQ task has stored its first block
+                if self.file_handle.attrs["n_samples"] == 0:
+                    write_synchronization_attributes(self.file_handle, self.synchronization)
+                append_hdf5_block(self.file_handle, self.channel_names, data)
+            else:
+                # NumPy's tofile() method writes the array data directly to the file object,
+                # avoiding the creation of an intermediate bytes buffer (python bytes object) and thus minimizing
+                # unnecessary memory copies for maximum performance. (It does not use the file_handle.write() method)
+                data.tofile(self.file_handle)
         except Exception as e:
             if not self.mainWindow.error_flag:
                 print("Error saving data: ", e)
@@ -46,54 +252,90 @@ class BufferProcessor(QObject):
                 self.mainWindow.error_flag = True
                 self.mainWindow.trigger_acquisition_signal.emit()
         else:
-            logging.info(f"{self.task_name}_{self.task_type} -> [+] Saved {len(data)} samples")
+            if self.stats is not None:
+                self.stats.record_save(len(data), data.nbytes, time.perf_counter() - start_time)
 
-        # The data has been saved or an error has occurred
-        self.isSaving = False
+            if self.save_ring is not None:
+                logging.info(f"{self.task_name}_{self.task_type} -> [+] Saved {len(data)} samples "
+                             f"(save slots in use: {self.save_ring.occupancy()}/{self.save_ring.N_SLOTS})")
+            else:
+                logging.info(f"{self.task_name}_{self.task_type} -> [+] Saved {len(data)} samples")
+
+        # The data has been saved or an error has occurred, release the slot for the DAQ task
+        if self.save_ring is not None:
+            self.save_ring.release()
 
     def close_file(self):
+        if self.file_handle is None:
+            return
+        if self.STORAGE_FORMAT == "hdf5":
+            write_conversion_attributes(self.file_handle, self.channel_config)
         self.file_handle.close()
-        print(f"File DAQ_{self.task_name}_{self.task_type}.bin has been closed")
+        self.file_handle = None
+        print(f"File {os.path.basename(self.file_path)} has been closed")
 
     def open_file(self):
-        self.file_path = f"{self.local_path[0]}/DAQ_{self.task_name}_{self.task_type}.bin"
-        self.file_handle = open(self.file_path, 'ab')
+        self.start_timestamp = datetime.now().isoformat()
+        if self.STORAGE_FORMAT == "hdf5":
+            self.file_path = os.path.join(self.local_path[0],
+                                          f"DAQ-{self.task_name}_{self.task_type}-{self.mainWindow.exp_id}.h5")
+            self.file_handle = create_hdf5_file(self.file_path, self.task_name, self.task_type, self.fs,
+                                                self.channel_config, self.start_timestamp,
+                                                synchronization=self.synchronization)
+        else:
+            self.file_path = f"{self.local_path[0]}/DAQ_{self.task_name}_{self.task_type}.bin"
+            self.file_handle = open(self.file_path, 'ab')
 
     def remove_file(self):
         if os.path.exists(self.file_path):
-            if not self.file_handle.closed:
+            if self.file_handle is not None:
                 self.file_handle.close()
             os.remove(self.file_path)
             self.file_handle = None
-            print(f"File DAQ_{self.task_name}_{self.task_type}.bin has been deleted")
+            print(f"File {os.path.basename(self.file_path)} has been deleted")
         else:
-            print(f"Error: File DAQ_{self.task_name}_{self.task_type}.bin not found.")
+            print(f"Error: File {os.path.basename(self.file_path)} not found.")
 
-    def Save_Data(self):
-        """This function converts the numpy binary file to pandas dataframe and saves it as pickle file."""
+    def remove_temporary_file(self):
+        """Remove the raw binary file once converted, the HDF5 file is the final data file and is kept."""
+        if self.STORAGE_FORMAT == "bin":
+            self.remove_file()
 
-        print(f"\nConverting DAQ_{self.task_name}_{self.task_type}.bin to Pickle ...")
+    def conversion_parameters(self, export_excel=False):
+        """Arguments of convert_bin_file() for the file of the current acquisition (None for HDF5 files).
+        They only contain plain data, so the conversion can also run in a finalization worker process."""
+        if self.STORAGE_FORMAT == "hdf5":
+            return None
 
-        # Read the saved data
-        raw_data = np.fromfile(self.file_path, dtype=np.float64)
+        base_path = os.path.join(self.local_path[0], f'DAQ-{self.task_name}_{self.task_type}-{self.mainWindow.exp_id}')
+        return {
+            "bin_path": self.file_path,
+            "h5_path": base_path + ".h5",
+            "task_name": self.task_name,
+            "task_type": self.task_type,
+            "fs": self.fs,
+            "channel_config": self.channel_config,
+            "start_timestamp": self.start_timestamp,
+            "excel_path": base_path + ".xlsx" if export_excel else None,
+            "synchronization": dict(self.synchronization) if self.synchronization is not None else None,
+            "daq_backend": BACKEND,
+        }
 
-        # Reshape the array
-        data = raw_data.reshape(-1, len(self.channel_names))
+    def Save_Data(self, export_excel=False):
+        """This function converts the numpy binary file to the HDF5 container streaming it in fixed-size blocks,
+        so the memory used does not depend on the experiment duration. The Excel copy is optional.
+        The HDF5 files are written incrementally during the acquisition, so they don't need any conversion."""
 
-        # Create the timestamps
-        t = np.arange(data.shape[0]) / self.fs
+        filename = f'DAQ-{self.task_name}_{self.task_type}-{self.mainWindow.exp_id}.h5'
 
-        # Create the dataframe
-        df = pd.DataFrame(data, columns=self.channel_names)
-        df.insert(0, "Time (s)", t)  # Insert time at the start
+        parameters = self.conversion_parameters(export_excel=export_excel)
+        if parameters is None:
+            return filename
 
-        # Save the dataframe
-        filename = f'DAQ-{self.task_name}_{self.task_type}-{self.mainWindow.exp_id}.pkl'
-        filename_excel = f'DAQ-{self.task_name}_{self.task_type}-{self.mainWindow.exp_id}.xlsx'
-        df.to_pickle(os.path.join(self.local_path[0], filename))
-        df.to_excel(os.path.join(self.local_path[0], filename_excel), index=False)
+        print(f"\nConverting DAQ_{self.task_name}_{self.task_type}.bin to HDF5 ...")
 
-        print("Data saved to location:", os.path.join(self.local_path[0], filename))
+        convert_bin_file(**parameters)
 
-        return filename
+        print("Data saved to location:", parameters["h5_path"])
 
+        return filename
@@ -0,0 +1,148 @@
+import numpy as np
+import time
+
+# Upper edges (ms) of the callback duration histogram bins, the last bin counts the longer callbacks
+DURATION_BIN_EDGES_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class CallbackStats:
+    """
+    Counters of the EveryNCallback path of a DAQ task and of the saves of its BufferProcessor.
+
+    record_callback() is called by the DAQ callback thread and record_save() by the BufferProcessor thread,
+    each counter has a single writer so no lock is needed. The counters are plain Python numbers updated
+    with a few operations per call, the statistics are only computed in snapshot().
+    """
+    def __init__(self, task_name, sample_rate, samples_per_callback):
+        self.task_name = task_name
+        self.sample_rate = sample_rate
+        self.samples_per_callback = samples_per_callback
+        self.expected_interval = samples_per_callback / sample_rate
+        self._bin_edges = [edge / 1000 for edge in DURATION_BIN_EDGES_MS]
+        self.reset()
+
+    def reset(self):
+        # Callback path
+        self.callbacks = 0
+        self.duration_histogram = [0] * (len(DURATION_BIN_EDGES_MS) + 1)
+        self.duration_sum = 0.0
+        self.duration_max = 0.0
+        self.last_callback_time = None
+        self.jitter_sum = 0.0
+        self.jitter_square_sum = 0.0
+        self.jitter_max = 0.0
+        self.samples_read = 0
+        self.short_reads = 0
+        self.save_queue_depth = 0
+        self.save_queue_depth_max = 0
+
+        # BufferProcessor saves
+        self.saves = 0
+        self.saved_samples = 0
+        self.saved_bytes = 0
+        self.save_time = 0.0
+        self.save_time_max = 0.0
+
+        # The task may wait for its start trigger, the acquisition time is counted from the first callback
+        self.start_time = None
+        self.stop_time = None
+
+    def stop(self):
+        """End of the acquisition, the expected samples don't increase anymore (only the first call counts)."""
+        if self.stop_time is None:
+            self.stop_time = time.perf_counter()
+
+    def record_callback(self, start_time, duration, samples_read, save_queue_depth):
+        """start_time: perf_counter() at the beginning of the callback, duration in seconds."""
+        self.callbacks += 1
+
+        # The first block has been acquired during the callback period before the first callback
+        if self.start_time is None:
+            self.start_time = start_time - self.expected_interval
+
+        # Histogram bin: the edges list is short, a linear scan is faster than numpy for one value
+        idx = 0
+        for edge in self._bin_edges:
+            if duration <= edge:
+                break
+            idx += 1
+        self.duration_histogram[idx] += 1
+        self.duration_sum += duration
+        if duration > self.duration_max:
+            self.duration_max = duration
+
+        # Jitter: deviation of the interval between callbacks from SAMPLES_PER_CALLBACK / SAMPLE_RATE
+        if self.last_callback_time is not None:
+            jitter = start_time - self.last_callback_time - self.expected_interval
+            self.jitter_sum += jitter
+            self.jitter_square_sum += jitter * jitter
+            if abs(jitter) > self.jitter_max:
+                self.jitter_max = abs(jitter)
+        self.last_callback_time = start_time
+
+        self.samples_read += samples_read
+        if samples_read != self.samples_per_callback:
+            self.short_reads += 1
+
+        self.save_queue_depth = save_queue_depth
+        if save_queue_depth > self.save_queue_depth_max:
+            self.save_queue_depth_max = save_queue_depth
+
+    def record_save(self, n_samples, n_bytes, duration):
+        self.saves += 1
+        self.saved_samples += n_samples
+        self.saved_bytes += n_bytes
+        self.save_time += duration
+        if duration > self.save_time_max:
+            self.save_time_max = duration
+
+    def _duration_percentile(self, fraction):
+        """Upper edge (ms) of the histogram bin containing the percentile, None above the last edge."""
+        if self.callbacks == 0:
+            return None
+        idx = int(np.searchsorted(np.cumsum(self.duration_histogram), fraction * self.callbacks))
+        if idx >= len(DURATION_BIN_EDGES_MS):
+            return None
+        return DURATION_BIN_EDGES_MS[idx]
+
+    def snapshot(self):
+        """Statistics of the current acquisition (JSON serializable)."""
+        # Acquisition time until now, or until the task stopped (0 before the first callback)
+        if self.start_time is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.stop_time if self.stop_time is not None else time.perf_counter()) - self.start_time
+        samples_expected = int(elapsed * self.sample_rate)
+        intervals = max(self.callbacks - 1, 0)
+        jitter_mean = self.jitter_sum / intervals if intervals else 0.0
+        jitter_std = np.sqrt(max(self.jitter_square_sum / intervals - jitter_mean ** 2, 0.0)) if intervals else 0.0
+
+        return {
+            "TaskName": self.task_name,
+            "SampleRate": self.sample_rate,
+            "SamplesPerCallback": self.samples_per_callback,
+            "ElapsedTime (s)": elapsed,
+            "Callbacks": self.callbacks,
+            "CallbackDurationHistogram": {
+                "BinEdges (ms)": list(DURATION_BIN_EDGES_MS),
+                "Counts": list(self.duration_histogram),
+            },
+            "CallbackDurationMean (ms)": 1000 * self.duration_sum / self.callbacks if self.callbacks else None,
+            "CallbackDurationP99 (ms)": self._duration_percentile(0.99),
+            "CallbackDurationMax (ms)": 1000 * self.duration_max,
+            "JitterMean (ms)": 1000 * jitter_mean,
+            "JitterStd (ms)": 1000 * jitter_std,
+            "JitterMax (ms)": 1000 * self.jitter_max,
+            "SamplesRead": self.samples_read,
+            "SamplesExpected": samples_expected,
+            # Samples acquired by the hardware and not read by the callbacks, besides the block being acquired
+            # and the block being transferred: missing or late callbacks
+            "SamplesMissing": max(samples_expected - self.samples_read - 2 * self.samples_per_callback, 0),
+            "ShortReads": self.short_reads,
+            "SaveQueueDepth": self.save_queue_depth,
+            "SaveQueueDepthMax": self.save_queue_depth_max,
+            "Saves": self.saves,
+            "SavedSamples": self.saved_samples,
+            "SaveThroughput (MB/s)": self.saved_bytes / self.save_time / 1e6 if self.save_time > 0 else None,
+            "SaveTimeMax (ms)": 1000 * self.save_time_max,
+        }
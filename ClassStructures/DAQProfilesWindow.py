@@ -20,7 +20,7 @@ from PyQt5.QtWidgets import (
 import copy
 import json
 
-from PyDAQmx.DAQmxConstants import (
+from ClassStructures.DaqBackend import (
     DAQmx_Val_ChanForAllLines,
     DAQmx_Val_ContSamps,
     DAQmx_Val_Diff,
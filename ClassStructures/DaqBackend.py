@@ -0,0 +1,41 @@
+"""
+DAQ backend selection.
+
+The DAQ tasks and constants are imported from this module instead of PyDAQmx. The backend is selected with the
+PYTENG_DAQ_BACKEND environment variable:
+    - "nidaqmx" or not defined: PyDAQmx and the NI-DAQmx driver (an ImportError is raised if they are not
+      installed, the simulated data must never be saved as a real experiment)
+    - "simulated": simulated device of ClassStructures.SimulatedDaq, no NI hardware is needed
+The selected backend (BACKEND) is saved in the DAQ files and in the experiment metadata.
+"""
+import os
+
+BACKEND_ENVIRONMENT_VARIABLE = "PYTENG_DAQ_BACKEND"
+
+BACKEND = os.environ.get(BACKEND_ENVIRONMENT_VARIABLE, "").strip().lower() or "nidaqmx"
+if BACKEND not in ("nidaqmx", "simulated"):
+    raise ValueError(f"Unknown {BACKEND_ENVIRONMENT_VARIABLE} '{BACKEND}', use 'nidaqmx' or 'simulated'")
+
+if BACKEND == "nidaqmx":
+    try:
+        from PyDAQmx.DAQmxConstants import (DAQmx_Val_RSE, DAQmx_Val_NRSE, DAQmx_Val_Diff, DAQmx_Val_PseudoDiff,
+                                            DAQmx_Val_Volts, DAQmx_Val_Rising, DAQmx_Val_Falling,
+                                            DAQmx_Val_ContSamps, DAQmx_Val_FiniteSamps,
+                                            DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                            DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines,
+                                            DAQmx_Val_ChanPerLine)
+        from PyDAQmx import Task, DAQmxIsTaskDone, bool32
+
+    # PyDAQmx raises NotImplementedError when the NI-DAQmx library is not found
+    except (ImportError, NotImplementedError, OSError) as e:
+        raise ImportError(f"The NI-DAQmx backend is not available: {e}. "
+                          f"Set {BACKEND_ENVIRONMENT_VARIABLE}=simulated to use the simulated device") from e
+
+else:
+    from ClassStructures.SimulatedDaq import (DAQmx_Val_RSE, DAQmx_Val_NRSE, DAQmx_Val_Diff, DAQmx_Val_PseudoDiff,
+                                              DAQmx_Val_Volts, DAQmx_Val_Rising, DAQmx_Val_Falling,
+                                              DAQmx_Val_ContSamps, DAQmx_Val_FiniteSamps,
+                                              DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                              DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines,
+                                              DAQmx_Val_ChanPerLine)
+    from ClassStructures.SimulatedDaq import Task, DAQmxIsTaskDone, bool32
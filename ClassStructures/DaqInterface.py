@@ -1,10 +1,14 @@
-from PyDAQmx.DAQmxConstants import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
-                                    DAQmx_Val_Rising, DAQmx_Val_ContSamps,
-                                    DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
-                                    DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines, DAQmx_Val_ChanPerLine)
-
-from PyDAQmx import Task, DAQmxIsTaskDone
+from ClassStructures.DaqBackend import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
+                                       DAQmx_Val_Rising, DAQmx_Val_ContSamps,
+                                       DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                       DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines, DAQmx_Val_ChanPerLine)
+
+from ClassStructures.DaqBackend import Task, DAQmxIsTaskDone
+from ClassStructures.CallbackStats import CallbackStats
+from ClassStructures.PlotDecimation import DecimationPyramid
+from ClassStructures.BufferProcessor import conversion_scale, conversion_unit
 import numpy as np
+import time
 from ctypes import byref, c_int32
 
 
@@ -38,6 +42,52 @@ def _get_daq_internal_buffer_size(task_sampling_rate):
         return 1000000
 
 
+class SaveSlotRing:
+    """
+    Pool of N preallocated save slots shared by a DAQ task (producer) and its BufferProcessor (consumer).
+
+    The producer fills the slot at head % N and commits it, the consumer writes it to disk and releases it.
+    Only the producer modifies head and only the consumer modifies tail, so no lock is needed.
+    A hand-off only fails when all the slots are waiting to be saved.
+    """
+    def __init__(self, n_slots, slot_size, number_channels):
+        if n_slots < 2:
+            raise ValueError("At least 2 save slots are required")
+
+        self.N_SLOTS = n_slots
+        self.slots = np.empty((n_slots, slot_size, number_channels), dtype=np.float64)
+        self.head = 0  # Number of committed slots (producer index)
+        self.tail = 0  # Number of released slots (consumer index)
+        self.max_occupancy = 0
+
+    def occupancy(self):
+        """Number of slots committed and not yet saved into disk."""
+        return self.head - self.tail
+
+    def is_full(self):
+        return self.occupancy() >= self.N_SLOTS
+
+    def current_slot(self):
+        """Slot where the producer is writing."""
+        return self.slots[self.head % self.N_SLOTS]
+
+    def commit(self, n_samples):
+        """Hand off the first n_samples of the current slot to the consumer and advance to the next slot."""
+        full_slot = self.slots[self.head % self.N_SLOTS][:n_samples]
+        self.head += 1
+        self.max_occupancy = max(self.max_occupancy, self.occupancy())
+        return full_slot
+
+    def release(self):
+        """Called by the consumer once the oldest committed slot has been saved."""
+        self.tail += 1
+
+    def reset(self):
+        self.head = 0
+        self.tail = 0
+        self.max_occupancy = 0
+
+
 class DAQTaskBase(Task):
     def __init__(self,
                  TASK,
@@ -45,7 +95,8 @@ class DAQTaskBase(Task):
                  DAQ_USB_TRANSFER_FREQUENCY,
                  BUFFER_SAVING_TIME_INTERVAL,
                  TimeWindowLength,
-                 AcquisitionProgramReference):
+                 AcquisitionProgramReference,
+                 SAVE_BUFFER_SLOTS=8):
 
         super().__init__()
 
@@ -59,6 +110,10 @@ class DAQTaskBase(Task):
         for idx, (name, config) in enumerate(TASK["DAQ_CHANNELS"].items()):
             TASK["DAQ_CHANNELS"][name] = [config, idx]
 
+        # Device of the task ("Dev1/ai3" -> "Dev1"), the tasks of the same device can share the sample clock
+        ports = [str(channel[0]["port"]) for channel in self.CHANNELS.values()]
+        self.DEVICE = ports[0].strip("/").split("/")[0] if ports else ""
+
         # Introduce the DAQ Task reference into the TASK definition for later use in the acquisition graph
         TASK["DAQ_TASK_REFERENCE"] = self
 
@@ -94,20 +149,104 @@ class DAQTaskBase(Task):
         self.plot_buffer = np.empty((self.PLOT_BUFFER_SIZE, self.number_channels), dtype=np.float64)
         self.plot_buffer.fill(np.nan)
         self.write_index = 0
+        self.plot_write_count = 0  # Total samples written into the plot buffer (incremental plot decimation)
+
+        # Min/max/mean history of the whole run for the long-history plot views
+        self.pyramid = DecimationPyramid(self.SAMPLE_RATE, self.number_channels, plot_buffer=self.plot_buffer)
 
         # Define the Buffer Processor Save Signal
         self.BUFFER_PROCESSOR = BUFFER_PROCESSOR
         self.processor_signal = BUFFER_PROCESSOR.process_buffer_signal
 
-        # Define the two buffer switching architecture
-        self.buffer1 = np.empty((self.BUFFER_SIZE, self.number_channels), dtype=np.float64)
-        self.buffer2 = np.empty((self.BUFFER_SIZE, self.number_channels), dtype=np.float64)
-        self.current_buffer = self.buffer1
+        # Define the N save slots ring architecture (the consumer releases the slots once saved)
+        self.save_ring = SaveSlotRing(SAVE_BUFFER_SLOTS, self.BUFFER_SIZE, self.number_channels)
+        self.current_buffer = self.save_ring.current_slot()
         self.index = 0
+        BUFFER_PROCESSOR.save_ring = self.save_ring
+
+        # Callback and save statistics, shared with the BufferProcessor
+        self.stats = CallbackStats(self.NAME, self.SAMPLE_RATE, self.SAMPLES_PER_CALLBACK)
+        BUFFER_PROCESSOR.stats = self.stats
+
+        # Start trigger and sample clock shared with the other tasks (DeviceCommunicator.synchronize_tasks) and
+        # index of the first saved sample counted from the start trigger, saved in the file attributes
+        self.samples_acquired = 0
+        self.synchronization = {"start_trigger": self.TRIGGER_SOURCE or "", "sample_clock": "", "start_sample": None}
+        BUFFER_PROCESSOR.synchronization = self.synchronization
 
         # Connect with the main window
         self.mainWindow = AcquisitionProgramReference
 
+    def update_conversion_factors(self):
+        """
+        Scale factor and unit of each channel, used by the plot to show engineering units. The buffers and the
+        files keep the raw values, call it again when the conversion factors are resolved (Keithley range).
+        """
+        configs = sorted(self.CHANNELS.values(), key=lambda channel: channel[-1])
+        self.scale_factors = np.array([conversion_scale(config) for config in configs])
+        self.channel_units = [conversion_unit(config, self.task_type) for config in configs]
+
+    def configure_synchronization(self, start_trigger=None, sample_clock=None):
+        """Start the task with the shared start trigger and/or the sample clock of another task of the device."""
+        self.CfgSampClkTiming(sample_clock or "", self.SAMPLE_RATE, DAQmx_Val_Rising, DAQmx_Val_ContSamps,
+                              self.SAMPLES_PER_CALLBACK)
+        if start_trigger:
+            self.CfgDigEdgeStartTrig(start_trigger, DAQmx_Val_Rising)
+
+        self.synchronization["start_trigger"] = start_trigger or ""
+        self.synchronization["sample_clock"] = sample_clock or ""
+
+    def reset_start_sample(self):
+        """Call it before starting the task, the samples are counted from the start trigger."""
+        self.samples_acquired = 0
+        self.synchronization["start_sample"] = None
+
+    def reset_save_buffers(self):
+        """Restart the save slots ring, only call it when all the committed slots have been saved."""
+        self.save_ring.reset()
+        self.current_buffer = self.save_ring.current_slot()
+        self.index = 0
+
+    def flush_save_buffer(self):
+        """Hand off the partially filled slot to the BufferProcessor (used when the acquisition stops)."""
+        if self.index == 0:
+            return
+        self.processor_signal.emit(self.save_ring.commit(self.index))
+        self.current_buffer = self.save_ring.current_slot()
+        self.index = 0
+
+    def _store_data(self):
+        """Copy the last read block into the plot buffer and the save slots ring."""
+
+        # The blocks read before the recording are discarded, the first saved sample is the offset of the file
+        if self.synchronization["start_sample"] is None:
+            self.synchronization["start_sample"] = self.samples_acquired - self.SAMPLES_PER_CALLBACK
+
+        # Store data in the plot buffer
+        self.plot_buffer[self.write_index:self.write_index + self.SAMPLES_PER_CALLBACK, :] = self.data
+        self.write_index = (self.write_index + self.SAMPLES_PER_CALLBACK) % self.PLOT_BUFFER_SIZE
+        self.plot_write_count += self.SAMPLES_PER_CALLBACK
+        self.pyramid.append(self.data, self.write_index)
+
+        # A new slot can only be written if the BufferProcessor has released it
+        if self.index == 0 and self.save_ring.is_full():
+            if not self.mainWindow.error_flag:
+                self.mainWindow.automatic_mode = False
+                self.mainWindow.error_flag = True
+                self.mainWindow.trigger_acquisition_signal.emit()
+                print(f"\033[91mFatal error, all the {self.save_ring.N_SLOTS} save slots of task {self.NAME} "
+                      f"are waiting to be saved into disk!\033[0m")
+            return
+
+        # Store data in the save buffer
+        self.current_buffer[self.index:self.index + self.SAMPLES_PER_CALLBACK, :] = self.data
+        self.index += self.SAMPLES_PER_CALLBACK
+
+        if self.index >= self.BUFFER_SIZE:
+            self.processor_signal.emit(self.save_ring.commit(self.index))
+            self.current_buffer = self.save_ring.current_slot()
+            self.index = 0
+
 
 class AnalogRead(DAQTaskBase):
     def __init__(self, **kwargs):
@@ -134,40 +273,24 @@ class AnalogRead(DAQTaskBase):
 
         # Set the type of task
         self.task_type = "analog"
+        self.update_conversion_factors()
 
     def EveryNCallback(self):
+        start_time = time.perf_counter()
+        samples_read = c_int32()
         try:
-            samples_read = c_int32()
             self.ReadAnalogF64(self.SAMPLES_PER_CALLBACK, 10.0, DAQmx_Val_GroupByScanNumber, self.data, self.data.size,
                                byref(samples_read), None)
+            self.samples_acquired += samples_read.value
 
             if not self.mainWindow.xRecording[0]:
                 return
 
             if self.mainWindow.moveLinMot[0]:
-
-                # Store data in the plot buffer
-                self.plot_buffer[self.write_index:self.write_index + self.SAMPLES_PER_CALLBACK, :] = self.data
-                self.write_index = (self.write_index + self.SAMPLES_PER_CALLBACK) % self.PLOT_BUFFER_SIZE
-
-                # Store data in the save buffer
-                self.current_buffer[self.index:self.index + self.SAMPLES_PER_CALLBACK, :] = self.data
-                self.index += self.SAMPLES_PER_CALLBACK
-
-                if self.index >= self.BUFFER_SIZE:
-                    if not self.BUFFER_PROCESSOR.isSaving:
-                        full_buffer = self.current_buffer
-                        self.current_buffer = self.buffer1 if self.current_buffer is self.buffer2 else self.buffer2
-                        self.index = 0
-                        self.processor_signal.emit(full_buffer)
-                    else:
-                        if not self.mainWindow.error_flag:
-                            self.mainWindow.automatic_mode = False
-                            self.mainWindow.error_flag = True
-                            self.mainWindow.trigger_acquisition_signal.emit()
-                            print("\033[91mFatal error thread race condition reached when saving into disk!\033[0m")
+                self._store_data()
             else:
                 self.StopTask()
+                self.stats.stop()
 
         except Exception as e:
             if not self.mainWindow.error_flag:
@@ -177,6 +300,10 @@ class AnalogRead(DAQTaskBase):
                 self.mainWindow.trigger_acquisition_signal.emit()
                 print("\033[91mAcquisition has stopped due to a DAQ acquisition error\033[0m")
 
+        finally:
+            self.stats.record_callback(start_time, time.perf_counter() - start_time, samples_read.value,
+                                       self.save_ring.occupancy())
+
         return 0
 
 class DigitalRead(DAQTaskBase):
@@ -220,12 +347,15 @@ class DigitalRead(DAQTaskBase):
 
         # Set the type of task
         self.task_type = "digital"
+        self.update_conversion_factors()
 
     def EveryNCallback(self):
+        start_time = time.perf_counter()
+        samples_read = c_int32()
         try:
-            samples_read = c_int32()
             self.ReadDigitalU32(self.SAMPLES_PER_CALLBACK, 10.0, DAQmx_Val_GroupByScanNumber, self.data, self.data.size,
                                byref(samples_read), None)
+            self.samples_acquired += samples_read.value
 
             if not self.mainWindow.xRecording[0]:
                 return
@@ -235,26 +365,10 @@ class DigitalRead(DAQTaskBase):
                 # Right-Shift correction (assuming 1 line per channel) and doing it in-place
                 self.data >>= self.shifts
 
-                self.plot_buffer[self.write_index:self.write_index + self.SAMPLES_PER_CALLBACK, :] = self.data
-                self.write_index = (self.write_index + self.SAMPLES_PER_CALLBACK) % self.PLOT_BUFFER_SIZE
-
-                self.current_buffer[self.index:self.index + self.SAMPLES_PER_CALLBACK, :] = self.data
-                self.index += self.SAMPLES_PER_CALLBACK
-
-                if self.index >= self.BUFFER_SIZE:
-                    if not self.BUFFER_PROCESSOR.isSaving:
-                        full_buffer = self.current_buffer
-                        self.current_buffer = self.buffer1 if self.current_buffer is self.buffer2 else self.buffer2
-                        self.index = 0
-                        self.processor_signal.emit(full_buffer)
-                    else:
-                        if not self.mainWindow.error_flag:
-                            self.mainWindow.automatic_mode = False
-                            self.mainWindow.error_flag = True
-                            self.mainWindow.trigger_acquisition_signal.emit()
-                            print("\033[91mFatal error thread race condition reached when saving into disk!\033[0m")
+                self._store_data()
             else:
                 self.StopTask()
+                self.stats.stop()
 
         except Exception as e:
             if not self.mainWindow.error_flag:
@@ -264,6 +378,10 @@ class DigitalRead(DAQTaskBase):
                 self.mainWindow.trigger_acquisition_signal.emit()
                 print("\033[91mAcquisition has stopped due to a DAQ acquisition error\033[0m")
 
+        finally:
+            self.stats.record_callback(start_time, time.perf_counter() - start_time, samples_read.value,
+                                       self.save_ring.occupancy())
+
         return 0
 
 # ---------------- DIGITAL IO TASKS ----------------
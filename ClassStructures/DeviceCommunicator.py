@@ -1,11 +1,15 @@
-from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QMetaObject, Qt, Q_ARG
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot, QMetaObject, Qt, Q_ARG
 from PyQt5.QtWidgets import QMessageBox
 from ClassStructures.RaspberryInterface import RaspberryInterface
+from ClassStructures.MotorStreamer import MotorStreamer
 from ClassStructures.KeithleyInterface import KeithleyInterface
 from ClassStructures.DaqInterface import *
-from PyDAQmx import DAQmxIsTaskDone, bool32
+from ClassStructures.DaqBackend import DAQmxIsTaskDone, bool32
 import time
 
+# Maximum time (s) to save the pending save slots when the acquisition stops
+SAVE_SLOTS_TIMEOUT = 30
+
 class DeviceCommunicator(QObject):
 
     start_acquisition_signal = pyqtSignal()
@@ -44,6 +48,17 @@ class DeviceCommunicator(QObject):
         else:
             self.raspberry = None
 
+        # Live motor data: the CodeSys files are tailed during the acquisition in their own thread
+        self.motor_streamer = None
+        if self.raspberry and self.mainWindow.MOTOR_STREAMING:
+            self.motor_streamer = MotorStreamer(raspberry=self.raspberry,
+                                                remote_path=self.rb_remote_path,
+                                                SAMPLE_RATE=self.mainWindow.MOTOR_SAMPLE_RATE,
+                                                TimeWindowLength=self.mainWindow.TimeWindowLength)
+            self.thread_motor_streamer = QThread()
+            self.motor_streamer.moveToThread(self.thread_motor_streamer)
+            self.thread_motor_streamer.start()
+
         # Connect to Keithley if desired:
         if self.mainWindow.use_keithley:
             self.keithley = KeithleyInterface(resource_name=keithley_resource_name)
@@ -113,32 +128,8 @@ class DeviceCommunicator(QObject):
         self.start_acquisition_signal.connect(self.start_acquisition)
         self.stop_acquisition_signal.connect(self.stop_acquisition)
 
-        # DAQ Analog Task
-        self.AcquisitionTasks = []
-        for n, task in enumerate(self.mainWindow.DAQ_TASKS):
-
-            if task["TYPE"] == "analog":
-                self.AcquisitionTasks.append(
-                    AnalogRead(
-                        TASK=task,
-                        BUFFER_PROCESSOR=self.mainWindow.buffer_processors[n],
-                        DAQ_USB_TRANSFER_FREQUENCY=self.mainWindow.DAQ_USB_TRANSFER_FREQUENCY,
-                        BUFFER_SAVING_TIME_INTERVAL=self.mainWindow.BUFFER_SAVING_TIME_INTERVAL,
-                        TimeWindowLength=self.mainWindow.TimeWindowLength,
-                        AcquisitionProgramReference=self.mainWindow)
-                )
-            elif task["TYPE"] == "digital":
-                self.AcquisitionTasks.append(
-                    DigitalRead(
-                        TASK=task,
-                        BUFFER_PROCESSOR=self.mainWindow.buffer_processors[n],
-                        DAQ_USB_TRANSFER_FREQUENCY=self.mainWindow.DAQ_USB_TRANSFER_FREQUENCY,
-                        BUFFER_SAVING_TIME_INTERVAL=self.mainWindow.BUFFER_SAVING_TIME_INTERVAL,
-                        TimeWindowLength=self.mainWindow.TimeWindowLength,
-                        AcquisitionProgramReference=self.mainWindow)
-                )
-            else:
-                raise Exception("Error the task TYPE is not analog neither digital")
+        # DAQ acquisition tasks
+        self.rebuild_acquisition_tasks()
 
         # DAQ Digital task relay control line 0
         if not RelayCodeTask:
@@ -178,7 +169,8 @@ class DeviceCommunicator(QObject):
                         DAQ_USB_TRANSFER_FREQUENCY=self.mainWindow.DAQ_USB_TRANSFER_FREQUENCY,
                         BUFFER_SAVING_TIME_INTERVAL=self.mainWindow.BUFFER_SAVING_TIME_INTERVAL,
                         TimeWindowLength=self.mainWindow.TimeWindowLength,
-                        AcquisitionProgramReference=self.mainWindow)
+                        AcquisitionProgramReference=self.mainWindow,
+                        SAVE_BUFFER_SLOTS=self.mainWindow.SAVE_BUFFER_SLOTS)
                 )
             elif task["TYPE"] == "digital":
                 self.AcquisitionTasks.append(
@@ -188,11 +180,45 @@ class DeviceCommunicator(QObject):
                         DAQ_USB_TRANSFER_FREQUENCY=self.mainWindow.DAQ_USB_TRANSFER_FREQUENCY,
                         BUFFER_SAVING_TIME_INTERVAL=self.mainWindow.BUFFER_SAVING_TIME_INTERVAL,
                         TimeWindowLength=self.mainWindow.TimeWindowLength,
-                        AcquisitionProgramReference=self.mainWindow)
+                        AcquisitionProgramReference=self.mainWindow,
+                        SAVE_BUFFER_SLOTS=self.mainWindow.SAVE_BUFFER_SLOTS)
                 )
             else:
                 raise Exception("Error the task TYPE is not analog neither digital")
 
+        if self.mainWindow.SYNCHRONIZE_TASKS:
+            self.synchronize_tasks()
+
+    def synchronize_tasks(self):
+        """
+        Synchronization layer of the acquisition tasks: all the tasks wait for the start trigger of the profile
+        (the TRIGGER_SOURCE of the first task that defines one, wired to the PFI terminal of each device), and the
+        tasks of a device with an analog task at the same sample rate use its sample clock. Each file records the
+        index of its first saved sample counted from the trigger, so merge_DAQ_data aligns the files by index.
+        Without any TRIGGER_SOURCE the tasks are started by software and only the shared sample clocks are used.
+        """
+        trigger_sources = list(dict.fromkeys(task.TRIGGER_SOURCE for task in self.AcquisitionTasks
+                                             if task.TRIGGER_SOURCE))
+        start_trigger = trigger_sources[0] if trigger_sources else None
+        if len(trigger_sources) > 1:
+            print(f"\033[91mWarning, the DAQ tasks define different trigger sources {trigger_sources}, "
+                  f"all the tasks will be started by {start_trigger}\033[0m")
+
+        # The analog task of each device is the master of the sample clock (only one AI task per device)
+        analog_tasks = {task.DEVICE: task for task in self.AcquisitionTasks if task.task_type == "analog"}
+
+        for task in self.AcquisitionTasks:
+            master = analog_tasks.get(task.DEVICE)
+            sample_clock = None
+            if master is not None and master is not task and master.SAMPLE_RATE == task.SAMPLE_RATE:
+                sample_clock = f"/{task.DEVICE}/ai/SampleClock"
+            task.configure_synchronization(start_trigger=start_trigger, sample_clock=sample_clock)
+
+        if start_trigger:
+            print(f"DAQ tasks synchronized: start trigger {start_trigger}"
+                  + "".join(f", {task.NAME} clocked by {task.synchronization['sample_clock']}"
+                            for task in self.AcquisitionTasks if task.synchronization["sample_clock"]))
+
     @pyqtSlot()
     def start_acquisition(self, iteration=0):
 
@@ -310,13 +336,20 @@ class DeviceCommunicator(QObject):
             else:
                 self.DO_task_RelayCode.set_lines(self.mainWindow.DAQ_CODE)
 
-            # Start Acquisition Tasks
+            # Start Acquisition Tasks, the tasks clocked by another task are started (armed) before it
             self.mainWindow.moveLinMot[0] = True
-            for task in self.AcquisitionTasks:
-                task.index = 0
+            for task in sorted(self.AcquisitionTasks, key=lambda task: not task.synchronization["sample_clock"]):
+                task.reset_save_buffers()
+                task.stats.reset()
+                task.pyramid.reset()
+                task.reset_start_sample()
+                task.update_conversion_factors()
                 task.StartTask()
             self.mainWindow.xRecording[0] = True
 
+            if self.motor_streamer:
+                self.motor_streamer.start_signal.emit(self.mainWindow.local_path[0])
+
             # Do the LinMot trigger
             self.DO_task_LinMotTrigger.set_line(1)
 
@@ -367,6 +400,18 @@ class DeviceCommunicator(QObject):
         # Stop the acquisition
         self.mainWindow.moveLinMot[0] = False
 
+        # A task without any sample never started: its start trigger didn't arrive (not wired to its device), it
+        # would wait for it forever, so it is stopped here instead of in its callback
+        for task in self.AcquisitionTasks:
+            if task.samples_acquired == 0:
+                start_trigger = task.synchronization["start_trigger"]
+                if start_trigger:
+                    reason = f"its start trigger {start_trigger} was never received"
+                else:
+                    reason = "it never started"
+                print(f"\033[91mError, task {task.NAME} didn't acquire any sample, {reason}\033[0m")
+                task.StopTask()
+
         # Wait until all DAQ Tasks have stopped
         print("Waiting DAQ Tasks to stop ...")
         all_stopped = False
@@ -381,25 +426,43 @@ class DeviceCommunicator(QObject):
                     break
         print("All tasks have stopped")
 
+        # The tasks stopped by an error didn't record the end of their acquisition
+        for task in self.AcquisitionTasks:
+            task.stats.stop()
+
+        # Stop the motor streaming, the end of run download only transfers the rows not streamed yet
+        if self.motor_streamer:
+            QMetaObject.invokeMethod(self.motor_streamer, "stop", Qt.ConnectionType.BlockingQueuedConnection)
+            self.motor_streamer.plot_buffer.fill(np.nan)
+
         # Flush plot buffers
         for task in self.AcquisitionTasks:
             task.plot_buffer.fill(np.nan)
         print("All plot buffers have been flushed")
 
-        # Save the DAQ data and download the data from the raspberry if no error
+        # Save the remaining DAQ data (the partial slot is queued after the pending ones to keep the saving order)
         if not self.mainWindow.error_flag:
-
-            # Save the DAQ data
             print("Saving the remaining data ...")
-            for n, task in enumerate(self.AcquisitionTasks):
-                if task.index != 0:
-
-                    data = task.current_buffer[:task.index]
-
-                    # In this case this thread will do the saving
-                    self.mainWindow.buffer_processors[n].save_data(data)
+            for task in self.AcquisitionTasks:
+                task.flush_save_buffer()
+
+        # Wait until all the save slots have been processed by the Buffer Processors, unless their thread has
+        # stopped or the disk doesn't save them in SAVE_SLOTS_TIMEOUT seconds
+        for n, task in enumerate(self.AcquisitionTasks):
+            deadline = time.perf_counter() + SAVE_SLOTS_TIMEOUT
+            while task.save_ring.occupancy() > 0:
+                if not self.mainWindow.thread_savers[n].isRunning() or time.perf_counter() > deadline:
+                    print(f"\033[91mError, {task.save_ring.occupancy()} save slots of task {task.NAME} have not "
+                          f"been saved into disk, the data of this run is incomplete\033[0m")
+                    self.mainWindow.automatic_mode = False
+                    self.mainWindow.error_flag = True
+                    break
+                time.sleep(0.1)
+            print(f"Task {task.NAME}: maximum save slots in use {task.save_ring.max_occupancy}/"
+                  f"{task.save_ring.N_SLOTS}")
 
-                    task.index = 0
+        # Download the data from the raspberry if no error
+        if not self.mainWindow.error_flag:
 
             # Save the Raspberry data
             if self.raspberry:
@@ -0,0 +1,280 @@
+from datetime import datetime
+import hashlib
+import sqlite3
+import json
+import os
+
+# Index of the experiments, saved in RawData next to Experiments.xlsx
+INDEX_FILENAME = "Experiments.sqlite"
+
+# Metadata columns stored in their own indexed columns of the experiments table (lookups by the analysis)
+INDEXED_COLUMNS = {"TribuId": "tribu_id", "RloadId": "rload_id", "Date": "date"}
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Block size used to hash the data files (same hashes as the AnalysisCache)
+HASH_BLOCK_SIZE = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exp_id TEXT UNIQUE,
+    tribu_id TEXT,
+    rload_id TEXT,
+    date TEXT,
+    folder TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiments_tribu_id ON experiments (tribu_id);
+CREATE INDEX IF NOT EXISTS experiments_rload_id ON experiments (rload_id);
+CREATE INDEX IF NOT EXISTS experiments_date ON experiments (date);
+CREATE TABLE IF NOT EXISTS files (
+    exp_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    kind TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    PRIMARY KEY (exp_id, path)
+);
+CREATE TABLE IF NOT EXISTS loads (
+    rload_id TEXT PRIMARY KEY,
+    req REAL,
+    gain REAL,
+    ceq REAL
+);
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _to_text(value):
+    """Dates as DATE_FORMAT strings (sorted and compared as text), the other values as they are."""
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+def file_kind(filename):
+    """Kind of an experiment data file ('daq' or 'motor'), None for the other files (AnalysisCache inputs)."""
+    if (filename.startswith('DAQ-') and filename.endswith('.h5')) or filename.endswith('.pkl'):
+        return "daq"
+    if (filename.startswith('Motor-') and filename.endswith('.h5')) or filename.endswith('.csv'):
+        return "motor"
+    return None
+
+
+def describe_file(file_path, hash_file=True):
+    """Size, modification time and SHA-256 (None if not hash_file) of a data file."""
+    stat = os.stat(file_path)
+    sha256 = None
+    if hash_file:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha256.update(block)
+        sha256 = sha256.hexdigest()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+class ExperimentIndex:
+    """
+    Append-only index of the experiments (SQLite), one row per experiment with the Experiments.xlsx metadata.
+
+    Adding an experiment is a single insert, whatever the number of experiments, and the experiments can be
+    looked up by TribuId, RloadId and date with indexes. Experiments.xlsx is regenerated from the index
+    (MetadataInterface.export_experiments_excel), the 'revision' counter tells if the Excel file is outdated.
+
+    The index is also the catalog of the analysis: the data files of each experiment (path relative to RawData,
+    size, modification time and hash) and the load parameters, joined to the experiments by catalog().
+    """
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.rawdata_folder = os.path.dirname(os.path.abspath(database_path))
+        self.connection = sqlite3.connect(database_path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        # WAL: the index can be read (analysis, Excel export) while a new experiment is written
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ---------------- INFO ----------------
+    def get_info(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return default if row is None else json.loads(row["value"])
+
+    def set_info(self, key, value):
+        with self.connection:
+            self._set_info(key, value)
+
+    def _set_info(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def revision(self):
+        """Number of changes of the index, increased by each add()."""
+        return self.get_info("revision", 0)
+
+    @property
+    def columns(self):
+        """Metadata columns (Experiments.xlsx order) of the last experiment added."""
+        return self.get_info("columns", [])
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM experiments").fetchone()[0]
+
+    # ---------------- WRITE ----------------
+    def add(self, metadata, exp_id=None, folder=None, columns=None):
+        """
+        Add (or replace, same exp_id) one experiment. metadata is the Experiments.xlsx row {column: value},
+        folder the experiment folder relative to RawData and columns the metadata columns in Excel order.
+        """
+        self.add_many([metadata], exp_ids=[exp_id], folders=[folder], columns=columns)
+
+    def add_many(self, rows, exp_ids=None, folders=None, columns=None):
+        """Add several experiments in one transaction (migration of an existing Experiments.xlsx)."""
+        exp_ids = exp_ids or [None] * len(rows)
+        folders = folders or [None] * len(rows)
+        values = []
+        for metadata, exp_id, folder in zip(rows, exp_ids, folders):
+            metadata = {key: _to_text(value) for key, value in metadata.items()}
+            values.append((exp_id, *(metadata.get(column) for column in INDEXED_COLUMNS), folder,
+                           json.dumps(metadata, ensure_ascii=False, default=str)))
+
+        with self.connection:
+            # The finalization step may be repeated after a crash: the row of the same exp_id is replaced
+            self.connection.executemany("INSERT OR REPLACE INTO experiments "
+                                        "(exp_id, tribu_id, rload_id, date, folder, metadata) "
+                                        "VALUES (?, ?, ?, ?, ?, ?)", values)
+            if columns is not None:
+                self._set_info("columns", list(columns))
+            self._set_info("revision", self.revision + 1)
+
+    def set_files(self, exp_id, files):
+        """Replace the data files of an experiment, files is a list of {path (relative to RawData), kind, size,
+        mtime_ns, sha256}. A file without sha256 keeps its cataloged hash if its size and mtime_ns didn't change."""
+        with self.connection:
+            known_hashes = {(row["path"], row["size"], row["mtime_ns"]): row["sha256"] for row in
+                            self.connection.execute("SELECT path, size, mtime_ns, sha256 FROM files "
+                                                    "WHERE exp_id = ? AND sha256 IS NOT NULL", (exp_id,))}
+            self.connection.execute("DELETE FROM files WHERE exp_id = ?", (exp_id,))
+            self.connection.executemany("INSERT INTO files (exp_id, path, kind, size, mtime_ns, sha256) "
+                                        "VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(exp_id, f["path"], f["kind"], f["size"], f["mtime_ns"],
+                                          f["sha256"] or known_hashes.get((f["path"], f["size"], f["mtime_ns"])))
+                                         for f in files])
+
+    def remove(self, exp_ids):
+        """Remove experiments and their data files."""
+        with self.connection:
+            for exp_id in exp_ids:
+                self.connection.execute("DELETE FROM experiments WHERE exp_id = ?", (exp_id,))
+                self.connection.execute("DELETE FROM files WHERE exp_id = ?", (exp_id,))
+            self._set_info("revision", self.revision + 1)
+
+    def add_folder_files(self, exp_id, folder_path, hash_files=True):
+        """Catalog the data files of an experiment folder (called when the files are finalized)."""
+        files = []
+        for filename in sorted(os.listdir(folder_path)):
+            kind = file_kind(filename)
+            if kind is None:
+                continue
+            file_path = os.path.join(folder_path, filename)
+            description = describe_file(file_path, hash_file=hash_files)
+            description.update(path=os.path.relpath(os.path.abspath(file_path), self.rawdata_folder), kind=kind)
+            files.append(description)
+        self.set_files(exp_id, files)
+        return files
+
+    def set_loads(self, loads):
+        """Replace the load parameters, loads is a list of {RloadId, Req, Gain, Ceq} (LoadsDescription rows)."""
+        with self.connection:
+            self.connection.execute("DELETE FROM loads")
+            self.connection.executemany("INSERT OR REPLACE INTO loads (rload_id, req, gain, ceq) VALUES (?, ?, ?, ?)",
+                                        [(load.get("RloadId"), load.get("Req"), load.get("Gain"), load.get("Ceq"))
+                                         for load in loads])
+
+    # ---------------- READ ----------------
+    @staticmethod
+    def _where(TribuId=None, RloadId=None, date_from=None, date_to=None):
+        """WHERE clause and parameters of the experiments filters."""
+        conditions, parameters = [], []
+        for column, value in (("e.tribu_id", TribuId), ("e.rload_id", RloadId)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if date_from is not None:
+            conditions.append("e.date >= ?")
+            parameters.append(_to_text(date_from))
+        if date_to is not None:
+            conditions.append("e.date <= ?")
+            parameters.append(_to_text(date_to))
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", parameters
+
+    def query(self, TribuId=None, RloadId=None, date_from=None, date_to=None):
+        """
+        Experiments in insertion order, filtered by TribuId, RloadId and date (datetime or DATE_FORMAT
+        string, both included). Each experiment is the metadata dictionary with 'ExpId' and 'Folder'.
+        """
+        where, parameters = self._where(TribuId, RloadId, date_from, date_to)
+        sql = f"SELECT e.exp_id, e.folder, e.metadata FROM experiments e{where} ORDER BY e.id"
+
+        experiments = []
+        for row in self.connection.execute(sql, parameters):
+            metadata = json.loads(row["metadata"])
+            metadata["ExpId"] = row["exp_id"]
+            metadata["Folder"] = row["folder"]
+            experiments.append(metadata)
+        return experiments
+
+    def catalog(self, TribuId=None, RloadId=None, date_from=None, date_to=None):
+        """
+        Experiments of query() with their load parameters (Req, Gain, Ceq, None if the load is not in the
+        catalog) and the absolute paths of their first DAQ and motor files (DaqFile, MotorFile, None if missing).
+        """
+        where, parameters = self._where(TribuId, RloadId, date_from, date_to)
+        sql = ("SELECT e.exp_id, e.folder, e.metadata, l.req, l.gain, l.ceq, "
+               "(SELECT MIN(path) FROM files f WHERE f.exp_id = e.exp_id AND f.kind = 'daq') AS daq_file, "
+               "(SELECT MIN(path) FROM files f WHERE f.exp_id = e.exp_id AND f.kind = 'motor') AS motor_file "
+               f"FROM experiments e LEFT JOIN loads l ON l.rload_id = e.rload_id{where} ORDER BY e.id")
+
+        experiments = []
+        for row in self.connection.execute(sql, parameters):
+            metadata = json.loads(row["metadata"])
+            metadata.update(ExpId=row["exp_id"], Folder=row["folder"], Req=row["req"], Gain=row["gain"],
+                            Ceq=row["ceq"])
+            for key, path in (("DaqFile", row["daq_file"]), ("MotorFile", row["motor_file"])):
+                metadata[key] = os.path.join(self.rawdata_folder, path) if path is not None else None
+            experiments.append(metadata)
+        return experiments
+
+    def file_hashes(self, exp_ids):
+        """Cataloged hashes of the files of the experiments: {absolute path: {size, mtime_ns, sha256}}."""
+        hashes = {}
+        for exp_id in exp_ids:
+            for row in self.connection.execute("SELECT path, size, mtime_ns, sha256 FROM files "
+                                               "WHERE exp_id = ? AND sha256 IS NOT NULL", (exp_id,)):
+                path = os.path.normpath(os.path.join(self.rawdata_folder, row["path"]))
+                hashes[path] = {"size": row["size"], "mtime_ns": row["mtime_ns"], "sha256": row["sha256"]}
+        return hashes
+
+    def distinct(self, column):
+        """Distinct values of an indexed metadata column (TribuId, RloadId or Date)."""
+        sql_column = INDEXED_COLUMNS[column]
+        rows = self.connection.execute(f"SELECT DISTINCT {sql_column} FROM experiments "
+                                       f"WHERE {sql_column} IS NOT NULL ORDER BY {sql_column}")
+        return [row[0] for row in rows]
+
+
+def index_path(rawdata_folder):
+    return os.path.join(rawdata_folder, INDEX_FILENAME)
@@ -0,0 +1,299 @@
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QTimer, QEventLoop
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pickle
+import copy
+import os
+
+# Folder (inside RawData) where the pending finalization jobs are journaled until they are completed
+JOURNAL_FOLDER_NAME = ".pending_finalization"
+
+
+def _run_finalization_step(step):
+    """Run one finalization step in a worker process. The imports are done here to keep the workers light."""
+    kind = step["kind"]
+
+    if kind == "convert":
+        from ClassStructures.BufferProcessor import convert_bin_file
+
+        parameters = step["parameters"]
+        bin_path = parameters["bin_path"]
+
+        # The step may be repeated after a crash: if the .bin file was already removed the HDF5 file is complete
+        if not os.path.isfile(bin_path) and os.path.isfile(parameters["h5_path"]):
+            return parameters["h5_path"]
+
+        convert_bin_file(**parameters)
+        os.remove(bin_path)
+        return parameters["h5_path"]
+
+    if kind == "merge_motor":
+        from utils.ImportantFunctions import CSV_merge
+        return CSV_merge(folder_path=step["folder_path"], exp_id=step["exp_id"])
+
+    if kind == "metadata":
+        from ClassStructures.MetadataInterface import MetadataInterface
+
+        metadata_interface = MetadataInterface(METADATA_COLUMNS=step["METADATA_COLUMNS"])
+        error_code = metadata_interface.save_metadata(step["experiment_metadata"], local_path=step["local_path"])
+        if error_code != 0:
+            raise RuntimeError("save_metadata() returned an error, check the worker output")
+        return error_code
+
+    raise ValueError(f"Unknown finalization step '{kind}'")
+
+
+def _export_experiments_excel(rawdata_folder, METADATA_COLUMNS):
+    """Regenerate Experiments.xlsx from the experiment index in a worker process."""
+    from ClassStructures.MetadataInterface import MetadataInterface
+    return MetadataInterface(METADATA_COLUMNS=METADATA_COLUMNS).export_experiments_excel(rawdata_folder)
+
+
+class FinalizationQueue(QObject):
+    """
+    Finalize the acquisitions (bin to HDF5 conversion, motor CSV merge and metadata) in worker processes,
+    so the next acquisition can start while the previous one is being finalized.
+
+    The conversion and merge steps of a job run in parallel in the conversion pool. The metadata step runs
+    when all of them are done, in a single worker pool, so the experiment index rows are written one at a time
+    in the order the jobs are completed (Experiments.xlsx is regenerated from the index with export_excel()). Each job is journaled in RawData/.pending_finalization with the steps
+    already done, the unfinished jobs are resumed with recover() when the program is started again.
+    """
+    job_progress = pyqtSignal(str, int, int)  # exp_id, steps done, total steps
+    job_finished = pyqtSignal(str)  # exp_id
+    job_failed = pyqtSignal(str, str)  # exp_id, error message
+    all_jobs_finished = pyqtSignal()
+
+    # Emitted from the executor threads, delivered in the thread of the FinalizationQueue (queued connection)
+    _step_done_signal = pyqtSignal(str, int, object)
+
+    def __init__(self, journal_folder, MAX_WORKERS=2, MAX_RETRIES=3, RETRY_DELAY=5.0, parent=None):
+        super().__init__(parent)
+
+        self.journal_folder = journal_folder
+        self.MAX_WORKERS = MAX_WORKERS
+        self.MAX_RETRIES = MAX_RETRIES
+        self.RETRY_DELAY = RETRY_DELAY
+
+        # The pools are created when the first job is submitted
+        self.conversion_pool = None
+        self.metadata_pool = None
+
+        # Active jobs: exp_id -> job dictionary
+        self.jobs = {}
+
+        self._step_done_signal.connect(self._on_step_done)
+
+    # ---------------- JOB MANAGEMENT ----------------
+    def has_pending_jobs(self):
+        return bool(self.jobs)
+
+    def submit_job(self, exp_id, local_path, steps):
+        """Journal and start a finalization job. steps is a list of step dictionaries, see _run_finalization_step."""
+        job = {
+            "exp_id": exp_id,
+            "local_path": local_path,
+            "steps": copy.deepcopy(steps),  # The DAQ configuration might change in the next acquisition
+            "done": [False] * len(steps),
+            "attempts": [0] * len(steps),
+        }
+        self._write_journal(job)
+        self._start_job(job)
+
+    def recover(self):
+        """Resume the jobs left unfinished by a previous session. Returns the number of jobs resumed."""
+        if not os.path.isdir(self.journal_folder):
+            return 0
+
+        n_jobs = 0
+        for file in sorted(os.listdir(self.journal_folder)):
+            if not file.endswith(".job"):
+                continue
+            try:
+                with open(os.path.join(self.journal_folder, file), "rb") as f:
+                    job = pickle.load(f)
+            except Exception as e:
+                print(f"\033[91mCould not read the finalization journal {file}: {e} \033[0m")
+                continue
+
+            if job["exp_id"] in self.jobs:
+                continue
+
+            job["attempts"] = [0] * len(job["steps"])
+            print(f"Resuming the finalization of {job['exp_id']} "
+                  f"({sum(job['done'])}/{len(job['steps'])} steps already done)")
+            self._start_job(job)
+            n_jobs += 1
+
+        return n_jobs
+
+    def export_excel(self, rawdata_folder, METADATA_COLUMNS):
+        """
+        Regenerate Experiments.xlsx from the experiment index in the metadata worker, after the metadata steps
+        already submitted. It's not journaled: an outdated Excel file is exported again the next time.
+        """
+        try:
+            future = self._get_pool("metadata").submit(_export_experiments_excel, rawdata_folder, METADATA_COLUMNS)
+        except BrokenProcessPool:
+            self._reset_pool("metadata")
+            return
+
+        def done_callback(f):
+            if f.exception() is not None:
+                print(f"\033[91mCould not export Experiments.xlsx: {f.exception()} \033[0m")
+
+        future.add_done_callback(done_callback)
+
+    def wait_for_jobs(self):
+        """Block (processing the Qt events) until all the active jobs are finished or failed."""
+        if not self.jobs:
+            return
+        loop = QEventLoop()
+        self.all_jobs_finished.connect(loop.quit)
+        loop.exec_()
+        self.all_jobs_finished.disconnect(loop.quit)
+
+    def shutdown(self):
+        for pool in (self.conversion_pool, self.metadata_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self.conversion_pool = None
+        self.metadata_pool = None
+
+    # ---------------- INTERNAL ----------------
+    def _journal_path(self, exp_id):
+        return os.path.join(self.journal_folder, f"{exp_id}.job")
+
+    def _write_journal(self, job):
+        # Write a temporary file and replace the journal, so a crash never leaves a corrupted journal
+        os.makedirs(self.journal_folder, exist_ok=True)
+        path = self._journal_path(job["exp_id"])
+        journal = {key: job[key] for key in ("exp_id", "local_path", "steps", "done")}
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(journal, f)
+        os.replace(path + ".tmp", path)
+
+    def _remove_journal(self, exp_id):
+        path = self._journal_path(exp_id)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def _start_job(self, job):
+        self.jobs[job["exp_id"]] = job
+        job["running"] = set()
+        job["error"] = None
+        self.job_progress.emit(job["exp_id"], sum(job["done"]), len(job["steps"]))
+        self._schedule_steps(job)
+
+    def _schedule_steps(self, job):
+        """Submit the steps that can run now, the metadata step only when all the other steps are done."""
+        if job["error"] is not None:
+            # A step failed after all the retries, wait for the running steps and keep the journal
+            if not job["running"]:
+                self._end_job(job)
+                print(f"\033[91mFinalization of {job['exp_id']} failed, it will be resumed the next time "
+                      f"the program is started. \033[0m")
+                self.job_failed.emit(job["exp_id"], job["error"])
+            return
+
+        pending = [idx for idx, done in enumerate(job["done"]) if not done and idx not in job["running"]]
+        data_pending = [idx for idx, done in enumerate(job["done"])
+                        if not done and job["steps"][idx]["kind"] != "metadata"]
+
+        for idx in pending:
+            if job["steps"][idx]["kind"] == "metadata" and data_pending:
+                continue
+            self._submit_step(job, idx)
+
+        if all(job["done"]):
+            self._remove_journal(job["exp_id"])
+            self._end_job(job)
+            print(f"Finalization of {job['exp_id']} completed.")
+            self.job_finished.emit(job["exp_id"])
+
+    def _end_job(self, job):
+        del self.jobs[job["exp_id"]]
+        if not self.jobs:
+            # Delivered after the job signals of the caller, the queued connections are processed first
+            QTimer.singleShot(0, self._emit_all_jobs_finished)
+
+    def _emit_all_jobs_finished(self):
+        if not self.jobs:
+            self.all_jobs_finished.emit()
+
+    def _get_pool(self, kind):
+        if kind == "metadata":
+            if self.metadata_pool is None:
+                self.metadata_pool = ProcessPoolExecutor(max_workers=1)
+            return self.metadata_pool
+        if self.conversion_pool is None:
+            self.conversion_pool = ProcessPoolExecutor(max_workers=self.MAX_WORKERS)
+        return self.conversion_pool
+
+    def _reset_pool(self, kind):
+        """A worker process died (BrokenProcessPool), the pool can't be used anymore and it's created again."""
+        pool = self.metadata_pool if kind == "metadata" else self.conversion_pool
+        if pool is not None:
+            pool.shutdown(wait=False)
+        if kind == "metadata":
+            self.metadata_pool = None
+        else:
+            self.conversion_pool = None
+
+    def _submit_step(self, job, idx):
+        exp_id = job["exp_id"]
+        step = job["steps"][idx]
+        job["running"].add(idx)
+        job["attempts"][idx] += 1
+
+        try:
+            future = self._get_pool(step["kind"]).submit(_run_finalization_step, step)
+        except BrokenProcessPool as e:
+            self._reset_pool(step["kind"])
+            self._on_step_done(exp_id, idx, e)
+            return
+
+        def done_callback(f, exp_id=exp_id, idx=idx):
+            exception = f.exception()
+            if exception is not None:
+                exception = f"{type(exception).__name__}: {exception}"
+            self._step_done_signal.emit(exp_id, idx, exception)
+
+        future.add_done_callback(done_callback)
+
+    @pyqtSlot(str, int, object)
+    def _on_step_done(self, exp_id, idx, exception):
+        job = self.jobs.get(exp_id)
+        if job is None:
+            return
+        job["running"].discard(idx)
+        step = job["steps"][idx]
+
+        if exception is None:
+            job["done"][idx] = True
+            self._write_journal(job)
+            self.job_progress.emit(exp_id, sum(job["done"]), len(job["steps"]))
+            self._schedule_steps(job)
+            return
+
+        if isinstance(exception, BrokenProcessPool) or "BrokenProcessPool" in str(exception):
+            self._reset_pool(step["kind"])
+
+        print(f"\033[91mFinalization step '{step['kind']}' of {exp_id} failed "
+              f"(attempt {job['attempts'][idx]} of {self.MAX_RETRIES}): {exception} \033[0m")
+
+        if job["attempts"][idx] < self.MAX_RETRIES and job["error"] is None:
+            job["running"].add(idx)  # Not submitted again by other steps until the retry is done
+            QTimer.singleShot(int(self.RETRY_DELAY * 1000), lambda: self._retry_step(exp_id, idx))
+            return
+
+        if job["error"] is None:
+            job["error"] = f"Finalization step '{step['kind']}' failed: {exception}"
+        self._schedule_steps(job)
+
+    def _retry_step(self, exp_id, idx):
+        job = self.jobs.get(exp_id)
+        if job is None:
+            return
+        job["running"].discard(idx)
+        self._submit_step(job, idx)
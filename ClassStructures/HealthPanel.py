@@ -0,0 +1,69 @@
+from PyQt5.QtWidgets import QGroupBox, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+from PyQt5.QtGui import QColor
+
+# Rows of the panel: (label, function of the task and its stats snapshot returning the cell text)
+HEALTH_ROWS = [
+    ("Callbacks", lambda task, s: f"{s['Callbacks']}"),
+    ("Callback mean (ms)", lambda task, s: _format(s["CallbackDurationMean (ms)"])),
+    ("Callback p99 (ms)", lambda task, s: f"≤ {s['CallbackDurationP99 (ms)']}"
+                                          if s["CallbackDurationP99 (ms)"] is not None else "-"),
+    ("Callback max (ms)", lambda task, s: _format(s["CallbackDurationMax (ms)"])),
+    ("Jitter std (ms)", lambda task, s: _format(s["JitterStd (ms)"])),
+    ("Jitter max (ms)", lambda task, s: _format(s["JitterMax (ms)"])),
+    ("Samples read", lambda task, s: f"{s['SamplesRead']} / {s['SamplesExpected']}"),
+    ("Short reads", lambda task, s: f"{s['ShortReads']}"),
+    ("Save queue", lambda task, s: f"{s['SaveQueueDepth']} (max {s['SaveQueueDepthMax']}) / "
+                                   f"{task.save_ring.N_SLOTS}"),
+    ("Save throughput (MB/s)", lambda task, s: _format(s["SaveThroughput (MB/s)"])),
+]
+
+
+def _format(value, decimals=2):
+    return "-" if value is None else f"{value:.{decimals}f}"
+
+
+def _is_warning(label, task, s):
+    """Values that anticipate an overrun: callbacks longer than the callback period, save slots filling up."""
+    if label == "Callback max (ms)":
+        return s["CallbackDurationMax (ms)"] > 1000 * task.stats.expected_interval
+    if label == "Samples read":
+        return s["SamplesMissing"] > 0
+    if label == "Short reads":
+        return s["ShortReads"] > 0
+    if label == "Save queue":
+        return s["SaveQueueDepthMax"] > task.save_ring.N_SLOTS // 2
+    return False
+
+
+class AcquisitionHealthPanel(QGroupBox):
+    """Table with the callback and save statistics of each DAQ task, refreshed by the main window timer."""
+
+    def __init__(self, parent=None):
+        super().__init__("Acquisition Health", parent)
+
+        self.table = QTableWidget(len(HEALTH_ROWS), 0)
+        self.table.setVerticalHeaderLabels([label for label, _ in HEALTH_ROWS])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionMode(QAbstractItemView.NoSelection)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(12, 18, 12, 12)
+        layout.addWidget(self.table)
+        self.setMinimumWidth(300)
+
+    def update_health(self, tasks):
+        if self.table.columnCount() != len(tasks):
+            self.table.setColumnCount(len(tasks))
+        self.table.setHorizontalHeaderLabels([task.NAME for task in tasks])
+
+        for column, task in enumerate(tasks):
+            snapshot = task.stats.snapshot()
+            for row, (label, cell_text) in enumerate(HEALTH_ROWS):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(row, column, item)
+                item.setText(cell_text(task, snapshot))
+                item.setForeground(QColor("#dc2626") if _is_warning(label, task, snapshot) else QColor("#1f2937"))
@@ -5,21 +5,23 @@ import json
 from datetime import datetime
 
 from PyQt5.QtWidgets import (QPushButton, QVBoxLayout, QDialog,
-                             QLabel, QSpinBox, QHBoxLayout, QFileDialog, QGroupBox, QMessageBox, QDesktopWidget)
+                             QLabel, QSpinBox, QHBoxLayout, QFileDialog, QGroupBox, QMessageBox, QDesktopWidget,
+                             QComboBox)
 from PyQt5.QtCore import Qt, pyqtSignal, QThread, QTimer, QElapsedTimer, pyqtSlot
 
 from ClassStructures.BufferProcessor import BufferProcessor
 from ClassStructures.DeviceCommunicator import DeviceCommunicator
-from ClassStructures.AcquisitionGraph import ChannelSelectorComboBox, AcquisitionGraph
+from ClassStructures.AcquisitionGraph import ChannelSelectorComboBox, AcquisitionGraph, HISTORY_VIEWS
 from ClassStructures.ExpConfigWindow import ExpConfigWindow
 from ClassStructures.DAQProfilesWindow import DAQProfilesWindow
 from ClassStructures.MetadataInterface import MetadataInterface
-from utils.ImportantFunctions import CSV_merge
+from ClassStructures.FinalizationQueue import FinalizationQueue, JOURNAL_FOLDER_NAME
+from ClassStructures.HealthPanel import AcquisitionHealthPanel
 
-from PyDAQmx.DAQmxConstants import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
-                                    DAQmx_Val_Rising, DAQmx_Val_ContSamps,
-                                    DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
-                                    DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
+from ClassStructures.DaqBackend import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
+                                       DAQmx_Val_Rising, DAQmx_Val_ContSamps,
+                                       DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                       DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
 
 def _default_daq_task(task_type="analog"):
     return {
@@ -74,8 +76,16 @@ class AcquisitionProgram(QDialog):
                  measure_time=30,
                  DAQ_USB_TRANSFER_FREQUENCY=60,  # USB transfers per second (Hz)
                  BUFFER_SAVING_TIME_INTERVAL=2.5,  # Save buffer to disk every X seconds
+                 SAVE_BUFFER_SLOTS=8,  # Number of buffers that can be waiting to be saved into disk
+                 STORAGE_FORMAT="hdf5",  # "hdf5" (written incrementally) or "bin" (converted at the end of the run)
+                 EXPORT_EXCEL=False,  # Also export the "bin" DAQ files to Excel at the end of the run
+                 FINALIZATION_WORKERS=2,  # Worker processes that finalize the runs while the next one is acquiring
+                 SYNCHRONIZE_TASKS=True,  # All the DAQ tasks share the start trigger of the profile (sample aligned)
                  TimeWindowLength=3,  # Time window length for the plot (seconds)
                  ScreenRefreshFrequency=60,  # Screen Refresh Rate (Hz)
+                 HealthRefreshInterval=500,  # Refresh interval of the acquisition health panel (ms)
+                 MOTOR_STREAMING=True,  # Stream the LinMot data of the Raspberry during the acquisition (live plot)
+                 MOTOR_SAMPLE_RATE=1000,  # Rows per second of the CodeSys motor log (time axis of the live plot)
                  parent=None,
                  RelayCodeTask=None,
                  LinMotTriggerTask=None,
@@ -132,6 +142,11 @@ class AcquisitionProgram(QDialog):
         # DAQ acquisition parameters
         self.DAQ_USB_TRANSFER_FREQUENCY = DAQ_USB_TRANSFER_FREQUENCY
         self.BUFFER_SAVING_TIME_INTERVAL = BUFFER_SAVING_TIME_INTERVAL
+        self.SAVE_BUFFER_SLOTS = SAVE_BUFFER_SLOTS
+        self.STORAGE_FORMAT = STORAGE_FORMAT
+        self.EXPORT_EXCEL = EXPORT_EXCEL
+        self.FINALIZATION_WORKERS = FINALIZATION_WORKERS
+        self.SYNCHRONIZE_TASKS = SYNCHRONIZE_TASKS
         self.ACQUISITION_PARAMS = {}
         self.METADATA_COLUMNS = METADATA_COLUMNS
         self.measure_time = measure_time
@@ -145,6 +160,10 @@ class AcquisitionProgram(QDialog):
         self.TimeWindowLength = TimeWindowLength
         self.refresh_rate = int((1 / ScreenRefreshFrequency * 1000))  # Convert to milliseconds for QTimer
 
+        # Motor streaming parameters
+        self.MOTOR_STREAMING = MOTOR_STREAMING
+        self.MOTOR_SAMPLE_RATE = MOTOR_SAMPLE_RATE
+
         self.DAQ_TASKS = copy.deepcopy(self.daq_profiles[self.active_daq_profile_name])
         self.DAQ_TASKS_METADATA = copy.deepcopy(self.DAQ_TASKS)
 
@@ -259,6 +278,10 @@ class AcquisitionProgram(QDialog):
         self.timer_spinbox_seconds.setValue(_s)
         self.countdown_display = QLabel("Remaining time: -")
         self.countdown_display.setAlignment(Qt.AlignmentFlag.AlignRight)
+        self.finalization_label = QLabel("Finalization: idle")
+        self.finalization_label.setObjectName("SectionHint")
+        self.finalization_label.setAlignment(Qt.AlignmentFlag.AlignRight)
+        self.finalization_progress = {}
         self.duration = QHBoxLayout()
         self.duration.addWidget(self.timer_label)
         self.duration.addWidget(self.timer_spinbox_days)
@@ -277,7 +300,8 @@ class AcquisitionProgram(QDialog):
         self.buffer_processors = []
         self.thread_savers = []
         for n, task in enumerate(self.DAQ_TASKS):
-            self.buffer_processors.append(BufferProcessor(TASK=task, mainWindowReference=self))
+            self.buffer_processors.append(BufferProcessor(TASK=task, mainWindowReference=self,
+                                                         STORAGE_FORMAT=self.STORAGE_FORMAT))
             self.thread_savers.append(QThread())
             self.buffer_processors[n].moveToThread(self.thread_savers[n])
             self.thread_savers[n].start()
@@ -300,6 +324,15 @@ class AcquisitionProgram(QDialog):
         # Metadata Interface
         self.MetadataInterface = MetadataInterface(mainWindowReference=self)
 
+        # Finalization of the finished runs (conversion, motor merge and metadata) in worker processes
+        self.finalization_queue = FinalizationQueue(
+            journal_folder=os.path.join(self.exp_dir, "RawData", JOURNAL_FOLDER_NAME),
+            MAX_WORKERS=self.FINALIZATION_WORKERS)
+        self.finalization_queue.job_progress.connect(self.update_finalization_progress)
+        self.finalization_queue.job_finished.connect(self.finalization_finished)
+        self.finalization_queue.job_failed.connect(self.finalization_failed)
+        self.finalization_queue.all_jobs_finished.connect(self.export_experiments_excel)
+
         # Signal management
         self.trigger_acquisition_signal.connect(self.trigger_acquisition)
         self.start_acquisition_return_signal.connect(self.start_acquisition_return)
@@ -310,7 +343,20 @@ class AcquisitionProgram(QDialog):
         self.plot_widget = AcquisitionGraph(self.TimeWindowLength)
 
         # Signal Selector
-        self.signal_selector = ChannelSelectorComboBox(self.DAQ_TASKS, AcquisitionGraphReference=self.plot_widget)
+        self.signal_selector = ChannelSelectorComboBox(self._plot_tasks(), AcquisitionGraphReference=self.plot_widget)
+
+        # Plot layout of the selected channels
+        self.plot_layout_selector = QComboBox()
+        self.plot_layout_selector.addItems(["Overlaid", "Stacked"])
+        self.plot_layout_selector.setToolTip("Display the selected channels in one plot or in one plot per channel")
+        self.plot_layout_selector.currentTextChanged.connect(self.plot_widget.set_layout_mode)
+
+        # Plot time range: live window or the history of the run (decimation pyramid)
+        self.plot_view_selector = QComboBox()
+        self.plot_view_selector.addItems(["Live", *HISTORY_VIEWS])
+        self.plot_view_selector.setToolTip("Time range of the plot, zoom with the mouse in the history views "
+                                           "and select the view again to follow the acquisition")
+        self.plot_view_selector.activated[str].connect(self.plot_widget.set_view_mode)
 
         # Button to open Experiment Configuration Editor
         self.ExpConfigWindow = ExpConfigWindow(METADATA_COLUMNS=self.METADATA_COLUMNS, parent=self)
@@ -326,16 +372,24 @@ class AcquisitionProgram(QDialog):
         self.daq_profile_label = QLabel(f"Active DAQ profile: {self.active_daq_profile_name}")
         self.daq_profile_label.setObjectName("ProfileLabel")
 
-        # Plot update timer
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.plot_widget.update_plot)
-        self.timer.start(self.refresh_rate)
+        # Plot update: the frames are prepared in the plot worker thread and drawn when ready
+        self.plot_widget.start_plot_worker(self.refresh_rate)
+
+        # Acquisition health panel (callback and save statistics of each DAQ task)
+        self.health_panel = AcquisitionHealthPanel()
+        self.health_timer = QTimer()
+        self.health_timer.timeout.connect(self.update_health_panel)
+        self.health_timer.start(HealthRefreshInterval)
 
         channel_box = QGroupBox("Channel Selection")
         channel_layout = QVBoxLayout(channel_box)
         channel_layout.setContentsMargins(12, 18, 12, 12)
         channel_layout.setSpacing(6)
-        channel_layout.addWidget(self.signal_selector)
+        channel_row = QHBoxLayout()
+        channel_row.addWidget(self.signal_selector, 1)
+        channel_row.addWidget(self.plot_layout_selector)
+        channel_row.addWidget(self.plot_view_selector)
+        channel_layout.addLayout(channel_row)
 
         settings_box = QGroupBox("Experiment Setup")
         settings_layout = QVBoxLayout(settings_box)
@@ -358,6 +412,7 @@ class AcquisitionProgram(QDialog):
         acquisition_right = QVBoxLayout()
         acquisition_right.addWidget(self.countdown_display)
         acquisition_right.addLayout(self.duration)
+        acquisition_right.addWidget(self.finalization_label)
         acquisition_right.addStretch(1)
         acquisition_layout.addLayout(acquisition_left)
         acquisition_layout.addLayout(acquisition_right)
@@ -368,14 +423,23 @@ class AcquisitionProgram(QDialog):
         plot_layout.setContentsMargins(12, 18, 12, 12)
         plot_layout.addWidget(self.plot_widget)
 
+        plot_row = QHBoxLayout()
+        plot_row.addWidget(plot_box, 1)
+        plot_row.addWidget(self.health_panel)
+
         # Add widgets to the layout (sorted from top to bottom)
         self.layout.addWidget(channel_box)
         self.layout.addWidget(settings_box)
         self.layout.addWidget(acquisition_box)
-        self.layout.addWidget(plot_box)
+        self.layout.addLayout(plot_row)
 
         self.plot_widget.update_DAQ_Plot_Buffer()
 
+        # Resume the finalization of the runs interrupted by a previous crash, Experiments.xlsx is exported
+        # when they are finished (or now, if it is outdated)
+        if not self.finalization_queue.recover():
+            self.export_experiments_excel()
+
         if self.automatic_mode:
             print("Starting acquisition in automatic mode.")
             self.trigger_acquisition()
@@ -445,8 +509,14 @@ class AcquisitionProgram(QDialog):
         self.buffer_processors.clear()
         self.thread_savers.clear()
 
+    def _plot_tasks(self):
+        """DAQ tasks and streamed motor channels that can be selected in the plot."""
+        if self.dev_communicator.motor_streamer:
+            return self.DAQ_TASKS + [self.dev_communicator.motor_streamer.selector_task()]
+        return self.DAQ_TASKS
+
     def _refresh_signal_selector(self, preferred_label=None):
-        self.signal_selector.rebuild_signal_selector(self.DAQ_TASKS)
+        self.signal_selector.rebuild_signal_selector(self._plot_tasks())
         self.plot_widget.update_DAQ_Plot_Buffer()
 
     def apply_daq_profile(self, profile_name):
@@ -466,7 +536,7 @@ class AcquisitionProgram(QDialog):
             self.thread_savers = []
 
             for task in self.DAQ_TASKS:
-                processor = BufferProcessor(TASK=task, mainWindowReference=self)
+                processor = BufferProcessor(TASK=task, mainWindowReference=self, STORAGE_FORMAT=self.STORAGE_FORMAT)
                 self.buffer_processors.append(processor)
                 thread = QThread()
                 self.thread_savers.append(thread)
@@ -584,43 +654,35 @@ class AcquisitionProgram(QDialog):
         for processor in self.buffer_processors:
             processor.close_file()
 
-        metadata_error_code = 0
         if not self.error_flag:
             if self.should_save_data:
 
-                # Convert the DAQ binary files to pandas dataframes
+                # The metadata is read from the GUI now, the next run might change the parameters
+                experiment_metadata = self.MetadataInterface.build_experiment_metadata()
+
+                # Convert the DAQ binary files to HDF5 (nothing to convert for HDF5 files)
+                steps = []
                 for processor in self.buffer_processors:
-                    processor.Save_Data()
+                    parameters = processor.conversion_parameters(export_excel=self.EXPORT_EXCEL)
+                    if parameters is not None:
+                        steps.append({"kind": "convert", "parameters": parameters})
 
                 # Merge the LinMot CSV files
                 if self.dev_communicator.raspberry:
-                    self.motor_file = CSV_merge(folder_path=self.local_path[0], exp_id=self.exp_id)
-                else:
-                    self.motor_file = ""
+                    steps.append({"kind": "merge_motor", "folder_path": self.local_path[0], "exp_id": self.exp_id})
 
-                # Save the metadata
-                experiment_metadata = self.MetadataInterface.build_experiment_metadata()
+                # Save the metadata once the data files are finalized
+                steps.append({"kind": "metadata",
+                              "experiment_metadata": experiment_metadata,
+                              "METADATA_COLUMNS": self.METADATA_COLUMNS,
+                              "local_path": self.local_path[0]})
 
-                while True:
-                    metadata_error_code = self.MetadataInterface.save_metadata(experiment_metadata)
-
-                    if metadata_error_code == 0:
-                        print("Experiment ended succesfully!")
-                        break
-                    else:
-                        retry = QMessageBox.critical(
-                            self,
-                            "Metadata Saving Error",
-                            "An error occurred while saving the metadata, check the Python Console for more details.\n\n"
-                            "Do you want to retry?",
-                            QMessageBox.Retry | QMessageBox.Abort,
-                            QMessageBox.Retry
-                        )
-                        if retry == QMessageBox.Abort:
-                            print("User aborted metadata saving after an error.")
-                            break
+                # The conversion runs in the background, the temporary files are removed by the finalization job
+                self.finalization_queue.submit_job(self.exp_id, self.local_path[0], steps)
+                print(f"Experiment {self.exp_id} ended, finalizing the files in the background.")
             else:
                 print("Experiment interrupted.")
+                shutil.rmtree(self.local_path[0])
 
             if not self.automatic_mode:
                 self.update_button()
@@ -628,11 +690,6 @@ class AcquisitionProgram(QDialog):
             self.update_button()
             print("Experiment interrupted due to an error.")
 
-        # If no error and user has not aborted the measure, delete only temporal files
-        if not self.error_flag and self.should_save_data:
-            for processor in self.buffer_processors:
-                processor.remove_file()
-        else:
             # Delete all files
             shutil.rmtree(self.local_path[0])
 
@@ -648,6 +705,42 @@ class AcquisitionProgram(QDialog):
                 print("All iterations finished, exiting.")
                 self.close()
 
+    @pyqtSlot(str, int, int)
+    def update_finalization_progress(self, exp_id, steps_done, total_steps):
+        self.finalization_progress[exp_id] = (steps_done, total_steps)
+        self._update_finalization_label()
+
+    @pyqtSlot(str)
+    def finalization_finished(self, exp_id):
+        self.finalization_progress.pop(exp_id, None)
+        print("Experiment ended succesfully!")
+        self._update_finalization_label()
+
+    @pyqtSlot()
+    def export_experiments_excel(self):
+        """Regenerate Experiments.xlsx from the experiment index in the background (only if it is outdated)."""
+        self.finalization_queue.export_excel(os.path.join(self.exp_dir, "RawData"), self.METADATA_COLUMNS)
+
+    @pyqtSlot(str, str)
+    def finalization_failed(self, exp_id, error):
+        self.finalization_progress.pop(exp_id, None)
+        self._update_finalization_label()
+        QMessageBox.critical(self, "Finalization Error",
+                             f"The files of the experiment {exp_id} could not be finalized, "
+                             f"check the Python Console for more details.\n\n"
+                             f"The raw files are kept and the finalization will be retried "
+                             f"the next time the program is started.")
+
+    def _update_finalization_label(self):
+        if not self.finalization_progress:
+            self.finalization_label.setText("Finalization: idle")
+            return
+        jobs = [f"{exp_id} ({done}/{total})" for exp_id, (done, total) in self.finalization_progress.items()]
+        self.finalization_label.setText("Finalizing: " + ", ".join(jobs))
+
+    def update_health_panel(self):
+        self.health_panel.update_health(self.dev_communicator.AcquisitionTasks)
+
     def update_button(self):
         self.acquisition_button.setText("STOP LinMot" if self.moveLinMot[0] else "START LinMot")
 
@@ -793,7 +886,15 @@ class AcquisitionProgram(QDialog):
 
         print("\nClosing DAQ Viewer")
 
+        self.plot_widget.stop_plot_worker()
+
         if not self.xClose:
+            # Wait until the finished runs are saved, the failed jobs are resumed in the next session
+            if self.finalization_queue.has_pending_jobs():
+                print("Waiting for the finalization of the previous experiments ...")
+                self.finalization_queue.wait_for_jobs()
+            self.finalization_queue.shutdown()
+
             # Disconnect from Keithley if connected
             if self.dev_communicator.keithley is not None:
                 try:
@@ -827,7 +928,12 @@ class AcquisitionProgram(QDialog):
             self.dev_communicator.DI_task_Raspberry_status_1.StopTask()
             self.dev_communicator.DI_task_Raspberry_status_1.ClearTask()
 
-            # Disconnect from Raspberry if connected
+            # Stop the motor streaming thread and disconnect from Raspberry if connected
+            if self.dev_communicator.motor_streamer:
+                self.dev_communicator.thread_motor_streamer.quit()
+                self.dev_communicator.thread_motor_streamer.wait()
+                self.dev_communicator.motor_streamer.close()
+
             if self.dev_communicator.raspberry:
                 self.dev_communicator.raspberry.disconnect()
 
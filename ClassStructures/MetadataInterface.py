@@ -4,16 +4,26 @@ from datetime import datetime
 import json
 import os
 
-from PyDAQmx.DAQmxConstants import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
-                                    DAQmx_Val_Rising, DAQmx_Val_ContSamps,
-                                    DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
-                                    DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
+from ClassStructures.ExperimentIndex import ExperimentIndex, index_path, DATE_FORMAT
+
+from ClassStructures.DaqBackend import (BACKEND, DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
+                                       DAQmx_Val_Rising, DAQmx_Val_ContSamps,
+                                       DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                       DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
 
 class MetadataInterface:
     DATE_EXCEL_FORMAT = "yyyy-mm-dd hh:mm:ss"
 
-    def __init__(self, mainWindowReference):
+    def __init__(self, mainWindowReference=None, METADATA_COLUMNS=None):
+        # Without a main window reference (finalization worker process) only save_metadata() can be used
         self.mainWindow = mainWindowReference
+        self._METADATA_COLUMNS = METADATA_COLUMNS
+
+    @property
+    def METADATA_COLUMNS(self):
+        if self._METADATA_COLUMNS is not None:
+            return self._METADATA_COLUMNS
+        return self.mainWindow.METADATA_COLUMNS
 
     def _normalize_port_config(self, value):
         """Convert DAQmx port config constants to their symbolic names for JSON output."""
@@ -48,7 +58,7 @@ class MetadataInterface:
         excel_metadata = {}
 
         # Generate the Excel metadata dictionary
-        for col in self.mainWindow.METADATA_COLUMNS.keys():
+        for col in self.METADATA_COLUMNS.keys():
             if col == 'Date':
                 excel_metadata[col] = date_value  # always auto-generated, must be the third column
                 continue
@@ -62,9 +72,11 @@ class MetadataInterface:
         json_metadata = {
             "ExperimentId": self.mainWindow.exp_id,
             "DAQProfile": self.mainWindow.active_daq_profile_name,
+            "DAQBackend": BACKEND,
             "RaspberryConnected": True if self.mainWindow.dev_communicator.raspberry else False,
             "KeithleyConnected": True if self.mainWindow.dev_communicator.keithley else False,
             "DAQTasks": self._normalize_daq_tasks_for_json(self.mainWindow.DAQ_TASKS_METADATA),
+            "AcquisitionHealth": [task.stats.snapshot() for task in self.mainWindow.dev_communicator.AcquisitionTasks],
         }
 
         return {
@@ -85,7 +97,7 @@ class MetadataInterface:
         header_font = Font(bold=True, color="FFFFFF")
         header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
 
-        for col_idx, header in enumerate(list(self.mainWindow.METADATA_COLUMNS.keys()), start=1):
+        for col_idx, header in enumerate(list(self.METADATA_COLUMNS.keys()), start=1):
             col_letter = get_column_letter(col_idx)
             # Set width based on header length, with a minimum of 15 and maximum of 50
             width = max(15, min(len(header) + 3, 50))
@@ -114,7 +126,7 @@ class MetadataInterface:
     def _apply_date_format(self, ws):
         """Apply a human-readable date-time format to the Date column in Excel."""
         try:
-            date_col_idx = list(self.mainWindow.METADATA_COLUMNS.keys()).index("Date") + 1
+            date_col_idx = list(self.METADATA_COLUMNS.keys()).index("Date") + 1
         except ValueError:
             return
 
@@ -123,55 +135,71 @@ class MetadataInterface:
             if cell.value is not None:
                 cell.number_format = self.DATE_EXCEL_FORMAT
 
-    def _ensure_experiment_workbook(self, file_path):
-        """Create or normalize the workbook so it contains exactly the metadata columns."""
-        if not os.path.isfile(file_path):
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "MetadataSheet"
-            for col_idx, header in enumerate(list(self.mainWindow.METADATA_COLUMNS.keys()), start=1):
-                ws.cell(row=1, column=col_idx, value=header)
-            # Set column widths and apply center alignment
-            self._set_column_widths(ws)
-            self._apply_center_alignment(ws)
-            self._apply_date_format(ws)
-            wb.save(file_path)
-            return
-
-        wb = load_workbook(file_path)
+    def _migrate_experiments_excel(self, index, file_path):
+        """Import the rows of an Experiments.xlsx written before the experiment index existed."""
+        wb = load_workbook(file_path, read_only=True)
         ws = wb.active
-        existing_headers = [ws.cell(row=1, column=col).value for col in range(1, ws.max_column + 1)]
-        existing_headers = [str(h).strip() for h in existing_headers if h not in (None, "")]
+        rows = ws.iter_rows(values_only=True)
+        headers = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+        experiments = [dict(zip(headers, row)) for row in rows if any(value not in (None, "") for value in row)]
+        wb.close()
+
+        index.add_many(experiments, columns=[h for h in headers if h])
+        # The Excel file already contains these rows, it's only regenerated when its columns are outdated
+        if headers == list(self.METADATA_COLUMNS.keys()):
+            index.set_info("excel_revision", index.revision)
+        print(f"{len(experiments)} experiments of {file_path} imported into the experiment index")
+
+    def export_experiments_excel(self, folder_path, base_filename="Experiments", force=False):
+        """Regenerate RawData/Experiments.xlsx from the experiment index (only if it is outdated, unless force)."""
+        file_path = os.path.join(folder_path, f"{base_filename}.xlsx")
+        database_path = index_path(folder_path)
+        if not os.path.isfile(database_path):
+            return 0
 
-        if existing_headers == list(self.mainWindow.METADATA_COLUMNS.keys()):
-            return
+        try:
+            with ExperimentIndex(database_path) as index:
+                revision = index.revision
+                if not force and os.path.isfile(file_path) and index.get_info("excel_revision") == revision:
+                    return 0
+
+                headers = list(self.METADATA_COLUMNS.keys())
+                wb = Workbook()
+                ws = wb.active
+                ws.title = "MetadataSheet"
+                ws.append(headers)
+                for experiment in index.query():
+                    if isinstance(experiment.get("Date"), str):
+                        try:
+                            experiment["Date"] = datetime.strptime(experiment["Date"], DATE_FORMAT)
+                        except ValueError:
+                            pass
+                    ws.append([self._normalize_cell_value(experiment.get(header)) for header in headers])
+
+                # Set column widths and apply center alignment
+                self._set_column_widths(ws)
+                self._apply_center_alignment(ws)
+                self._apply_date_format(ws)
+
+                # Written to a temporary file first, the previous file is kept if the save fails (file open in Excel)
+                temporary_path = os.path.join(folder_path, f".{base_filename}.tmp.xlsx")
+                wb.save(temporary_path)
+                os.replace(temporary_path, file_path)
+
+                index.set_info("excel_revision", revision)
 
-        # Rebuild the workbook to enforce the exact ODS schema.
-        rows = []
-        header_map = {header: idx + 1 for idx, header in enumerate(existing_headers)}
-        for row_idx in range(2, ws.max_row + 1):
-            row_data = {}
-            for header in existing_headers:
-                col_idx = header_map[header]
-                row_data[header] = ws.cell(row=row_idx, column=col_idx).value
-            rows.append(row_data)
-
-        new_wb = Workbook()
-        new_ws = new_wb.active
-        new_ws.title = "MetadataSheet"
-        for col_idx, header in enumerate(list(self.mainWindow.METADATA_COLUMNS.keys()), start=1):
-            new_ws.cell(row=1, column=col_idx, value=header)
-        for row_idx, row_data in enumerate(rows, start=2):
-            for col_idx, header in enumerate(self.mainWindow.METADATA_COLUMNS, start=1):
-                new_ws.cell(row=row_idx, column=col_idx, value=row_data.get(header, ""))
-        # Set column widths and apply center alignment
-        self._set_column_widths(new_ws)
-        self._apply_center_alignment(new_ws)
-        self._apply_date_format(new_ws)
-        new_wb.save(file_path)
-
-    def save_metadata(self, experiment_data, base_filename="Experiments"):
-        """Create/update Experiments.xlsx schema and append one row from input dictionary, and creates a JSON File"""
+        except Exception as e:
+            print(f"\033[91mCould not export the experiment index to {file_path}: {e} \033[0m")
+            return 1
+
+        print(f"Experiments index exported to {file_path}")
+        return 0
+
+    def save_metadata(self, experiment_data, base_filename="Experiments", local_path=None, exp_id=None):
+        """Add the experiment row and its data files to the experiment index (RawData/Experiments.sqlite) and
+        create a JSON File.
+        Experiments.xlsx is regenerated from the index with export_experiments_excel().
+        local_path is the experiment folder, by default the one of the current acquisition"""
         if not isinstance(experiment_data, dict) or not experiment_data:
             print(f"\033[91mCould not save experiment row: experiment_data must be a non-empty dictionary. \033[0m")
             return 1
@@ -184,16 +212,18 @@ class MetadataInterface:
                 f"\033[91mCould not save experiment row: experiment_data must contain 'excel_metadata' and 'json_metadata' dictionaries. \033[0m")
             return 1
 
-        # Excel file is saved in RawData root: RawData/Experiments.xlsx
+        # Index and Excel files are saved in RawData root: RawData/Experiments.sqlite and RawData/Experiments.xlsx
         # local_path[0] = RawData/{TribuId}/{date}-{RloadId}/{self.SampleIdTriboNeg}-{self.SampleIdTriboPos}/, so we go up 3 levels to get to RawData/
-        folder_path = os.path.dirname(os.path.dirname(os.path.dirname(self.mainWindow.local_path[0])))
+        if local_path is None:
+            local_path = self.mainWindow.local_path[0]
+        folder_path = os.path.dirname(os.path.dirname(os.path.dirname(local_path)))
         if not folder_path:
             print(f"\033[91mCould not save experiment row: invalid experiment folder path. \033[0m")
             return 1
 
         os.makedirs(folder_path, exist_ok=True)
         file_path = os.path.join(folder_path, f"{base_filename}.xlsx")
-        json_path = os.path.join(self.mainWindow.local_path[0], "experiment_metadata.json")
+        json_path = os.path.join(local_path, "experiment_metadata.json")
 
         try:
             # Save JSON File
@@ -204,32 +234,28 @@ class MetadataInterface:
             return 1
 
         try:
-            # Save Excel row
-            self._ensure_experiment_workbook(file_path)
-            wb = load_workbook(file_path)
-            ws = wb.active
-
-            header_to_col = {header: idx + 1 for idx, header in enumerate(self.mainWindow.METADATA_COLUMNS)}
-            write_row = ws.max_row + 1
-
-            sheet_row = {}
-            for header in list(self.mainWindow.METADATA_COLUMNS.keys()):
-                val = excel_metadata.get(header)
-                sheet_row[header] = self._normalize_cell_value(val)
-
-            for header, value in sheet_row.items():
-                ws.cell(row=write_row, column=header_to_col[header], value=value)
-
-            # Set column widths and apply center alignment
-            self._set_column_widths(ws)
-            self._apply_center_alignment(ws)
-            self._apply_date_format(ws)
-
-            # Save Excel File
-            wb.save(file_path)
+            # Add the experiment row to the index, the rows of an older Experiments.xlsx are imported first
+            with ExperimentIndex(index_path(folder_path)) as index:
+                if index.revision == 0 and os.path.isfile(file_path):
+                    self._migrate_experiments_excel(index, file_path)
+
+                exp_id = exp_id or json_metadata.get("ExperimentId")
+                sheet_row = {header: self._normalize_cell_value(excel_metadata.get(header))
+                             for header in self.METADATA_COLUMNS}
+                # The simulated runs must be distinguishable from the real ones in the index
+                if "DAQBackend" in json_metadata:
+                    sheet_row["DAQBackend"] = json_metadata["DAQBackend"]
+                index.add(sheet_row,
+                          exp_id=exp_id,
+                          folder=os.path.relpath(os.path.normpath(local_path), folder_path),
+                          columns=list(self.METADATA_COLUMNS.keys()))
+
+                # Catalog the data files (sizes and hashes), the data steps of the finalization are already done
+                if exp_id is not None:
+                    index.add_folder_files(exp_id, local_path)
 
         except Exception as e:
-            print(f"\033[91mCould not save experiment row in {file_path}: {e} \033[0m")
+            print(f"\033[91mCould not save experiment row in {index_path(folder_path)}: {e} \033[0m")
             return 1
 
-        return 0
\ No newline at end of file
+        return 0
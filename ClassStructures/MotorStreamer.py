@@ -0,0 +1,168 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+from ClassStructures.PlotDecimation import DecimationPyramid
+from utils.ImportantFunctions import sort_function
+import numpy as np
+import stat
+import os
+
+# Motor channels streamed for the live plot: name -> (CodeSys CSV column, unit)
+MOTOR_STREAM_CHANNELS = {
+    "Position": ("MC SW Overview - Actual Position(mm)", "mm"),
+    "Force": ("MC SW Force Control - Measured Force(N)", "N"),
+    "TargetForce": ("MC SW Force Control - Target Force(N)", "N"),
+}
+
+
+class MotorStreamer(QObject):
+    """
+    Tail the CodeSys CSV files of the Raspberry during the acquisition, through an SFTP channel of the Raspberry
+    SSH session.
+
+    The new bytes of each file are appended to a local copy in the experiment folder, so the download at the end
+    of the run only transfers the last rows (download_folder resumes the local files). The complete rows are
+    parsed into a plot ring buffer and a decimation pyramid, with the same attributes as the DAQ tasks, so the
+    AcquisitionGraph plots the motor channels like the DAQ channels. The CodeSys rows are counted at the nominal
+    SAMPLE_RATE of the motor log.
+    """
+    start_signal = pyqtSignal(str)  # Local experiment folder
+
+    def __init__(self, raspberry, remote_path, SAMPLE_RATE, TimeWindowLength, POLL_INTERVAL=200, parent=None):
+        super().__init__(parent)
+        self.raspberry = raspberry
+        self.remote_path = remote_path
+        self.POLL_INTERVAL = POLL_INTERVAL
+
+        # Attributes shared with the DAQ tasks (channel selector, plot and history views)
+        self.NAME = "Motor"
+        self.SAMPLE_RATE = SAMPLE_RATE
+        self.CHANNELS = {name: [{"port": column, "unit": unit}, idx]
+                         for idx, (name, (column, unit)) in enumerate(MOTOR_STREAM_CHANNELS.items())}
+        self.number_channels = len(self.CHANNELS)
+        self.task_type = "analog"
+        self.channel_units = [unit for _, unit in MOTOR_STREAM_CHANNELS.values()]
+        self.scale_factors = np.ones(self.number_channels)
+
+        self.PLOT_BUFFER_SIZE = int(SAMPLE_RATE * TimeWindowLength)
+        self.plot_buffer = np.full((self.PLOT_BUFFER_SIZE, self.number_channels), np.nan)
+        self.write_index = 0
+        self.plot_write_count = 0
+        self.pyramid = DecimationPyramid(self.SAMPLE_RATE, self.number_channels, plot_buffer=self.plot_buffer)
+
+        # Streaming state of each remote file: bytes copied, incomplete last line, column indices, local file
+        self.files = {}
+        self.local_path = None
+        self.streamed_bytes = 0
+        self.streamed_rows = 0
+
+        self.sftp = None
+        self.timer = None
+        self.start_signal.connect(self.start)
+
+    def selector_task(self):
+        """Task dictionary of the motor channels for the ChannelSelectorComboBox."""
+        return {"NAME": self.NAME, "DAQ_CHANNELS": self.CHANNELS, "DAQ_TASK_REFERENCE": self}
+
+    @pyqtSlot(str)
+    def start(self, local_path):
+        self.local_path = local_path
+        self.files = {}
+        self.streamed_bytes = 0
+        self.streamed_rows = 0
+        self.plot_buffer.fill(np.nan)
+        self.write_index = 0
+        self.plot_write_count = 0
+        self.pyramid.reset()
+
+        try:
+            if self.sftp is None:
+                self.sftp = self.raspberry.ssh.open_sftp()
+        except Exception as e:
+            print(f"\033[91mMotor streaming disabled, the SFTP channel could not be opened: {e}\033[0m")
+            return
+
+        # The timer is created in the streamer thread, so poll() runs in it
+        if self.timer is None:
+            self.timer = QTimer()
+            self.timer.timeout.connect(self.poll)
+        self.timer.start(self.POLL_INTERVAL)
+
+    @pyqtSlot()
+    def stop(self):
+        """Copy the rows written until now and close the local files (call it before download_folder)."""
+        if self.timer is None or not self.timer.isActive():
+            return
+        self.timer.stop()
+        self.poll()
+
+        for state in self.files.values():
+            state["local_file"].close()
+        print(f"Motor stream: {self.streamed_rows} rows, {self.streamed_bytes / 1e6:.2f} MB streamed "
+              f"from {len(self.files)} files")
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+            self.sftp = None
+
+    def poll(self):
+        try:
+            entries = [entry for entry in self.sftp.listdir_attr(self.remote_path)
+                       if stat.S_ISREG(entry.st_mode) and entry.filename.endswith(".csv")]
+            entries.sort(key=lambda entry: sort_function(entry.filename))
+
+            for entry in entries:
+                state = self.files.get(entry.filename)
+                if state is None:
+                    state = {"offset": 0, "pending": b"", "columns": None,
+                             "local_file": open(os.path.join(self.local_path, entry.filename), "wb")}
+                    self.files[entry.filename] = state
+
+                if entry.st_size <= state["offset"]:
+                    continue
+
+                # New bytes since the last poll, the file is still being written by CodeSys
+                with self.sftp.open(self.remote_path + '/' + entry.filename, "rb") as remote_file:
+                    remote_file.seek(state["offset"])
+                    data = remote_file.read(entry.st_size - state["offset"])
+
+                state["local_file"].write(data)
+                state["local_file"].flush()
+                state["offset"] += len(data)
+                self.streamed_bytes += len(data)
+                self._parse(state, data)
+
+        except Exception as e:
+            # The motor data is downloaded at the end of the run anyway, the acquisition continues
+            print(f"\033[91mMotor streaming error: {e}\033[0m")
+
+    def _parse(self, state, data):
+        """Parse the complete rows of the new bytes, the incomplete last line waits for the next poll."""
+        lines = (state["pending"] + data).split(b"\n")
+        state["pending"] = lines.pop()
+
+        if state["columns"] is None and lines:
+            header = [name.strip().strip('"') for name in lines.pop(0).decode(errors="replace").split(";")]
+            missing = [column for column, _ in MOTOR_STREAM_CHANNELS.values() if column not in header]
+            if missing:
+                print(f"\033[91mMotor streaming: columns {missing} not found in the CodeSys file\033[0m")
+                state["columns"] = []
+            else:
+                state["columns"] = [header.index(column) for column, _ in MOTOR_STREAM_CHANNELS.values()]
+
+        rows = [line.decode(errors="replace") for line in lines if line.strip()]
+        if not rows or not state["columns"]:
+            return
+
+        # The LTIME column contains '#' (LTIME#1s2ms), it is not a comment
+        block = np.loadtxt(rows, delimiter=";", usecols=state["columns"], comments=None, ndmin=2)
+        self._store_data(block)
+
+    def _store_data(self, block):
+        """Copy the parsed rows into the plot ring buffer and the decimation pyramid."""
+        n_rows = len(block)
+        positions = (self.write_index + np.arange(n_rows))[-self.PLOT_BUFFER_SIZE:] % self.PLOT_BUFFER_SIZE
+        self.plot_buffer[positions] = block[-self.PLOT_BUFFER_SIZE:]
+        self.write_index = (self.write_index + n_rows) % self.PLOT_BUFFER_SIZE
+        self.plot_write_count += n_rows
+        self.pyramid.append(block, self.write_index)
+        self.streamed_rows += n_rows
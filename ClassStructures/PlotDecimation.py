@@ -0,0 +1,221 @@
+import numpy as np
+
+
+class EnvelopeDecimator:
+    """
+    Min/max envelope of one channel of the plot ring buffer of a DAQ task, with one bin per screen pixel.
+
+    The bins are aligned to fixed positions of the ring buffer, so each update only recomputes the bins
+    written since the previous update. The cost of a frame depends on the new samples and the number of
+    pixels, not on PLOT_BUFFER_SIZE. The envelope is drawn as two points (min and max) per bin.
+    """
+    def __init__(self, DAQ_TASK, channel_index, n_bins):
+        self.task = DAQ_TASK
+        self.channel_index = channel_index
+        self.size = DAQ_TASK.PLOT_BUFFER_SIZE
+        self.fs = DAQ_TASK.SAMPLE_RATE
+
+        # Samples per bin and number of bins (the last bin can be shorter)
+        self.requested_bins = n_bins
+        self.bin_size = max(1, int(np.ceil(self.size / max(1, n_bins))))
+        self.n_bins = int(np.ceil(self.size / self.bin_size))
+        self.bin_starts = np.arange(self.n_bins) * self.bin_size
+
+        self.mins = np.full(self.n_bins, np.nan)
+        self.maxs = np.full(self.n_bins, np.nan)
+        self.x = np.empty(2 * self.n_bins, dtype=np.float64)
+        self.y = np.empty(2 * self.n_bins, dtype=np.float64)
+
+        # Total samples written into the plot buffer at the last update (None: recompute all the bins)
+        self.last_count = None
+
+    def _compute_bins(self, first_bin, last_bin):
+        """Recompute the bins first_bin..last_bin-1 from the ring buffer."""
+        start = first_bin * self.bin_size
+        segment = self.task.plot_buffer[start:min(last_bin * self.bin_size, self.size), self.channel_index]
+        offsets = np.arange(0, len(segment), self.bin_size)
+
+        # fmin/fmax ignore the NaN of the flushed plot buffer
+        self.mins[first_bin:last_bin] = np.fmin.reduceat(segment, offsets)
+        self.maxs[first_bin:last_bin] = np.fmax.reduceat(segment, offsets)
+
+    def update(self, time_origin=None):
+        """
+        Update the bins with the new samples and return the (x, y) arrays of the envelope.
+        x is the time of the oldest sample of the window if time_origin is None, otherwise the acquisition time
+        (samples written / SAMPLE_RATE) minus time_origin, to align the traces of tasks with different rates.
+        """
+        count = self.task.plot_write_count
+        new_samples = count - self.last_count if self.last_count is not None else self.size
+
+        if new_samples >= self.size:
+            self._compute_bins(0, self.n_bins)
+        elif new_samples > 0:
+            first_bin = (self.last_count % self.size) // self.bin_size
+            last_bin = ((count - 1) % self.size) // self.bin_size + 1
+            if last_bin > first_bin:
+                self._compute_bins(first_bin, last_bin)
+            else:
+                # The new samples wrap around the end of the ring buffer
+                self._compute_bins(first_bin, self.n_bins)
+                self._compute_bins(0, last_bin)
+        self.last_count = count
+
+        # Display order: the oldest bin is the first one after the write position
+        write_index = count % self.size
+        order = (np.arange(self.n_bins) + int(np.ceil(write_index / self.bin_size))) % self.n_bins
+        bin_times = ((self.bin_starts[order] - write_index) % self.size) / self.fs
+        if time_origin is not None:
+            bin_times += (count - self.size) / self.fs - time_origin
+
+        self.x[0::2] = bin_times
+        self.x[1::2] = bin_times
+        self.y[0::2] = self.mins[order]
+        self.y[1::2] = self.maxs[order]
+        return self.x, self.y
+
+
+# Decimation pyramid: samples per bin of the first level, bins merged per level and bins kept per level
+PYRAMID_BASE_FACTOR = 16
+PYRAMID_LEVEL_FACTOR = 8
+PYRAMID_LEVEL_BINS = 8192
+
+# The levels are added until the last one holds this acquisition time
+PYRAMID_HISTORY_HOURS = 48
+
+
+class _PyramidLevel:
+    """Ring of min/max/sum bins of bin_size samples, built from groups of bins (or samples) of the level below."""
+    def __init__(self, bin_size, group_size, capacity, n_channels):
+        self.bin_size = bin_size
+        self.group_size = group_size
+        self.capacity = capacity
+        self.n_channels = n_channels
+        self.reset()
+
+    def reset(self):
+        capacity, n_channels = self.capacity, self.n_channels
+        self.mins = np.full((capacity, n_channels), np.nan)
+        self.maxs = np.full((capacity, n_channels), np.nan)
+        self.sums = np.full((capacity, n_channels), np.nan)
+        self.n_bins = 0  # Bins written since the reset, bin k covers the samples [k*bin_size, (k+1)*bin_size)
+
+        # Bins (or samples) of the level below waiting to complete a group
+        self.carry_mins = np.empty((0, n_channels))
+        self.carry_maxs = np.empty((0, n_channels))
+        self.carry_sums = np.empty((0, n_channels))
+
+    def push(self, mins, maxs, sums):
+        """Add the bins of the level below, returns the completed bins of this level."""
+        if len(self.carry_mins):
+            mins = np.concatenate((self.carry_mins, mins))
+            maxs = np.concatenate((self.carry_maxs, maxs))
+            sums = np.concatenate((self.carry_sums, sums))
+
+        n_new = len(mins) // self.group_size
+        n_full = n_new * self.group_size
+        self.carry_mins, self.carry_maxs, self.carry_sums = mins[n_full:], maxs[n_full:], sums[n_full:]
+        if n_new == 0:
+            return None
+
+        shape = (n_new, self.group_size, mins.shape[1])
+        new_mins = mins[:n_full].reshape(shape).min(axis=1)
+        new_maxs = maxs[:n_full].reshape(shape).max(axis=1)
+        new_sums = sums[:n_full].reshape(shape).sum(axis=1)
+
+        # Write into the ring (only the last capacity bins are kept)
+        positions = np.arange(self.n_bins, self.n_bins + n_new)[-self.capacity:] % self.capacity
+        self.mins[positions] = new_mins[-self.capacity:]
+        self.maxs[positions] = new_maxs[-self.capacity:]
+        self.sums[positions] = new_sums[-self.capacity:]
+        self.n_bins += n_new
+        return new_mins, new_maxs, new_sums
+
+    def first_bin(self):
+        """Oldest bin still in the ring."""
+        return max(0, self.n_bins - self.capacity)
+
+
+class DecimationPyramid:
+    """
+    Multi-resolution min/max/mean history of all the channels of a DAQ task, in bounded memory.
+
+    Each level keeps the last PYRAMID_LEVEL_BINS bins, the bins of a level merge PYRAMID_LEVEL_FACTOR bins of the
+    level below, so the coarse levels hold the whole run and the fine levels the last minutes. The pyramid is fed
+    with the blocks of EveryNCallback and query() returns the finest data that covers a time range with about one
+    bin per pixel, using the raw samples of the plot buffer for the most recent seconds.
+    """
+    def __init__(self, sample_rate, n_channels, plot_buffer=None):
+        self.fs = sample_rate
+        self.n_channels = n_channels
+        self.plot_buffer = plot_buffer
+
+        history_samples = PYRAMID_HISTORY_HOURS * 3600 * sample_rate
+        self.levels = [_PyramidLevel(PYRAMID_BASE_FACTOR, PYRAMID_BASE_FACTOR, PYRAMID_LEVEL_BINS, n_channels)]
+        while self.levels[-1].bin_size * PYRAMID_LEVEL_BINS < history_samples:
+            self.levels.append(_PyramidLevel(self.levels[-1].bin_size * PYRAMID_LEVEL_FACTOR, PYRAMID_LEVEL_FACTOR,
+                                             PYRAMID_LEVEL_BINS, n_channels))
+        self.reset()
+
+    def reset(self):
+        for level in self.levels:
+            level.reset()
+        self.n_samples = 0
+        self.raw_end_index = None  # Plot buffer position after the last sample (raw data of the last samples)
+
+    def append(self, block, plot_write_index=None):
+        """Add a block of samples (samples x channels), called from EveryNCallback."""
+        block = np.asarray(block, dtype=np.float64)
+        bins = (block, block, block)
+        for level in self.levels:
+            bins = level.push(*bins)
+            if bins is None:
+                break
+        self.n_samples += len(block)
+        self.raw_end_index = plot_write_index
+
+    def query(self, channel, t_start, t_end, n_bins):
+        """
+        Bins of a channel between t_start and t_end (seconds since the reset), reduced to at most n_bins.
+        Returns the arrays (times, mins, maxs, means), times is the start time of each bin.
+        """
+        first_sample = max(0, int(np.floor(t_start * self.fs)))
+        last_sample = min(self.n_samples, int(np.ceil(t_end * self.fs)))
+        span = last_sample - first_sample
+        empty = np.empty(0)
+        if span <= 0 or n_bins <= 0:
+            return empty, empty, empty, empty
+
+        # Raw samples of the plot buffer if they cover the range at the screen resolution
+        if self.plot_buffer is not None and self.raw_end_index is not None and span <= 4 * n_bins \
+                and self.n_samples - first_sample <= len(self.plot_buffer):
+            positions = (self.raw_end_index - (self.n_samples - np.arange(first_sample, last_sample))) \
+                        % len(self.plot_buffer)
+            values = self.plot_buffer[positions, channel]
+            starts, mins, maxs, sums, counts = np.arange(first_sample, last_sample), values, values, values, 1
+        else:
+            # Finest level with the range in its ring and no more than 4 bins per pixel, the coarsest otherwise
+            level = self.levels[-1]
+            for candidate in self.levels:
+                if candidate.n_bins and candidate.first_bin() * candidate.bin_size <= first_sample \
+                        and span <= 4 * n_bins * candidate.bin_size:
+                    level = candidate
+                    break
+
+            first_bin = max(first_sample // level.bin_size, level.first_bin())
+            last_bin = min(-(-last_sample // level.bin_size), level.n_bins)
+            if last_bin <= first_bin:
+                return empty, empty, empty, empty
+            positions = np.arange(first_bin, last_bin) % level.capacity
+            starts = np.arange(first_bin, last_bin) * level.bin_size
+            mins = level.mins[positions, channel]
+            maxs = level.maxs[positions, channel]
+            sums = level.sums[positions, channel]
+            counts = level.bin_size
+
+        # Reduce to n_bins bins
+        group = max(1, -(-len(starts) // n_bins))
+        offsets = np.arange(0, len(starts), group)
+        group_counts = np.diff(np.append(offsets, len(starts))) * counts
+        means = np.add.reduceat(sums, offsets) / group_counts
+        return (starts[offsets] / self.fs, np.fmin.reduceat(mins, offsets), np.fmax.reduceat(maxs, offsets), means)
@@ -0,0 +1,147 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+import numpy as np
+import threading
+
+
+class PlotPreparationWorker(QObject):
+    """
+    Prepare the plot data of the AcquisitionGraph in a worker thread: unwrap and decimation of the plot buffers,
+    pyramid queries of the history views and unit scaling.
+
+    The frames are written into two sets of arrays (double buffer): the worker fills the back set and swaps it
+    with the front set, and the GUI thread only calls setData() with the front set. A new frame is not prepared
+    until the GUI has drawn the previous one, if the GUI is behind the frame is skipped instead of queued.
+    """
+    frame_ready = pyqtSignal()
+    start_signal = pyqtSignal(int)
+    stop_signal = pyqtSignal()
+
+    def __init__(self, TimeWindowLength, history_views, parent=None):
+        super().__init__(parent)
+        self.TimeWindowLength = TimeWindowLength
+        self.history_views = history_views
+
+        # State shared with the GUI thread, protected by the lock
+        self._lock = threading.Lock()
+        self._traces = []
+        self._generation = 0
+        self._view = {"mode": "Live", "follow": True, "x_range": (0, TimeWindowLength), "n_bins": 1000}
+        self._frame_pending = False
+
+        # Double buffer: per trace (x, y) arrays of each set, the front set is the last published frame
+        self._buffers = [{"curves": []}, {"curves": []}]
+        self._front = 0
+
+        self.frames_prepared = 0
+        self.frames_skipped = 0
+        self.timer = None
+
+        self.start_signal.connect(self._start_timer)
+        self.stop_signal.connect(self._stop_timer)
+
+    # ---------------- GUI THREAD ----------------
+    def set_traces(self, traces, generation):
+        """traces: list of dictionaries with the DAQ task, channel index and EnvelopeDecimator."""
+        with self._lock:
+            self._traces = [{key: trace[key] for key in ("task", "index", "decimator")} for trace in traces]
+            self._generation = generation
+            self._frame_pending = False
+
+    def set_view(self, **view):
+        with self._lock:
+            self._view.update(view)
+
+    def take_frame(self):
+        """Last published frame (None if it was already drawn), call frame_drawn() after setData()."""
+        with self._lock:
+            if not self._frame_pending:
+                return None
+            return self._buffers[self._front]
+
+    def frame_drawn(self):
+        with self._lock:
+            self._frame_pending = False
+
+    # ---------------- WORKER THREAD ----------------
+    @pyqtSlot(int)
+    def _start_timer(self, interval):
+        # The timer is created in the worker thread, so prepare_frame() runs in it
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.prepare_frame)
+        self.timer.start(interval)
+
+    @pyqtSlot()
+    def _stop_timer(self):
+        if self.timer is not None:
+            self.timer.stop()
+
+    @staticmethod
+    def _store(curves, idx, x, y, trace):
+        """Copy a trace in engineering units into the arrays of the back buffer, reused if the size doesn't change."""
+        if idx >= len(curves):
+            curves.append((np.empty(0), np.empty(0)))
+        buffer_x, buffer_y = curves[idx]
+        if len(buffer_x) != len(x):
+            buffer_x, buffer_y = np.empty(len(x)), np.empty(len(x))
+            curves[idx] = (buffer_x, buffer_y)
+        np.copyto(buffer_x, x)
+        # Conversion factor of the channel, read for every frame since it can be resolved when the acquisition starts
+        np.multiply(y, trace["task"].scale_factors[trace["index"]], out=buffer_y)
+
+    def prepare_frame(self):
+        with self._lock:
+            if self._frame_pending:
+                # The GUI has not drawn the previous frame yet, skip this one
+                self.frames_skipped += 1
+                return
+            traces = self._traces
+            generation = self._generation
+            view = dict(self._view)
+
+        if not traces:
+            return
+
+        back = self._buffers[1 - self._front]
+        curves = back["curves"]
+        del curves[len(traces):]
+        x_range = None
+
+        if view["mode"] == "Live":
+            # The most recent sample of the selected tasks is drawn at the end of the time window
+            latest_time = max(trace["task"].plot_write_count / trace["task"].SAMPLE_RATE for trace in traces)
+            time_origin = latest_time - self.TimeWindowLength
+
+            # Only the bins written since the last frame are computed, the cost is bounded by the plot width
+            for idx, trace in enumerate(traces):
+                x, y = trace["decimator"].update(time_origin=time_origin)
+                self._store(curves, idx, x, y, trace)
+        else:
+            latest_time = max(trace["task"].pyramid.n_samples / trace["task"].SAMPLE_RATE for trace in traces)
+            if view["follow"]:
+                history_length = self.history_views.get(view["mode"])
+                t_start = max(0.0, latest_time - history_length) if history_length else 0.0
+                t_end = max(latest_time, t_start + self.TimeWindowLength)
+                x_range = (t_start, t_end)
+            else:
+                t_start, t_end = view["x_range"]
+
+            # One bin per pixel of the visible range, from the finest pyramid level that covers it
+            for idx, trace in enumerate(traces):
+                times, mins, maxs, _ = trace["task"].pyramid.query(trace["index"], t_start, t_end, view["n_bins"])
+                y = np.empty(2 * len(times))
+                y[0::2] = mins
+                y[1::2] = maxs
+                self._store(curves, idx, np.repeat(times, 2), y, trace)
+
+        back["generation"] = generation
+        back["x_range"] = x_range
+
+        with self._lock:
+            if generation != self._generation:
+                # The traces changed while the frame was prepared
+                return
+            self._front = 1 - self._front
+            self._frame_pending = True
+            self.frames_prepared += 1
+
+        self.frame_ready.emit()
@@ -4,14 +4,30 @@ import os
 from pathlib import Path
 import stat
 import time
+import queue
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import QObject
 from PyQt5.QtWidgets import QFileDialog
 
+# Files hashed per remote sha256sum command (keeps the command line short)
+SHA256_BATCH_FILES = 200
+
+# Read requests in flight per file transfer (pipelined reads of the SFTP prefetch)
+SFTP_PREFETCH_REQUESTS = 64
+
+# Chunk length of the downloads: the hash state is kept after each chunk, a failed download resumes from the
+# first chunk that differs from the remote file
+VERIFY_CHUNK_BYTES = 1 << 20
+
+
 class RaspberryInterface(QObject):
 
     def __init__(self, hostname, port, username, password,
                  codesys_folder="/var/opt/codesys/PlcLogic/FTP_Folder",
-                 timeout=2):
+                 timeout=2,
+                 sftp_channels=4):
 
         super().__init__()
         self.hostname = hostname
@@ -22,6 +38,13 @@ class RaspberryInterface(QObject):
         self.current_path = str(Path("__file__").resolve().parent)
         self.timeout = timeout
 
+        # SFTP channels opened once in connect() and reused by the parallel downloads of every run
+        self.sftp_channels = sftp_channels
+        self.sftp_pool = queue.Queue()
+
+        # Files, bytes, time and throughput of the last download_folder()
+        self.last_download_stats = None
+
         # Create SSH client
         self.ssh = paramiko.SSHClient()
         
@@ -90,9 +113,7 @@ class RaspberryInterface(QObject):
             
         sha256sum_remote = stdout.read().decode().split("  ")[0]
     
-        with open(local_path, "rb") as file:
-            data = file.read()
-            sha256_local = hashlib.sha256(data).hexdigest()
+        sha256_local = self._local_sha256(local_path)
         
         print("Remote SHA256:", sha256sum_remote)
         print("Local SHA256:", sha256_local)
@@ -104,6 +125,53 @@ class RaspberryInterface(QObject):
             print("File integrity failed, hash doesn't match")
             return False
         
+    def remote_sha256(self, remote_paths):
+        """SHA256 of several remote files with one sha256sum command per SHA256_BATCH_FILES files."""
+        hashes = {}
+        for n in range(0, len(remote_paths), SHA256_BATCH_FILES):
+            batch = remote_paths[n:n + SHA256_BATCH_FILES]
+            command = "sha256sum -- " + " ".join(shlex.quote(path) for path in batch)
+            stdin, stdout, stderr = self.ssh.exec_command(command)
+
+            # Read the output before waiting, the command might fill the channel window with many files
+            output = stdout.read().decode()
+            stdout.channel.recv_exit_status()
+
+            # Check command error
+            error = stderr.read().decode()
+            if error != '':
+                raise Exception(error)
+
+            for line in output.splitlines():
+                digest, path = line.split("  ", 1)
+                hashes[path] = digest
+
+        return hashes
+
+    def remote_chunk_sha256(self, remote_path):
+        """SHA256 of each VERIFY_CHUNK_BYTES chunk of a remote file, to find the chunks of a failed download."""
+        command = (f"f={shlex.quote(remote_path)}; size=$(stat -c %s \"$f\"); i=0; "
+                   f"while [ $((i * {VERIFY_CHUNK_BYTES})) -lt $size ]; do "
+                   f"dd if=\"$f\" bs={VERIFY_CHUNK_BYTES} skip=$i count=1 2>/dev/null | sha256sum; i=$((i + 1)); done")
+        stdin, stdout, stderr = self.ssh.exec_command(command)
+        output = stdout.read().decode()
+        stdout.channel.recv_exit_status()
+
+        # Check command error
+        error = stderr.read().decode()
+        if error != '':
+            raise Exception(error)
+
+        return [line.split()[0] for line in output.splitlines()]
+
+    @staticmethod
+    def _local_sha256(local_path, chunk_size=VERIFY_CHUNK_BYTES):
+        sha256 = hashlib.sha256()
+        with open(local_path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
     def upload_file(self, local_path, remote_path):
         
         print(f"Uploading file from {local_path} to {remote_path}")
@@ -132,25 +200,123 @@ class RaspberryInterface(QObject):
             print("Error when uploading the file")
             return False
             
+    def _transfer(self, remote_path, local_path, offset=0, sha256=None, progress=None):
+        """
+        Download a file from offset with a channel of the SFTP pool, the bytes are hashed as they arrive.
+
+        sha256 is the hash state of the bytes before offset (offset must be a multiple of VERIFY_CHUNK_BYTES).
+        Returns the hash of the whole file and the hash states after each chunk from offset. progress is called
+        with the number of bytes of each read.
+        """
+        sha256 = sha256 or hashlib.sha256()
+        snapshots = []
+
+        sftp = self.sftp_pool.get()
+        try:
+            with sftp.open(remote_path, "rb") as remote_file, \
+                    open(local_path, "r+b" if offset else "wb") as local_file:
+                size = remote_file.stat().st_size
+                remote_file.seek(offset)
+                local_file.seek(offset)
+                local_file.truncate()
+
+                # Pipelined reads of the rest of the file
+                remote_file.prefetch(size, max_concurrent_requests=SFTP_PREFETCH_REQUESTS)
+
+                position = offset
+                while position < size:
+                    data = remote_file.read(min(VERIFY_CHUNK_BYTES, size - position))
+                    if not data:
+                        break
+                    local_file.write(data)
+                    sha256.update(data)
+                    position += len(data)
+                    snapshots.append(sha256.copy())
+                    if progress:
+                        progress(len(data))
+        finally:
+            self.sftp_pool.put(sftp)
+
+        return sha256, snapshots
+
+    @staticmethod
+    def _local_snapshots(local_path):
+        """Hash states after each complete chunk of a local file already (partly) downloaded, to resume it."""
+        sha256 = hashlib.sha256()
+        snapshots = []
+        with open(local_path, "rb") as file:
+            for chunk in iter(lambda: file.read(VERIFY_CHUNK_BYTES), b""):
+                if len(chunk) < VERIFY_CHUNK_BYTES:
+                    break
+                sha256.update(chunk)
+                snapshots.append(sha256.copy())
+        return snapshots
+
+    def _repair_file(self, remote_path, local_path, remote_hash, sha256, snapshots, max_retries=5, progress=None):
+        """
+        Download again the chunks of a file from the first one that differs from the remote file, until the hash of
+        the file matches remote_hash. Returns the number of bytes downloaded again.
+        """
+        repaired_bytes = 0
+        attempt = 0
+        while sha256.hexdigest() != remote_hash:
+            if attempt >= max_retries:
+                raise Exception(f"Error while trying to download the file {remote_path}")
+
+            # First chunk of the local file with a different hash (read one chunk at a time)
+            remote_chunks = self.remote_chunk_sha256(remote_path)
+            first_chunk = len(remote_chunks)
+            with open(local_path, "rb") as file:
+                for n, remote_chunk in enumerate(remote_chunks):
+                    if hashlib.sha256(file.read(VERIFY_CHUNK_BYTES)).hexdigest() != remote_chunk:
+                        first_chunk = n
+                        break
+
+            print(f"File integrity failed for {remote_path}, resuming from chunk {first_chunk}/{len(remote_chunks)}, "
+                  f"attempt = {attempt}")
+            offset = first_chunk * VERIFY_CHUNK_BYTES
+            resume_hash = snapshots[first_chunk - 1].copy() if first_chunk else None
+            sha256, new_snapshots = self._transfer(remote_path, local_path, offset, resume_hash, progress)
+            snapshots = snapshots[:first_chunk] + new_snapshots
+            repaired_bytes += os.path.getsize(local_path) - offset
+            attempt += 1
+
+        return repaired_bytes
+
     def download_file(self, remote_path, local_path, max_retries = 5):
         
-        attempt = 0
-        while attempt < max_retries:
-            print(f'\nDownloading file: {remote_path}')
-            self.sftp.get(remote_path, local_path)
-            
-            # Check file integrity
-            if self.check_file_integrity(local_path, remote_path):
-                print("File Successfully downloaded")
-                return
+        remote_hash = self.remote_sha256([remote_path])[remote_path]
+
+        print(f'\nDownloading file: {remote_path}')
+        sha256, snapshots = self._transfer(remote_path, local_path)
+
+        # Check file integrity
+        self._repair_file(remote_path, local_path, remote_hash, sha256, snapshots, max_retries)
+        print("File Successfully downloaded")
+
+    def _list_remote_files(self, remote_path, local_path):
+        """Files of a remote folder and its subfolders as (remote path, local path, size), creates the local folders."""
+        os.makedirs(local_path, exist_ok=True)  # Don't raise error if it exist
+
+        files = []
+        for item in self.sftp.listdir_attr(remote_path):
+            remote_item = remote_path + '/' + item.filename
+            local_item = os.path.join(local_path, item.filename)
+
+            if stat.S_ISDIR(item.st_mode):
+                files.extend(self._list_remote_files(remote_item, local_item))
             else:
-                print(f"Retrying in 1 second, attempt = {attempt}")
-                attempt += 1
-                time.sleep(1)
-    
-        raise Exception("Error while trying to download a file")
+                files.append((remote_item, local_item, item.st_size))
+        return files
     
-    def download_folder(self, remote_path, local_path=None):
+    def download_folder(self, remote_path, local_path=None, max_retries=5):
+        """
+        Download a remote folder (and its subfolders) with the parallel channels of the SFTP pool.
+
+        The remote hashes of all the files are computed with one batched sha256sum command while the files are
+        transferred and hashed, the files with a different hash are downloaded again from the first chunk that
+        differs (max_retries times). The files already in local_path are resumed, only the rest is transferred.
+        """
         
         if local_path == None:
             # Get file save location from user:
@@ -166,22 +332,56 @@ class RaspberryInterface(QObject):
         else:
             current_path = str(Path("__file__").resolve().parent)
             local_path = os.path.join(current_path, local_path)
+
+        files = self._list_remote_files(remote_path, local_path)
+        total_bytes = sum(size for _, _, size in files)
+
+        # Progress of the transfers (the callbacks are called by the pool threads)
+        lock = threading.Lock()
+        progress = {"files": 0, "bytes": 0}
+        start_time = time.perf_counter()
+
+        def callback(n_bytes):
+            with lock:
+                progress["bytes"] += n_bytes
+
+        def download(remote_item, local_item, size):
+            # The local files copied during the acquisition (MotorStreamer) are resumed after their last full chunk
+            snapshots = self._local_snapshots(local_item) if os.path.isfile(local_item) else []
+            resume_hash = snapshots[-1].copy() if snapshots else None
+            sha256, new_snapshots = self._transfer(remote_item, local_item, len(snapshots) * VERIFY_CHUNK_BYTES,
+                                                   resume_hash, progress=callback)
+            snapshots += new_snapshots
+
+            with lock:
+                progress["files"] += 1
+                elapsed = time.perf_counter() - start_time
+                print(f"[{progress['files']}/{len(files)}] {os.path.basename(local_item)} ({size / 1e6:.2f} MB), "
+                      f"{progress['bytes'] / 1e6:.1f}/{total_bytes / 1e6:.1f} MB, "
+                      f"{progress['bytes'] / 1e6 / max(elapsed, 1e-9):.2f} MB/s")
+
+            # The remote hashes are computed by the Raspberry while the files are transferred
+            return self._repair_file(remote_item, local_item, remote_hashes.result()[remote_item], sha256, snapshots,
+                                     max_retries, callback)
+
+        with ThreadPoolExecutor(max_workers=self.sftp_channels + 1) as executor:
+            remote_hashes = executor.submit(self.remote_sha256, [remote_item for remote_item, _, _ in files])
+            repaired_bytes = sum(executor.map(lambda file: download(*file), files))
+
+        elapsed = time.perf_counter() - start_time
+        self.last_download_stats = {
+            "Files": len(files),
+            "Bytes": total_bytes,
+            "TransferredBytes": progress["bytes"],
+            "RepairedBytes": repaired_bytes,
+            "SFTPChannels": self.sftp_channels,
+            "Duration (s)": elapsed,
+            "Throughput (MB/s)": progress["bytes"] / 1e6 / elapsed if elapsed > 0 else None,
+        }
     
-        os.makedirs(local_path, exist_ok=True)  # Don't raise error if it exist
-                
-        for item in self.sftp.listdir_attr(remote_path):
-            
-            remote_item = remote_path + '/' + item.filename
-            local_item = os.path.join(local_path, item.filename)
-            
-            if stat.S_ISDIR(item.st_mode):
-                # If it is a folder, do recursive call
-                self.download_folder(self.sftp, remote_item, local_item)
-            else:
-                # If it is a file, download it
-                self.download_file(remote_item, local_item)
-    
-        print("\nFolder successfully downloaded into the path: ", local_path)
+        print(f"\nFolder successfully downloaded into the path: {local_path} ({len(files)} files, "
+              f"{total_bytes / 1e6:.1f} MB, {progress['bytes'] / 1e6:.1f} MB transferred in {elapsed:.2f} s, "
+              f"{self.last_download_stats['Throughput (MB/s)'] or 0:.2f} MB/s, all hashes match)")
         return local_path
     
     def remove_file(self, remote_path):
@@ -277,7 +477,12 @@ class RaspberryInterface(QObject):
             # Iniciar sesión SFTP
             print("Starting sFTP server...")
             self.sftp = self.ssh.open_sftp()
-            print("sFTP server started successfully")
+
+            # Pool of SFTP channels of the parallel downloads, kept open until disconnect()
+            self.sftp_pool = queue.Queue()
+            for _ in range(self.sftp_channels):
+                self.sftp_pool.put(self.ssh.open_sftp())
+            print(f"sFTP server started successfully ({self.sftp_channels} download channels)")
     
         except paramiko.AuthenticationException:
             print("Authentication failed.")
@@ -296,8 +501,10 @@ class RaspberryInterface(QObject):
     
     def disconnect(self):
         # Close the connection
-        self.ssh.close()
+        while not self.sftp_pool.empty():
+            self.sftp_pool.get().close()
         self.sftp.close()
+        self.ssh.close()
         print("Socket closed")
         
         
@@ -0,0 +1,415 @@
+"""
+Simulated NI-DAQmx device.
+
+It implements the subset of the PyDAQmx Task interface used by DaqInterface, so the acquisition pipeline
+(AcquisitionProgram -> DAQ tasks -> BufferProcessor -> Save_Data) can run on a computer without NI hardware.
+The analog inputs generate TENG-like pulses synchronized with the LinMot up/down movement, the digital inputs
+generate the LinMot enable and up/down square waves, and EveryNCallback is fired from a timer thread.
+
+The signals are generated on a clock shared by all the tasks: the LinMot moves while its trigger output is set, and
+the tasks configured with a start trigger (CfgDigEdgeStartTrig) or with the sample clock of another task wait for it
+like the real device, so the alignment of several tasks can be tested.
+
+The simulation parameters are set in the SIMULATION dictionary before the tasks are started.
+"""
+from ctypes import c_uint32
+import threading
+import time
+import itertools
+import numpy as np
+
+# Values of the NI-DAQmx constants (NIDAQmx.h), the tasks created with the simulated backend use the same values
+DAQmx_Val_RSE = 10083
+DAQmx_Val_NRSE = 10078
+DAQmx_Val_Diff = 10106
+DAQmx_Val_PseudoDiff = 12529
+DAQmx_Val_Volts = 10348
+DAQmx_Val_Rising = 10280
+DAQmx_Val_Falling = 10171
+DAQmx_Val_ContSamps = 10123
+DAQmx_Val_FiniteSamps = 10178
+DAQmx_Val_GroupByChannel = 0
+DAQmx_Val_GroupByScanNumber = 1
+DAQmx_Val_Acquired_Into_Buffer = 1
+DAQmx_Val_ChanPerLine = 0
+DAQmx_Val_ChanForAllLines = 1
+
+bool32 = c_uint32
+
+SIMULATION = {
+    # True: the samples are generated at SAMPLE_RATE (wall clock), False: as fast as the callbacks consume them
+    "realtime": True,
+
+    # LinMot movement: period of one up/down cycle and delay from the LinMot trigger (the task start without
+    # trigger) until the motor is enabled
+    "cycle_period": 1.0,
+    "up_fraction": 0.5,
+    "enable_delay": 0.5,
+
+    # TENG signal: peak voltage at contact (positive) and separation (negative), pulse width and noise (V rms)
+    "teng_amplitude": 5.0,
+    "teng_pulse_width": 0.01,
+    "noise": 0.02,
+
+    # Signal generated by each digital line index: "enable", "up_down", or a constant 0/1
+    "digital_lines": {0: "enable", 1: "up_down"},
+
+    # Digital inputs wired to digital outputs (Raspberry status lines), the other input lines read 0
+    "loopback": {"Dev1/port1/line0": "Dev1/port0/line6"},
+
+    # Digital output that starts the LinMot movement (until it is cleared), and PFI terminals wired to digital
+    # outputs (the LinMot trigger is wired to PFI0 of every device). A start trigger on a terminal that is not
+    # wired never fires, the task waits like the real device.
+    "linmot_trigger_line": "Dev1/port0/line7",
+    "pfi_wiring": {"PFI0": "Dev1/port0/line7"},
+
+    "seed": 0,
+}
+
+
+class SimulatedDAQError(RuntimeError):
+    pass
+
+
+# Task handles of the created tasks (DAQmxIsTaskDone) and state of the digital output lines (loopback)
+_tasks = {}
+_handle_counter = itertools.count(1)
+_output_lines = {}
+
+# Start and stop times (perf_counter) of the last LinMot movement, set by the LinMot trigger output
+_linmot_run = {"start": None, "stop": None}
+
+
+def _set_reference(reference, value):
+    """Set the value of a ctypes output argument passed directly or with byref()."""
+    if reference is None:
+        return
+    target = getattr(reference, "_obj", reference)
+    target.value = value
+
+
+def _expand_lines(lines):
+    """'Dev1/port0/line0:2, Dev1/port0/line5' -> ['Dev1/port0/line0', 'Dev1/port0/line1', ...]"""
+    expanded = []
+    for line in lines.split(","):
+        line = line.strip()
+        prefix, _, last = line.rpartition("line")
+        if ":" in last:
+            first, last = last.split(":")
+            step = 1 if int(last) >= int(first) else -1
+            expanded.extend(f"{prefix}line{idx}" for idx in range(int(first), int(last) + step, step))
+        else:
+            expanded.append(line)
+    return expanded
+
+
+def _line_index(line):
+    return int(line.rpartition("line")[2])
+
+
+def _terminal_name(terminal, device):
+    """'/Dev1/ai/SampleClock' -> 'Dev1/ai/SampleClock', terminals without device ('PFI0') are the task device ones."""
+    terminal = terminal.strip("/")
+    if terminal.split("/")[0] != device:
+        terminal = f"{device}/{terminal}"
+    return terminal
+
+
+def _fire_terminal(terminal, fire_time):
+    """Start the tasks waiting for an edge on the terminal, they share the same first sample time."""
+    for task in list(_tasks.values()):
+        if task.running and task.start_time is None and task.start_terminal == terminal:
+            task._begin(fire_time)
+
+
+def _output_edge(line, value, edge_time):
+    """Rising and falling edges of a digital output: LinMot movement and PFI terminals wired to the line."""
+    if line == SIMULATION["linmot_trigger_line"]:
+        if value:
+            _linmot_run.update(start=edge_time, stop=None)
+        elif _linmot_run["start"] is not None:
+            _linmot_run["stop"] = edge_time
+
+    # The PFI terminal is wired to every device, the armed tasks of all the devices start with the same edge
+    if value:
+        for pfi, wired_line in SIMULATION["pfi_wiring"].items():
+            if wired_line == line:
+                for device in {task.device for task in list(_tasks.values())}:
+                    _fire_terminal(f"{device}/{pfi}", edge_time)
+
+
+def DAQmxIsTaskDone(taskHandle, isTaskDone):
+    task = _tasks.get(taskHandle)
+    _set_reference(isTaskDone, 1 if task is None or not task.running else 0)
+    return 0
+
+
+class Task:
+    """Simulated PyDAQmx Task, the method names and arguments are the ones of the NI-DAQmx C API."""
+
+    def __init__(self):
+        self.taskHandle = next(_handle_counter)
+        _tasks[self.taskHandle] = self
+
+        self.analog_channels = []
+        self.digital_input_lines = []
+        self.digital_output_lines = []
+
+        self.sample_rate = None
+        self.samples_per_event = None
+        self.sample_clock_source = ""
+        self.trigger_source = None
+        self.running = False
+
+        self.rng = np.random.default_rng(SIMULATION["seed"] + self.taskHandle)
+        self.samples_read = 0
+        self.start_time = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ---------------- CONFIGURATION ----------------
+    def CreateAIVoltageChan(self, physicalChannel, nameToAssignToChannel, terminalConfig, minVal, maxVal, units,
+                            customScaleName):
+        self.analog_channels.append({"port": physicalChannel, "min": minVal, "max": maxVal})
+        return 0
+
+    def CreateDIChan(self, lines, nameToAssignToLines, lineGrouping):
+        self.digital_input_lines.append(lines)
+        return 0
+
+    def CreateDOChan(self, lines, nameToAssignToLines, lineGrouping):
+        self.digital_output_lines.extend(_expand_lines(lines))
+        return 0
+
+    def CfgSampClkTiming(self, source, rate, activeEdge, sampleMode, sampsPerChan):
+        # A sample clock of another task ('/Dev1/ai/SampleClock') starts ticking when that task starts
+        self.sample_rate = float(rate)
+        self.sample_clock_source = source or ""
+        return 0
+
+    def CfgDigEdgeStartTrig(self, triggerSource, triggerEdge):
+        # The task waits for the edge of the terminal once it is started (see SIMULATION["pfi_wiring"])
+        self.trigger_source = triggerSource
+        return 0
+
+    @property
+    def device(self):
+        ports = [channel["port"] for channel in self.analog_channels] + self.digital_input_lines \
+                + self.digital_output_lines
+        return ports[0].strip("/").split("/")[0] if ports else ""
+
+    @property
+    def start_terminal(self):
+        """Terminal whose edge starts the acquisition, None if the task starts acquiring with StartTask."""
+        if self.trigger_source:
+            return _terminal_name(self.trigger_source, self.device)
+        if self.sample_clock_source:
+            return _terminal_name(self.sample_clock_source, self.device)
+        return None
+
+    def AutoRegisterEveryNSamplesEvent(self, everyNsamplesEventType, nSamples, options):
+        self.samples_per_event = int(nSamples)
+        return 0
+
+    @property
+    def internal_buffer_size(self):
+        """Default NI-DAQmx input buffer size for continuous acquisitions at the task sample rate."""
+        if self.sample_rate <= 100:
+            return 1000
+        elif self.sample_rate <= 10000:
+            return 10000
+        elif self.sample_rate <= 1000000:
+            return 100000
+        return 1000000
+
+    # ---------------- TASK CONTROL ----------------
+    def StartTask(self):
+        if self.running:
+            return 0
+        self.running = True
+        self.samples_read = 0
+        self.start_time = None
+        self._stop_event.clear()
+
+        # Without start trigger the acquisition starts now, otherwise the task is armed until the terminal fires
+        if self.start_terminal is None:
+            self._begin(time.perf_counter())
+        elif self.start_terminal.split("/")[-1].startswith("PFI") \
+                and self.start_terminal.split("/")[-1] not in SIMULATION["pfi_wiring"]:
+            print(f"\033[91mSimulated DAQ task {self.taskHandle}: the start trigger {self.start_terminal} is not "
+                  f"wired to any simulated output, the task will not start\033[0m")
+
+        if self.samples_per_event and self.sample_rate:
+            self._thread = threading.Thread(target=self._event_loop, name=f"SimulatedDAQ-{self.taskHandle}",
+                                            daemon=True)
+            self._thread.start()
+        return 0
+
+    def _begin(self, start_time):
+        """First sample clock tick, the tasks using the analog start trigger or sample clock start with it."""
+        self.start_time = start_time
+        if self.analog_channels:
+            for terminal in ("ai/StartTrigger", "ai/SampleClock"):
+                _fire_terminal(f"{self.device}/{terminal}", start_time)
+
+    def StopTask(self):
+        self.running = False
+        self._stop_event.set()
+
+        # StopTask can be called from EveryNCallback, the event thread can't wait for itself
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+        return 0
+
+    def ClearTask(self):
+        self.StopTask()
+        _tasks.pop(self.taskHandle, None)
+        return 0
+
+    def EveryNCallback(self):
+        return 0
+
+    def _samples_available(self):
+        if self.start_time is None:
+            return 0
+        if SIMULATION["realtime"]:
+            return int((time.perf_counter() - self.start_time) * self.sample_rate) - self.samples_read
+        return self.samples_per_event
+
+    def _event_loop(self):
+        period = self.samples_per_event / self.sample_rate
+
+        # Armed task: wait for the start trigger
+        while self.start_time is None:
+            if self._stop_event.wait(0.005):
+                return
+
+        while not self._stop_event.is_set():
+            if SIMULATION["realtime"]:
+                # Fire the event when the next block is acquired, immediately if the callbacks are behind
+                wait = (self.samples_read + self.samples_per_event) / self.sample_rate \
+                       - (time.perf_counter() - self.start_time)
+                if wait > 0 and self._stop_event.wait(min(wait, period)):
+                    break
+                if self._samples_available() < self.samples_per_event:
+                    continue
+
+            samples_before = self.samples_read
+            try:
+                self.EveryNCallback()
+            except Exception as e:
+                print(f"\033[91mSimulated DAQ task {self.taskHandle}: exception in EveryNCallback: {e}\033[0m")
+
+            if self.samples_read == samples_before:
+                # The callback did not read the samples (the real driver would overflow), stop generating
+                break
+
+    # ---------------- READ / WRITE ----------------
+    def _read_samples(self, numSampsPerChan):
+        """First sample index of the block, waiting until it is acquired (realtime)."""
+        if not self.running:
+            raise SimulatedDAQError(f"Task {self.taskHandle} is not running")
+
+        available = self._samples_available()
+        if available > self.internal_buffer_size:
+            self.running = False
+            raise SimulatedDAQError("DAQmx error -200279: the application is not able to keep up with the hardware "
+                                    f"acquisition (simulated buffer of {self.internal_buffer_size} samples overflowed)")
+
+        while available < numSampsPerChan:
+            time.sleep((numSampsPerChan - available) / self.sample_rate)
+            available = self._samples_available()
+
+        first_sample = self.samples_read
+        self.samples_read += numSampsPerChan
+        return first_sample
+
+    def _time_axis(self, first_sample, n_samples):
+        return (first_sample + np.arange(n_samples)) / self.sample_rate
+
+    def _motor_time(self, t):
+        """
+        Time since the LinMot was enabled of the samples at the task times t, and mask of the samples acquired
+        while the trigger output was set. Without any LinMot trigger the movement starts with the task.
+        """
+        start, stop = _linmot_run["start"], _linmot_run["stop"]
+        if start is None:
+            return t - SIMULATION["enable_delay"], np.ones(len(t), dtype=bool)
+
+        clock = self.start_time + t
+        running = clock < stop if stop is not None else np.ones(len(t), dtype=bool)
+        return clock - start - SIMULATION["enable_delay"], running
+
+    def _linmot_signals(self, t):
+        """LinMot enable and up/down square waves (0/1) at the times t."""
+        motor_time, running = self._motor_time(t)
+        enable = (motor_time >= 0) & running
+        phase = np.mod(motor_time / SIMULATION["cycle_period"], 1.0)
+        up_down = enable & (phase < SIMULATION["up_fraction"])
+        return enable.astype(np.uint32), up_down.astype(np.uint32)
+
+    def _teng_signal(self, t, channel_idx):
+        """Positive pulse when the LinMot goes up (contact) and negative pulse when it goes down (separation)."""
+        period = SIMULATION["cycle_period"]
+        motor_time, running = self._motor_time(t)
+        cycle_time = np.mod(motor_time, period)
+
+        def pulse(center):
+            distance = np.abs(cycle_time - center)
+            distance = np.minimum(distance, period - distance)
+            return np.exp(-0.5 * (distance / SIMULATION["teng_pulse_width"]) ** 2)
+
+        amplitude = SIMULATION["teng_amplitude"] * (1 + 0.1 * channel_idx)
+        signal = amplitude * (pulse(0.0) - pulse(SIMULATION["up_fraction"] * period))
+        signal[(motor_time < 0) | ~running] = 0.0
+        return signal + self.rng.normal(0.0, SIMULATION["noise"], size=len(t))
+
+    def ReadAnalogF64(self, numSampsPerChan, timeout, fillMode, readArray, arraySizeInSamps, sampsPerChanRead,
+                      reserved):
+        first_sample = self._read_samples(numSampsPerChan)
+        t = self._time_axis(first_sample, numSampsPerChan)
+
+        data = readArray.reshape(numSampsPerChan, len(self.analog_channels)) \
+            if fillMode == DAQmx_Val_GroupByScanNumber else readArray.reshape(len(self.analog_channels), -1).T
+        for idx, channel in enumerate(self.analog_channels):
+            data[:, idx] = np.clip(self._teng_signal(t, idx), channel["min"], channel["max"])
+
+        _set_reference(sampsPerChanRead, numSampsPerChan)
+        return 0
+
+    def ReadDigitalU32(self, numSampsPerChan, timeout, fillMode, readArray, arraySizeInSamps, sampsPerChanRead,
+                       reserved):
+        first_sample = self._read_samples(numSampsPerChan)
+        enable, up_down = self._linmot_signals(self._time_axis(first_sample, numSampsPerChan))
+        signals = {"enable": enable, "up_down": up_down}
+
+        data = readArray.reshape(numSampsPerChan, len(self.digital_input_lines)) \
+            if fillMode == DAQmx_Val_GroupByScanNumber else readArray.reshape(len(self.digital_input_lines), -1).T
+        for idx, line in enumerate(self.digital_input_lines):
+            # Each sample is the port value, the bit of the line is in its line position
+            line_idx = _line_index(line)
+            value = SIMULATION["digital_lines"].get(line_idx, 0)
+            data[:, idx] = (signals[value] if isinstance(value, str) else np.uint32(value)) << np.uint32(line_idx)
+
+        _set_reference(sampsPerChanRead, numSampsPerChan)
+        return 0
+
+    def ReadDigitalLines(self, numSampsPerChan, timeout, fillMode, readArray, arraySizeInBytes, sampsPerChanRead,
+                         numBytesPerSamp, reserved):
+        # On-demand read of the input lines (one byte per line)
+        lines = [line for lines in self.digital_input_lines for line in _expand_lines(lines)]
+        for idx, line in enumerate(lines):
+            readArray[idx::len(lines)] = _output_lines.get(SIMULATION["loopback"].get(line), 0)
+        _set_reference(sampsPerChanRead, numSampsPerChan)
+        return 0
+
+    def WriteDigitalLines(self, numSampsPerChan, autoStart, timeout, dataLayout, writeArray, sampsPerChanWritten,
+                          reserved):
+        edge_time = time.perf_counter()
+        for line, value in zip(self.digital_output_lines, np.asarray(writeArray).ravel()):
+            if int(value) != _output_lines.get(line, 0):
+                _output_edge(line, int(value), edge_time)
+            _output_lines[line] = int(value)
+        _set_reference(sampsPerChanWritten, numSampsPerChan)
+        return 0
@@ -0,0 +1,214 @@
+"""
+Local SSH/SFTP server standing in for the Raspberry Pi.
+
+It serves the local file system through SFTP and runs the exec commands of RaspberryInterface (sha256sum, find,
+rm ...) with the local shell, so RaspberryInterface can be tested without the Raspberry: connect it to
+"127.0.0.1" and the server port, and use a local folder as remote path. The CODESYS service and power commands
+are accepted without doing anything.
+"""
+import os
+import random
+import re
+import socket
+import subprocess
+import threading
+import time
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_OK
+
+# Commands of RaspberryInterface that act on the Raspberry itself, accepted without running them
+IGNORED_COMMANDS = ("service codesyscontrol", "poweroff", "reboot")
+
+
+class _SFTPHandle(SFTPHandle):
+    def __init__(self, flags, read_delay, corruption):
+        super().__init__(flags)
+        self.read_delay = read_delay
+        self.corruption = corruption
+
+    def read(self, offset, length):
+        if self.read_delay:
+            time.sleep(self.read_delay)
+        data = super().read(offset, length)
+
+        # Flip one byte of the response to test the integrity checks
+        probability, rng = self.corruption
+        if probability and isinstance(data, bytes) and data and rng.random() < probability:
+            position = rng.randrange(len(data))
+            data = data[:position] + bytes([data[position] ^ 0xFF]) + data[position + 1:]
+        return data
+
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _SFTPServer(SFTPServerInterface):
+    """SFTP requests on the local file system, the paths are used as they are."""
+    def __init__(self, server, *args, read_delay=0.0, corruption=(0.0, None), **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.read_delay = read_delay
+        self.corruption = corruption
+
+    def list_folder(self, path):
+        try:
+            entries = []
+            for name in os.listdir(path):
+                attr = SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            binary_flag = getattr(os, "O_BINARY", 0)
+            fd = os.open(path, flags | binary_flag, 0o666)
+            if flags & os.O_WRONLY:
+                mode = "ab" if flags & os.O_APPEND else "wb"
+            elif flags & os.O_RDWR:
+                mode = "a+b" if flags & os.O_APPEND else "r+b"
+            else:
+                mode = "rb"
+            file = os.fdopen(fd, mode)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+        handle = _SFTPHandle(flags, self.read_delay, self.corruption)
+        handle.filename = path
+        handle.readfile = file
+        handle.writefile = file
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+
+class _SSHServer(paramiko.ServerInterface):
+    """Password authentication and exec/SFTP sessions."""
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._run_command, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+    @staticmethod
+    def _run_command(channel, command):
+        # The files of the stand-in belong to the local user, sudo is not needed
+        command = re.sub(r"^sudo\s+", "", command.strip())
+        if command.startswith(IGNORED_COMMANDS):
+            result = subprocess.CompletedProcess(command, 0, b"", b"")
+        else:
+            result = subprocess.run(command, shell=True, capture_output=True)
+        channel.sendall(result.stdout)
+        channel.sendall_stderr(result.stderr)
+        channel.send_exit_status(result.returncode)
+        channel.close()
+
+
+class LocalRaspberryServer:
+    """
+    SSH/SFTP server on a local port (port=0: any free port, see self.port after start()).
+    read_delay: seconds added to each SFTP read request, to emulate the slower storage of the Raspberry.
+    corrupt_probability: probability of flipping one byte of each SFTP read response (transfer errors).
+    """
+    def __init__(self, username="TENG", password="raspberry", host="127.0.0.1", port=0, read_delay=0.0,
+                 corrupt_probability=0.0, seed=0):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.read_delay = read_delay
+        self.corruption = (corrupt_probability, random.Random(seed))
+
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = None
+        self.transports = []
+        self.running = False
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(8)
+        self.port = self.socket.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                break
+
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", SFTPServer, _SFTPServer, read_delay=self.read_delay,
+                                            corruption=self.corruption)
+            transport.start_server(server=_SSHServer(self.username, self.password))
+            self.transports.append(transport)
+
+    def stop(self):
+        self.running = False
+        if self.socket is not None:
+            self.socket.close()
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from LoadData import CycleSet
+
+
+# %% --------------------------------------------------------------------------
+# CACHE CONFIGURATION
+# -----------------------------------------------------------------------------
+
+# Increase it when the cycle extraction or the metrics change, the previous entries are not used anymore
+CACHE_VERSION = 1
+
+# Block size used to hash the raw files
+HASH_BLOCK_SIZE = 1 << 20
+
+logger2 = logging.getLogger(__name__)
+
+
+def experiment_files(ExpPath):
+    '''
+    Raw data files of an experiment folder (motor HDF5/CSV and DAQ HDF5/pickle files), the inputs of ExtractCycles.
+    '''
+    return sorted(os.path.join(ExpPath, f) for f in os.listdir(ExpPath)
+                  if f.endswith('.csv') or f.endswith('.pkl')
+                  or (f.startswith(('DAQ-', 'Motor-')) and f.endswith('.h5')))
+
+
+# %% --------------------------------------------------------------------------
+# ANALYSIS CACHE
+# -----------------------------------------------------------------------------
+
+class AnalysisCache:
+    '''
+    On-disk cache of the extracted cycles and the cycle metrics of each experiment.
+
+    An entry is keyed by the content hash of the raw files of the experiment and the analysis parameters,
+    so a new or modified experiment is always recomputed. The file hashes are stored in an index with the
+    size and modification time of each file, the files are hashed again only when they change.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache folder (DataSets/AnalysisCache).
+    max_size_mb : float
+        Maximum size of the cache, the least recently used entries are evicted first.
+    max_age_days : float
+        Entries not used for this number of days are evicted.
+    '''
+
+    def __init__(self, cache_dir, max_size_mb=2048, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.max_age_days = max_age_days
+        self.index_path = os.path.join(cache_dir, 'file_index.json')
+        self._file_index = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # ---------------- KEYS ----------------
+    @property
+    def file_index(self):
+        if self._file_index is None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._file_index = json.load(f)
+            except (OSError, ValueError):
+                self._file_index = {}
+        return self._file_index
+
+    def file_hash(self, file_path):
+        '''SHA-256 of the file content, reused from the index if the size and modification time did not change.'''
+        file_path = os.path.normpath(file_path)
+        stat = os.stat(file_path)
+        entry = self.file_index.get(file_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha256.update(block)
+
+        self.file_index[file_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                      'sha256': sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def add_known_hashes(self, hashes):
+        '''
+        Adds hashes computed elsewhere (experiment catalog) to the index, {path: {size, mtime_ns, sha256}}.
+        They are only used while the size and modification time of the file match.
+        '''
+        for file_path, entry in hashes.items():
+            self.file_index.setdefault(os.path.normpath(file_path), entry)
+
+    def key(self, files, params):
+        '''Cache key of an experiment from its raw files and the analysis parameters (JSON serializable).'''
+        description = {
+            'version': CACHE_VERSION,
+            'params': params,
+            'files': sorted((os.path.basename(f), self.file_hash(f)) for f in files),
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def save_index(self):
+        # Remove the files that don't exist anymore and write the index atomically
+        self._file_index = {path: entry for path, entry in self.file_index.items() if os.path.isfile(path)}
+        temporary_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self._file_index, f, indent=1)
+        os.replace(temporary_path, self.index_path)
+
+    # ---------------- ENTRIES ----------------
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def load(self, key):
+        '''
+        Returns the cached (CycleSet, metrics DataFrame) of the key, or None if it is not in the cache.
+        '''
+        path = self.entry_path(key)
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                columns = {name: data[f'column:{name}'] for name in data['columns']}
+                cycles = CycleSet(columns, data['offsets'])
+                metrics = pd.DataFrame({name: data[f'metric:{name}'] for name in data['metrics']})
+        except Exception as e:
+            logger2.warning(f'Corrupted cache entry {os.path.basename(path)} removed: {e}.')
+            os.remove(path)
+            return None
+
+        # The modification time is the last use of the entry (least recently used eviction)
+        os.utime(path)
+        return cycles, metrics
+
+    def store(self, key, cycles, metrics):
+        '''Saves the cycles and the metrics of an experiment, it can be called from several processes.'''
+        arrays = {'columns': np.array(list(cycles.columns), dtype=str),
+                  'offsets': cycles.offsets,
+                  'metrics': np.array(list(metrics.columns), dtype=str)}
+        arrays.update({f'column:{name}': values for name, values in cycles.columns.items()})
+        arrays.update({f'metric:{name}': metrics[name].to_numpy() for name in metrics.columns})
+
+        # Write a temporary file and rename it, an entry is never read partially written
+        temporary_path = f'{self.entry_path(key)}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary_path, self.entry_path(key))
+
+    def evict(self):
+        '''
+        Removes the entries not used in max_age_days and then the least recently used entries
+        until the cache is smaller than max_size_mb. Returns the number of removed entries.
+        '''
+        entries = []
+        for file in os.listdir(self.cache_dir):
+            if file.endswith('.npz'):
+                path = os.path.join(self.cache_dir, file)
+                stat = os.stat(path)
+                entries.append([stat.st_mtime, stat.st_size, path])
+        entries.sort()
+
+        removed = 0
+        total_size = sum(size for _, size, _ in entries)
+        oldest_allowed = time.time() - self.max_age_days * 86400
+        for last_use, size, path in entries:
+            if last_use >= oldest_allowed and total_size <= self.max_size_mb * 1024 * 1024:
+                break
+            os.remove(path)
+            total_size -= size
+            removed += 1
+
+        if removed:
+            logger2.info(f'{removed} entries evicted from the analysis cache.')
+        return removed
@@ -7,7 +7,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import tkinter as tk
 from tkinter import filedialog
-from utils.ImportantFunctions import merge_DAQ_data, synchronize_dataframes
+from utils.ImportantFunctions import merge_DAQ_data, synchronize_dataframes, read_motor_file, MotColumnsRenames
 
 
 # %% --------------------------------------------------------------------------
@@ -58,18 +58,88 @@ def LTIME_to_seconds(LTIME):
     return total_time
 
 
+# Nanoseconds of each LTIME unit
+LTIME_UNITS_NS = {"d": 86_400_000_000_000,
+                  "h": 3_600_000_000_000,
+                  "m": 60_000_000_000,
+                  "s": 1_000_000_000,
+                  "ms": 1_000_000,
+                  "us": 1_000,
+                  "ns": 1}
+
+# Nanoseconds of the unit starting with each character (byte value), when the next character is not or is an 's'
+_LTIME_FACTORS = np.zeros(256, dtype=np.int64)
+_LTIME_FACTORS_BEFORE_S = np.zeros(256, dtype=np.int64)
+for _unit, _factor in LTIME_UNITS_NS.items():
+    if len(_unit) == 1:
+        _LTIME_FACTORS[ord(_unit)] = _factor
+    else:
+        _LTIME_FACTORS_BEFORE_S[ord(_unit[0])] = _factor
+_LTIME_FACTORS_BEFORE_S[[ord('d'), ord('h')]] = _LTIME_FACTORS[[ord('d'), ord('h')]]
+
+
+def LTIME_to_nanoseconds(LTIME):
+    '''
+    Vectorized LTIME parser, converts a whole column of CodeSys LTIME strings to int64 nanoseconds.
+
+    Parameters
+    ----------
+    LTIME : array-like of str
+        LTIME strings, e.g. 'LTIME#1d2h3m4s5ms6us7ns' (pd.Series, list or NumPy array).
+
+    Returns
+    -------
+    np.ndarray of int64
+        Time in nanoseconds of each string.
+
+    Notes
+    -----
+    - The strings are read as a byte matrix (one column per string) and scanned one character position at a time,
+      each step is vectorized over all the strings, so the cost is a few NumPy operations per character of
+      the longest string.
+    - The characters before the first number (the 'LTIME#' prefix) are ignored, as in LTIME_to_seconds.
+      A number not followed by one of the units of LTIME_UNITS_NS raises a ValueError.
+    '''
+    strings = np.asarray(LTIME).astype(bytes)
+    n = len(strings)
+    width = strings.dtype.itemsize
+
+    # Characters (zero padded) stored by character position, with an extra zero row to look one character ahead
+    chars = np.zeros((width + 1, n), dtype=np.uint8)
+    chars[:width] = np.frombuffer(strings.tobytes(), dtype=np.uint8).reshape(n, width).T
+
+    total = np.zeros(n, dtype=np.int64)
+    number = np.zeros(n, dtype=np.int64)
+    in_number = np.zeros(n, dtype=bool)
+    invalid = np.zeros(n, dtype=bool)
+
+    for j in range(width):
+        char, next_char = chars[j], chars[j + 1]
+        digit = (char >= ord('0')) & (char <= ord('9'))
+        number = np.where(digit, number * 10 + (char.astype(np.int64) - ord('0')), number)
+
+        # First character after a number: the unit ('m' is minutes unless it is followed by 's')
+        unit = in_number & ~digit
+        if unit.any():
+            factor = np.where(next_char == ord('s'), _LTIME_FACTORS_BEFORE_S[char], _LTIME_FACTORS[char])
+            invalid |= unit & (factor == 0)
+            total += np.where(unit, number * factor, 0)
+            number[unit] = 0
+        in_number = digit
+
+    # A number at the end of the longest strings has no unit
+    invalid |= in_number
+    if invalid.any():
+        raise ValueError(f"Invalid LTIME value: {strings[np.argmax(invalid)].decode(errors='replace')}")
+
+    return total
+
+
 # %% --------------------------------------------------------------------------
 # RENAME RAWDATA DICTIONARIES
 # -----------------------------------------------------------------------------
 
-MotColumnsRenames = {
-    'Time(s)': 'Time',
-    'MC SW Overview - Actual Position(mm)': 'Position',
-    'MC SW Force Control - Measured Force(N)': 'Force',
-    'MC SW Force Control - Target Force(N)': 'TargetForce',
-    'LINMOT_MOVING_BOOL': 'Bool1',
-    'LINMOT_UP_AND_DOWN_BOOL': 'Bool2'
-}
+# MotColumnsRenames is defined in utils.ImportantFunctions, it is also used to merge the motor files
 
 DaqColumnsRenames = {
     'Time (s)': 'Time',
@@ -85,7 +155,7 @@ DaqColumnsRenames = {
 
 def LoadMotorFile(ExpPath):
     '''
-    Loads and processes a motor CSV file.
+    Loads and processes the merged motor file (Motor-*.h5, or a CSV file for older experiments).
     
     Parameters
     ----------
@@ -98,8 +168,10 @@ def LoadMotorFile(ExpPath):
         Processed motor data or None if there is an error.
     '''
 
-    # Find files with CSV extension
-    files = [f for f in os.listdir(ExpPath) if f.endswith('.csv')]
+    # Find the merged motor file, the experiments merged before the HDF5 files have a CSV file
+    files = [f for f in os.listdir(ExpPath) if f.startswith('Motor-') and f.endswith('.h5')]
+    if not files:
+        files = [f for f in os.listdir(ExpPath) if f.endswith('.csv')]
     if len(files) == 0:
         logger0.error(f'No motor data file found in {ExpPath}.')
         return None
@@ -112,8 +184,7 @@ def LoadMotorFile(ExpPath):
     MotorFile = os.path.normpath(MotorFile)
 
     try:
-        dfMot = pd.read_csv(MotorFile, header=0, index_col=False,
-                            delimiter=',', decimal='.')
+        dfMot = read_motor_file(MotorFile)
     except Exception as e:
         logger0.error(f'Error reading Motor file {MotorFile}: {e}.')
         return None
@@ -140,9 +211,9 @@ def LoadMotorFile(ExpPath):
         'Bool2': int
     })
     
-    # Corrections Time
-    dfMot['Time'] = dfMot['Time'].apply(LTIME_to_seconds).astype(float)
-    dfMot['Time'] -= dfMot['Time'].iloc[0]
+    # Corrections Time (the first time is subtracted in nanoseconds, before the conversion to seconds)
+    time_ns = LTIME_to_nanoseconds(dfMot['Time'])
+    dfMot['Time'] = (time_ns - time_ns[0]) / 1e9
     
     # Corrections Position
     dfMot['Position'] -= dfMot['Position'].min()
@@ -160,7 +231,7 @@ def LoadMotorFile(ExpPath):
 
 def LoadDAQData(ExpPath):
     '''
-    Loads and processes a DAQ pickle file.
+    Loads and processes the DAQ files (HDF5 or pickle) of an experiment.
     
     Parameters
     ----------
@@ -173,8 +244,8 @@ def LoadDAQData(ExpPath):
         Processed DAQ data or None if there is an error.
     '''
 
-    # Read the DAQ Data
-    dfDaq = merge_DAQ_data(ExpPath)
+    # Read the DAQ Data (only the channels used in the analysis are read from the HDF5 files)
+    dfDaq = merge_DAQ_data(ExpPath, channels=list(DaqColumnsRenames.keys()))
     
     # Drop non-defined columns:
     dropcols = [col for col in dfDaq.columns if col not in DaqColumnsRenames]
@@ -221,27 +292,246 @@ def FindCycles(df):
     -------
     list of [start, end]
         List of cycles represented by their star and end indices.
+
+    Notes
+    -----
+    The state changes are detected with NumPy, a cycle starts when the state changes to 2 and ends
+    before the next change to 2 or 0. A cycle running at the first sample is not considered.
     '''
-    state_series = df['Bool1'] + df['Bool2']
-    cycles = []
-    prev_state = state_series.iloc[0]
-    start = None
-    
-    for i, s in enumerate(state_series[1:], start=1):
-        if s != prev_state:
-            if s == 2:
-                if start is not None:
-                    cycles.append([start, i - 1])
-                start = i
-            elif s == 0 and start is not None:
-                cycles.append([start, i - 1])
-                start = None
-            prev_state = s
+    state = (df['Bool1'] + df['Bool2']).to_numpy()
+    if len(state) == 0:
+        return []
+
+    # Indices where the state changes, only the changes to 2 (cycle start) and 0 (cycle end) are events
+    changes = np.flatnonzero(state[1:] != state[:-1]) + 1
+    changes_state = state[changes]
+    events = changes[(changes_state == 2) | (changes_state == 0)]
+    is_start = state[events] == 2
+
+    # A cycle ends just before the next event (a new start or a stop) or at the last sample
+    next_event = np.append(events[1:], len(state))
+    starts = events[is_start]
+    ends = next_event[is_start] - 1
+
+    return np.column_stack((starts, ends)).tolist()
+
+
+# %% --------------------------------------------------------------------------
+# CYCLE INDEX STRUCTURE
+# -----------------------------------------------------------------------------
+
+def _concatenated_ranges(starts, lengths):
+    '''Indices of the concatenated ranges [start, start + length) without a Python loop.'''
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    return np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+
+class Cycle:
+    '''
+    Single cycle of a CycleSet. The columns are views of the CycleSet arrays (no data is copied),
+    they are accessed as cycle['Voltage'] or cycle.Voltage.
+    '''
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __len__(self):
+        return len(next(iter(self._columns.values())))
+
+    @property
+    def columns(self):
+        return list(self._columns.keys())
+
+    def to_frame(self):
+        return pd.DataFrame({name: values.copy() for name, values in self._columns.items()})
+
+
+class CycleSet:
+    '''
+    Cycles of an experiment stored as contiguous NumPy column arrays plus an offsets array.
+    
+    The rows of the cycle k are offsets[k]:offsets[k + 1] of every column, so the cycles are views
+    of the column arrays instead of one DataFrame per cycle.
+    
+    Parameters
+    ----------
+    columns : dict of np.ndarray
+        Column arrays with the rows of all the cycles one after the other.
+    offsets : np.ndarray
+        Start row of each cycle and the total number of rows (length = number of cycles + 1).
+    '''
+
+    def __init__(self, columns, offsets):
+        self.columns = columns
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def empty(cls):
+        return cls({}, [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Cycle {idx} out of range ({len(self)} cycles)')
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return Cycle({name: values[start:end] for name, values in self.columns.items()})
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def items(self):
+        '''Iterate (cycle index, cycle) pairs.'''
+        return enumerate(self)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def cycle_index(self):
+        '''Cycle number of each row of the column arrays.'''
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def to_frame(self, cycle_column=None):
+        '''
+        Concatenated DataFrame of all the cycles.
         
-    if start is not None:
-        cycles.append([start, len(state_series) - 1])
+        Parameters
+        ----------
+        cycle_column : str, optional
+            If given, a column with this name stores the cycle number of each row.
+        '''
+        df = pd.DataFrame(self.columns)
+        if cycle_column:
+            df[cycle_column] = self.cycle_index()
+        return df
+
+
+def _first_index_per_cycle(mask, starts, ends):
+    '''First index of each [start, end] interval where mask is True (-1 if there is none).'''
+    positions = np.flatnonzero(mask)
+    idx = np.searchsorted(positions, starts)
+    first = np.full(len(starts), -1, dtype=np.int64)
+    found = idx < len(positions)
+    first[found] = positions[idx[found]]
+    first[first > ends] = -1
+    return first
+
+
+def _interpolate_segments(xp_col, fp_col, x_col, src_starts, src_ends, dst_bounds):
+    '''
+    Interpolate fp(xp) at x for many segments in one np.interp call.
+    
+    The source segment k (rows src_starts[k]:src_ends[k] of xp_col/fp_col) is interpolated at the rows
+    dst_bounds[k]:dst_bounds[k + 1] of x_col (the destination segments cover x_col one after the other).
+    As in a per-segment np.interp, the NaN values are ignored, the values outside the segment take the
+    value of its first/last point and the segments with less than two points or a non increasing xp are 0.
+    '''
+    result = np.zeros(len(x_col), dtype=float)
+
+    # Valid (non NaN) source points and their bounds for each segment
+    valid = np.flatnonzero(~np.isnan(fp_col))
+    xp = xp_col[valid]
+    fp = fp_col[valid]
+    a = np.searchsorted(valid, src_starts)
+    b = np.searchsorted(valid, src_ends)
+
+    # Segments with non increasing xp are not interpolated
+    not_increasing = np.diff(xp) <= 0
+    bad_count = np.concatenate(([0], np.cumsum(not_increasing)))
+    ok = (b - a) > 1
+    ok[ok] = bad_count[b[ok] - 1] - bad_count[a[ok]] == 0
+    if not ok.any():
+        return result
+
+    repeats = np.diff(dst_bounds)
+    if not not_increasing.any():
+        # Clipping x to the bounds of its own segment keeps the single interpolation inside each segment
+        lower = np.where(ok, xp_col[valid[np.minimum(a, len(valid) - 1)]], 0)
+        upper = np.where(ok, xp_col[valid[np.maximum(b - 1, 0)]], 0)
+        result[:] = np.interp(np.clip(x_col, np.repeat(lower, repeats), np.repeat(upper, repeats)), xp, fp)
+        if not ok.all():
+            result[np.repeat(~ok, repeats)] = 0
+    else:
+        # The source data is not increasing outside the valid segments, they are interpolated one by one
+        for k in np.flatnonzero(ok):
+            rows = slice(dst_bounds[k], dst_bounds[k + 1])
+            result[rows] = np.interp(x_col[rows], xp[a[k]:b[k]], fp[a[k]:b[k]])
+
+    return result
+
+
+def SplitCycles(dfMot, dfDaq, MotCycles, DaqCycles):
+    '''
+    Builds the CycleSet of the synchronized Motor and DAQ data.
+    
+    The DAQ rows of each cycle are kept and the motor columns are interpolated at the DAQ time,
+    separately for the down phase (before the first Bool2 == 1) and the up phase of each cycle.
+    The cycles without up phase in the Motor or the DAQ data are dropped.
+    
+    Parameters
+    ----------
+    dfMot, dfDaq : pd.DataFrame
+        Synchronized Motor and DAQ data with a 'Time' column.
+    MotCycles, DaqCycles : list of [start, end]
+        Cycles found with FindCycles, the cycles are paired by their position.
     
-    return cycles
+    Returns
+    -------
+    CycleSet
+        Cycles data with the DAQ columns and the interpolated motor columns.
+    '''
+    nCycles = min(len(MotCycles), len(DaqCycles))
+    if nCycles == 0:
+        return CycleSet.empty()
+
+    mot_bounds = np.asarray(MotCycles[:nCycles], dtype=np.int64).reshape(-1, 2)
+    daq_bounds = np.asarray(DaqCycles[:nCycles], dtype=np.int64).reshape(-1, 2)
+
+    # First up-phase sample of each cycle, incomplete cycles are dropped
+    mot_up = _first_index_per_cycle(dfMot['Bool2'].to_numpy() == 1, mot_bounds[:, 0], mot_bounds[:, 1])
+    daq_up = _first_index_per_cycle(dfDaq['Bool2'].to_numpy() == 1, daq_bounds[:, 0], daq_bounds[:, 1])
+    complete = (mot_up >= 0) & (daq_up >= 0)
+    mot_bounds, daq_bounds = mot_bounds[complete], daq_bounds[complete]
+    mot_up, daq_up = mot_up[complete], daq_up[complete]
+
+    # DAQ rows of the cycles, one contiguous array per column
+    lengths = daq_bounds[:, 1] - daq_bounds[:, 0] + 1
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    rows = _concatenated_ranges(daq_bounds[:, 0], lengths)
+    columns = {col: dfDaq[col].to_numpy()[rows] for col in dfDaq.columns}
+
+    # Down and up segments of each cycle in the motor data and in the CycleSet rows
+    up_rows = offsets[:-1] + (daq_up - daq_bounds[:, 0])
+    src_starts = np.column_stack((mot_bounds[:, 0], mot_up)).ravel()
+    src_ends = np.column_stack((mot_up, mot_bounds[:, 1] + 1)).ravel()
+    dst_bounds = np.append(np.column_stack((offsets[:-1], up_rows)).ravel(), offsets[-1])
+
+    # Interpolate the motor columns using DAQ sampling rate as the reference
+    mot_time = dfMot['Time'].to_numpy(dtype=float)
+    for col in dfMot.columns:
+        if col == 'Time' or col == 'State':
+            continue
+        columns[col] = _interpolate_segments(mot_time, dfMot[col].to_numpy(dtype=float), columns['Time'],
+                                             src_starts, src_ends, dst_bounds)
+
+    return CycleSet(columns, offsets)
 
 
 # %% --------------------------------------------------------------------------
@@ -259,18 +549,18 @@ def ExtractCycles(ExpPath):
     
     Returns
     -------
-    Cycles : list[pd.DataFrame]
-        List of DataFrames, each containing data for a single cycle.
+    Cycles : CycleSet
+        Cycles data, each cycle is a view of the CycleSet column arrays.
     '''
     # Load Motor data
     dfMot = LoadMotorFile(ExpPath)
     if dfMot is None:
-        return []
+        return CycleSet.empty()
     
     # Load DAQ data
     dfDaq = LoadDAQData(ExpPath)
     if dfDaq is None:
-        return []
+        return CycleSet.empty()
     
     # Motor sampling rate
     MotFs = 1 / dfMot['Time'].diff().mean()
@@ -332,61 +622,8 @@ def ExtractCycles(ExpPath):
     DaqCycles = FindCycles(dfDaq)
     if len(MotCycles) != len(DaqCycles):
         logger0.info(f'Different number of cycles: Motor={len(MotCycles)}, DAQ={len(DaqCycles)}. Using minimum.')
-    nCycles = min(len(MotCycles), len(DaqCycles))
-    
-    Cycles = []
-    for idx in range(nCycles):
-
-        # Obtain data from the idx cycle interval (we are iterating for each cycle interval)
-        dfcyM = dfMot.iloc[MotCycles[idx][0] : MotCycles[idx][1] + 1].reset_index(drop=True)
-        dfcyD = dfDaq.iloc[DaqCycles[idx][0] : DaqCycles[idx][1] + 1].reset_index(drop=True)
-
-        # Find the first index where (State == 1) in the cycle interval for the Motor
-        mask = dfcyM['Bool2'].eq(1)
-        if mask.any():
-            i = mask.idxmax()
-        else:
-            # Incomplete cycle
-            continue
-
-        # Find the first index where (State == 1) in the cycle interval for the DAQ
-        mask = dfcyD['Bool2'].eq(1)
-        if mask.any():
-            j = mask.idxmax()
-        else:
-            # Incomplete cycle
-            continue
-
-        # Interpolate the data columns using DAQ sampling rate as the reference
-        for col in dfcyM.columns:
-            if col == 'Time' or col == 'State':
-                continue
-
-            # Create in the DAQ a new column to store the motor data
-            dfcyD[col] = np.zeros(len(dfcyD), dtype=float)
-
-            # Down-phase interpolation
-            valid_mask_down = dfcyM[col].iloc[:i].notna()
-            xp = dfcyM['Time'].iloc[:i][valid_mask_down].values
-            fp = dfcyM[col].iloc[:i][valid_mask_down].values
-            x = dfcyD['Time'].iloc[:j].values
-
-            if np.all(np.diff(xp) > 0) and len(xp) > 1:
-                dfcyD.loc[dfcyD.index[:j], col] = np.interp(x, xp, fp)
-
-            # Up-phase interpolation
-            valid_mask_up = dfcyM[col].iloc[i:].notna()
-            xp = dfcyM['Time'].iloc[i:][valid_mask_up].values
-            fp = dfcyM[col].iloc[i:][valid_mask_up].values
-            x = dfcyD['Time'].iloc[j:].values
-
-            if np.all(np.diff(xp) > 0) and len(xp) > 1:
-                dfcyD.loc[dfcyD.index[j:], col] = np.interp(x, xp, fp)
-        
-        # Keep the resulting cycle
-        Cycles.append(dfcyD)
     
-    return Cycles
+    return SplitCycles(dfMot, dfDaq, MotCycles, DaqCycles)
 
 # %% --------------------------------------------------------------------------
 # LOAD RAWDATA FILES AND PLOT POSITION AND VOLTAGE
@@ -406,8 +643,8 @@ if __name__ == '__main__':
     
     if ExpPath:
         ExpPath = os.path.normpath(ExpPath)
-        Cycles_list = ExtractCycles(ExpPath)
-        dfData_all = pd.concat(Cycles_list, ignore_index=True)
+        Cycles = ExtractCycles(ExpPath)
+        dfData_all = Cycles.to_frame()
         dfData_all.to_excel(os.path.join(ExpPath, 'Data.xlsx'), index=False)
         
         if dfData_all is not None:
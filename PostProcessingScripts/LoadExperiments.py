@@ -1,6 +1,9 @@
 import os
+import io
+import argparse
 import logging
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import tkinter as tk
@@ -11,7 +14,9 @@ from matplotlib.backends.backend_pdf import PdfPages
 from scipy.signal import peak_widths
 from scipy.integrate import simpson as simps
 from openpyxl.utils import get_column_letter
-from LoadData import LoadFiles
+from LoadData import ExtractCycles
+from AnalysisCache import AnalysisCache, experiment_files
+from ClassStructures.ExperimentIndex import ExperimentIndex, index_path, describe_file
 
 
 # %% --------------------------------------------------------------------------
@@ -35,24 +40,100 @@ logger1 = logging.getLogger(__name__)
 if __name__ == "__main__":
     logger1.setLevel(logging.INFO)
 
+    # Interactive backend only in the main process, the batch workers render the figures with Agg
+    mpl.use("Qt5Agg")
+    plt.close("all")
+    plt.ion()
 
-mpl.use("Qt5Agg")
-plt.close("all")
-plt.ion()
+# Resolution of the figures rendered by the batch workers and embedded in the PDF report
+PAGE_DPI = 150
 
 
 # %% --------------------------------------------------------------------------
 # PATHS DEFINITION AND DATA INITIALIZATION
 # -----------------------------------------------------------------------------
 
+def _sheet_records(df):
+    """Rows of a spreadsheet DataFrame as dictionaries, with None instead of NaN."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def _sheet_row_key(row_number):
+    """Catalog key of an Experiments.ods row without ExpId (spreadsheet row number, header in row 1)."""
+    return f"Experiments.ods row {row_number}"
+
+
+def _exp_id_text(exp_id):
+    """Experiment id as text, the whole numbers read as float (ExpId column with empty cells) without '.0'."""
+    if exp_id is None:
+        return None
+    if isinstance(exp_id, (float, np.floating)) and float(exp_id).is_integer():
+        return str(int(exp_id))
+    return str(exp_id)
+
+
+def update_catalog(catalog, rawdata_dir):
+    """
+    Imports the Experiments.ods and LoadsDescription.ods spreadsheets into the experiment catalog.
+
+    Parameters
+    ----------
+    catalog : ExperimentIndex
+        Experiment catalog of the RawData folder.
+    rawdata_dir : str
+        Path to the RawData folder.
+
+    Notes
+    -----
+    - Each spreadsheet is parsed only when it was modified since the last import (modification time stored in
+      the catalog), the experiments saved by the acquisition are added to the catalog when they are finalized.
+    - The DaqFile and MotorFile paths of Experiments.ods are cataloged with their size, the hashes are
+      computed by the AnalysisCache when the experiments are analyzed (the cataloged hashes of the unchanged
+      files are kept).
+    - The rows without ExpId are cataloged with their spreadsheet row number as key, the keys of the previous
+      import that are not in the spreadsheet anymore are removed, so a new import replaces these rows.
+    """
+    exps_file = os.path.join(rawdata_dir, "Experiments.ods")
+    if os.path.isfile(exps_file) and os.stat(exps_file).st_mtime_ns != catalog.get_info("exps_sheet_mtime_ns"):
+        logger1.info("Importing Experiments.ods into the experiment catalog...")
+        df_sheet = pd.read_excel(exps_file)
+        file_columns = [col for col in ("DaqFile", "MotorFile") if col in df_sheet.columns]
+        rows = _sheet_records(df_sheet.drop(columns=file_columns))
+        exp_ids = [_exp_id_text(row.get("ExpId")) or _sheet_row_key(n + 2) for n, row in enumerate(rows)]
+        folders = [os.path.dirname(path) if isinstance(path, str) else None
+                   for path in df_sheet.get("DaqFile", pd.Series([None] * len(df_sheet)))]
+        catalog.add_many(rows, exp_ids=exp_ids, folders=folders)
+
+        for exp_id, sheet_row in zip(exp_ids, _sheet_records(df_sheet[file_columns])):
+            files = []
+            for column, kind in (("DaqFile", "daq"), ("MotorFile", "motor")):
+                path = sheet_row.get(column)
+                if isinstance(path, str) and os.path.isfile(os.path.join(rawdata_dir, path)):
+                    description = describe_file(os.path.join(rawdata_dir, path), hash_file=False)
+                    description.update(path=os.path.normpath(path), kind=kind)
+                    files.append(description)
+            catalog.set_files(exp_id, files)
+
+        row_keys = [exp_id for exp_id, row in zip(exp_ids, rows) if _exp_id_text(row.get("ExpId")) is None]
+        catalog.remove(set(catalog.get_info("exps_sheet_row_keys", [])) - set(row_keys))
+        catalog.set_info("exps_sheet_row_keys", row_keys)
+        catalog.set_info("exps_sheet_mtime_ns", os.stat(exps_file).st_mtime_ns)
+
+    loads_file = os.path.join(rawdata_dir, "LoadsDescription.ods")
+    if os.path.isfile(loads_file) and os.stat(loads_file).st_mtime_ns != catalog.get_info("loads_sheet_mtime_ns"):
+        logger1.info("Importing LoadsDescription.ods into the experiment catalog...")
+        catalog.set_loads(_sheet_records(pd.read_excel(loads_file)))
+        catalog.set_info("loads_sheet_mtime_ns", os.stat(loads_file).st_mtime_ns)
+
+
 def select_paths():
     """
-    Opens file dialogs to select directories and configuration files.
+    Opens file dialogs to select directories and selects the experiments of a TribuId in the experiment catalog.
     
     Returns
     -------
     df_exps : pd.DataFrame or None
-        Experiment metadata with merged load info.
+        Experiment metadata with merged load info. The cataloged file hashes are in df_exps.attrs["file_hashes"].
     reports_dir : str or None
         Path to the directory where PDF reports are stored.
     datasets_dir : str or None
@@ -86,70 +167,54 @@ def select_paths():
     datasets_dir = os.path.join(exps_dir, "DataSets")
     os.makedirs(datasets_dir, exist_ok=True)
     
-    # Define Experiments file
-    exps_file = os.path.join(rawdata_dir, "Experiments.ods")
-    if not os.path.isfile(exps_file):
-        logger1.error("Could not find Experiments.ods file in experiments directory.")
-        return None, None, None
+    # Open the experiment catalog, the spreadsheets are imported only when they were modified
+    with ExperimentIndex(index_path(rawdata_dir)) as catalog:
+        update_catalog(catalog, rawdata_dir)
+        if len(catalog) == 0:
+            logger1.error("No experiments found: the experiment catalog is empty and there is no Experiments.ods file.")
+            return None, None, None
+        
+        # Ask for TribuId value
+        logger1.req("Please provide a TribuId value to analyze.")
+        tribu_id = simpledialog.askstring(title="TribuId Selection", prompt="Enter a valid TribuId value:")
+        if not tribu_id:
+            logger1.info("TribuId selection canceled.")
+            return None, None, None
+        
+        # Indexed selection, the load parameters and the file paths are joined by the catalog
+        df_exps = pd.DataFrame(catalog.catalog(TribuId=tribu_id))
+        if df_exps.empty:
+            logger1.error(f"Invalid TribuId value: {tribu_id}")
+            return None, None, None
+        logger1.info(f"TribuId value correctly saved: {tribu_id}")
+        file_hashes = catalog.file_hashes(df_exps.ExpId.dropna())
     
-    # Define LoadsDescription file
-    loads_file = os.path.join(rawdata_dir, "LoadsDescription.ods")
-    if not os.path.isfile(loads_file):
-        logger1.error("Could not find LoadsDescription.ods file in experiments directory.")
-        return None, None, None
+    # Loads not found in the catalog
+    loads_fields = ["Req", "Gain", "Ceq"]
+    missing_load = df_exps.Req.isna()
+    electrode = missing_load & (df_exps.RloadId == "ElectrodeImpedance")
+    if electrode.any():
+        logger1.warning(f"Load ElectrodeImpedance assigned to 80 kOhms ({electrode.sum()} experiments).")
+        df_exps.loc[electrode, loads_fields] = [80e3, 1, None]
+    open_circuit = missing_load & ~electrode
+    for rload_id in df_exps.loc[open_circuit, "RloadId"].unique():
+        logger1.warning(f"Load {rload_id} not found. Assigned open circuit.")
+    df_exps.loc[open_circuit, loads_fields] = [float("inf"), 1, None]
     
-    # Load ExpsDescription and LoadDescription files
-    df_exps = pd.read_excel(exps_file)
-    df_loads = pd.read_excel(loads_file)
+    # Check files existence (only the files of the selected experiments)
+    for column in ("DaqFile", "MotorFile"):
+        exists = np.fromiter((isinstance(path, str) and os.path.isfile(path) for path in df_exps[column]),
+                             dtype=bool, count=len(df_exps))
+        for exp_id, path in df_exps.loc[~exists, ["ExpId", column]].itertuples(index=False):
+            logger1.warning(f"File {path} not found. Experiment {exp_id} dropped.")
+        df_exps = df_exps[exists]
     
-    # Ask for TribuId value
-    logger1.req("Please provide a TribuId value to analyze.")
-    tribu_id = simpledialog.askstring(title="TribuId Selection", prompt="Enter a valid TribuId value:")
-    if not tribu_id:
-        logger1.info("TribuId selection canceled.")
-        return None, None, None
-    elif tribu_id in df_exps['TribuId'].dropna().unique():
-        logger1.info(f"TribuId value correctly saved: {tribu_id}")
-        df_exps = df_exps[df_exps['TribuId'] == tribu_id]
-    else:
-        logger1.error(f"Invalid TribuId value: {tribu_id}")
+    if df_exps.empty:
+        logger1.error(f"No experiment of TribuId {tribu_id} has its data files.")
         return None, None, None
     
-    # Merge with load info
-    loads_fields = ("Req", "Gain", "Ceq")
-    for field in loads_fields:
-        if field not in df_exps.columns:
-            df_exps.insert(2, field, None)
-    
-    for idx, row in df_exps.iterrows():
-        if row.RloadId in df_loads.RloadId.values:
-            for field in loads_fields:
-                df_exps.loc[idx, field] = df_loads.loc[df_loads.RloadId == row.RloadId, field].values[0]
-        elif row.RloadId == "ElectrodeImpedance":
-            logger1.warning(f"Load {row.RloadId} is Electrode Impedance. Assigned to 80 kOhms.")
-            df_exps.loc[idx, loads_fields] = [80e3, 1, None]
-        else:
-            logger1.warning(f"Load {row.RloadId} not found. Assigned open circuit.")
-            df_exps.loc[idx, loads_fields] = [float("inf"), 1, None]
-        
-        # Check files existence
-        daq_file = os.path.join(rawdata_dir, row.DaqFile)
-        motor_file = os.path.join(rawdata_dir, row.MotorFile)
-        
-        if os.path.isfile(daq_file):
-            df_exps.loc[idx, "DaqFile"] = daq_file
-        else:
-            logger1.warning(f"File {daq_file} not found. Experiment {row.ExpId} dropped.")
-            df_exps.drop(idx, inplace=True)
-            continue
-        
-        if os.path.isfile(motor_file):
-            df_exps.loc[idx, "MotorFile"] = motor_file
-        else:
-            logger1.warning(f"File {motor_file} not found. Experiment {row.ExpId} dropped.")
-            df_exps.drop(idx, inplace=True)
-            continue
-    
+    df_exps = df_exps.reset_index(drop=True)
+    df_exps.attrs["file_hashes"] = file_hashes
     return df_exps, reports_dir, datasets_dir
 
 
@@ -158,28 +223,29 @@ def select_paths():
 # -----------------------------------------------------------------------------
 
 def cycle_analysis(cycle, req_value):
-    """Analyzes a single cycle and returns metrics as dict."""
+    """Analyzes a single cycle (a CycleSet cycle, the columns are NumPy views) and returns metrics as dict."""
     
-    imax = cycle.Voltage.idxmax()
-    imin = cycle.Voltage.idxmin()
+    time = cycle["Time"]
+    voltage = cycle["Voltage"]
+    imax = np.nanargmax(voltage)
+    imin = np.nanargmin(voltage)
+    dt = np.mean(np.diff(time))
     
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
-        pos_width = peak_widths(cycle.Voltage.values, [imax], rel_height=0.5)[0][0] * cycle.Time.diff().mean()
-        neg_width = peak_widths(cycle.Voltage.values, [imin], rel_height=0.5)[0][0] * cycle.Time.diff().mean()
-    
-    cycle["Power"] = cycle["Voltage"]**2 / req_value
+        pos_width = peak_widths(voltage, [imax], rel_height=0.5)[0][0] * dt
+        neg_width = peak_widths(voltage, [imin], rel_height=0.5)[0][0] * dt
     
-    cycle_pos = cycle[cycle["Voltage"] > 0].copy()
-    cycle_neg = cycle[cycle["Voltage"] < 0].copy()
-    cycle_neg["Voltage"] = -cycle_neg["Voltage"]
+    power = voltage**2 / req_value
+    pos = voltage > 0
+    neg = voltage < 0
     
-    return {"VoltageMax": cycle.loc[imax, "Voltage"],
-            "VoltageMin": cycle.loc[imin, "Voltage"],
+    return {"VoltageMax": voltage[imax],
+            "VoltageMin": voltage[imin],
             "PosPeakWidth": pos_width,
             "NegPeakWidth": neg_width,
-            "PosEnergy": simps(cycle_pos["Power"], x=cycle_pos["Time"]),
-            "NegEnergy": simps(cycle_neg["Power"], x=cycle_neg["Time"]),
+            "PosEnergy": simps(power[pos], x=time[pos]),
+            "NegEnergy": simps(power[neg], x=time[neg]),
     }
 
 
@@ -244,10 +310,11 @@ PLOTS_CONFIGURATION = {
 }
 
 # --- Experiment Analysis Function ---
-def experiment_analysis(row, df_data, cycles_list, pdf):
-    """Analyze a single experiment and append figures to a PDF."""
+def experiment_analysis(row, df_data, cycles, pdf, exp_df=None):
+    """Analyze a single experiment (cycles is the CycleSet returned by ExtractCycles) and append figures to a PDF.
+    If the cycle metrics exp_df are given (analysis cache) they are not computed again."""
 
-    exp_df = pd.DataFrame()
+    exp_metrics = []
 
     # Create figures
     overlapped_cycles, ax_overlapped = plt.subplots()
@@ -255,15 +322,15 @@ def experiment_analysis(row, df_data, cycles_list, pdf):
     first = True
 
     # Iterate over cycles
-    for cy_idx, cycle in cycles_list:
+    for cy_idx, cycle in cycles.items():
 
         # Determine cycle range to plot
         cy_min = PLOTS_CONFIGURATION["cy_min"] or 0
-        cy_max = PLOTS_CONFIGURATION["cy_max"] or len(cycles_list) - 1
+        cy_max = PLOTS_CONFIGURATION["cy_max"] or len(cycles) - 1
 
         if cy_min <= cy_idx <= cy_max:
-            t_rel = cycle["Time"] - cycle["Time"].iloc[0]
-            ax_sequential.axvline(x=cycle["Time"].iloc[-1], color="cyan", linestyle=":")
+            t_rel = cycle["Time"] - cycle["Time"][0]
+            ax_sequential.axvline(x=cycle["Time"][-1], color="cyan", linestyle=":")
             
             # Plot each signal
             for signal in list(PLOTS_CONFIGURATION.values())[2:]:
@@ -285,14 +352,16 @@ def experiment_analysis(row, df_data, cycles_list, pdf):
             first = False
 
         # Compute metrics for cycles except the first one
-        if cy_idx > 0:
+        if cy_idx > 0 and exp_df is None:
             metrics = cycle_analysis(cycle, row.Req)
             metrics["cy_idx"] = cy_idx
             metrics["TotEnergy"] = metrics["PosEnergy"] + metrics["NegEnergy"]
-            temp_df = pd.DataFrame([metrics])
-            cols = ["cy_idx"] + [c for c in temp_df.columns if c != "cy_idx"]
-            temp_df = temp_df[cols]
-            exp_df = pd.concat([exp_df, temp_df], ignore_index=True)
+            exp_metrics.append(metrics)
+
+    if exp_df is None:
+        exp_df = pd.DataFrame(exp_metrics)
+        if not exp_df.empty:
+            exp_df = exp_df[["cy_idx"] + [c for c in exp_df.columns if c != "cy_idx"]]
 
     # Configure and save overlapped cycles figure
     ax_overlapped.set_xlabel("Time per cycle (s)")
@@ -395,62 +464,166 @@ def generate_summary_plots(summary_df, pdf):
 # MAIN PIPELINE
 # -----------------------------------------------------------------------------
 
-def main():
+class FigurePages:
+    """Stands for PdfPages in the batch workers: the figures are stored as PNG pages to be merged in order."""
+
+    def __init__(self, dpi=PAGE_DPI):
+        self.dpi = dpi
+        self.pages = []
+
+    def savefig(self, figure=None):
+        figure = figure or plt.gcf()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", dpi=self.dpi)
+        self.pages.append(buffer.getvalue())
+
+
+def add_png_page(pdf, png, dpi=PAGE_DPI):
+    """Appends a PNG page rendered by a batch worker to the PDF report."""
+    image = plt.imread(io.BytesIO(png), format="png")
+    height, width = image.shape[:2]
+    figure = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    figure.figimage(image, 0, 0)
+    pdf.savefig(figure, dpi=dpi)
+    plt.close(figure)
+
+
+def _init_worker():
+    mpl.use("Agg")
+    logger1.setLevel(logging.INFO)
+
+
+def process_experiment(row, cache_dir=None, cache_key=None):
+    """
+    Loads, analyzes and plots a single experiment (one row of df_exps), it runs in the batch workers.
+    The cycles and metrics are read from the analysis cache if the entry cache_key exists.
+
+    Returns
+    -------
+    tuple or None
+        (exp_summary, exp_df, pages) with the figures as PNG pages, None if the experiment is dropped.
+    """
+    logger1.info(f"\nProcessing: {row.ExpId}")
+    cache = AnalysisCache(cache_dir) if cache_key else None
+    cached = cache.load(cache_key) if cache else None
+    if cached:
+        logger1.info(f"Experiment {row.ExpId}: cycles and metrics loaded from the analysis cache.")
+        cycles, exp_df = cached
+    else:
+        cycles = ExtractCycles(os.path.dirname(row.DaqFile))
+        exp_df = None
+
+    if len(cycles) == 0:
+        logger1.warning(f"Experiment {row.ExpId} dropped.")
+        return None
+    df_data = cycles.to_frame()
+
+    if "Current" not in df_data or np.all(df_data["Current"] == 0):
+        logger1.warning(f"Column Current not found in experiment {row.ExpId}. Cannot verify Ohm's Law.")
+    else:
+        i_theo = df_data["Voltage"] / (row.Req/1e6)
+        ratio = df_data["Current"] / i_theo
+        tolerance = np.abs(1 - ratio).max()
+        logger1.info(f"Experiment {row.ExpId}: Ohm's Law satisfied within {100*tolerance:.0f}% tolerance.")
+
+    pages = FigurePages()
+    computed = exp_df is None
+    exp_df = experiment_analysis(row, df_data, cycles, pages, exp_df=exp_df)
+    if cache and computed:
+        cache.store(cache_key, cycles, exp_df)
+
+    exp_summary = {
+        "ExpId": row.ExpId,
+        "TribuId": row.TribuId,
+        "Date": row.Date,
+        # "Temperature": row.Temperature,
+        # "Humidity": row.Humidity,
+        "Req": row.Req,
+        "NumCycles": len(cycles),
+        "Duration": df_data.Time.iloc[-1],
+        "AvgVoltageMax": exp_df.VoltageMax.mean(),
+        "VarVoltageMax": exp_df.VoltageMax.var(),
+        "AvgVoltageMin": exp_df.VoltageMin.mean(),
+        "VarVoltageMin": exp_df.VoltageMin.var(),
+        "AvgPosPeakWidth": exp_df.PosPeakWidth.mean(),
+        "VarPosPeakWidth": exp_df.PosPeakWidth.var(),
+        "AvgNegPeakWidth": exp_df.NegPeakWidth.mean(),
+        "VarNegPeakWidth": exp_df.NegPeakWidth.var(),
+        "AvgPosEnergy": exp_df.PosEnergy.mean(),
+        "VarPosEnergy": exp_df.PosEnergy.var(),
+        "AvgNegEnergy": exp_df.NegEnergy.mean(),
+        "VarNegEnergy": exp_df.NegEnergy.var(),
+        "AvgTotEnergy": exp_df.TotEnergy.mean(),
+        "VarTotEnergy": exp_df.TotEnergy.var()
+    }
+    return exp_summary, exp_df, pages.pages
+
+
+def run_batch(df_exps, jobs=None, cache=None):
+    """
+    Processes the experiments in a process pool (jobs workers, all the CPUs by default).
+
+    The results are returned in the df_exps order whatever the order the workers finish.
+    With an AnalysisCache only the new or modified experiments are analyzed again.
+    """
+    rows = [row for _, row in df_exps.iterrows()]
+    jobs = jobs or os.cpu_count() or 1
+
+    # The cache keys are computed here, so the file hash index is only updated by this process
+    if cache is not None:
+        keys = [cache.key(experiment_files(os.path.dirname(row.DaqFile)), {"Req": row.Req}) for row in rows]
+        cache.save_index()
+        cache_dir = cache.cache_dir
+    else:
+        keys = [None] * len(rows)
+        cache_dir = None
+
+    # A failing experiment is logged and dropped (None result) without stopping the batch
+    results = []
+    if jobs == 1 or len(rows) <= 1:
+        for row, key in zip(rows, keys):
+            try:
+                results.append(process_experiment(row, cache_dir, key))
+            except Exception as e:
+                logger1.error(f"Experiment {row.ExpId} failed: {e}. Experiment dropped.")
+                results.append(None)
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(rows)), initializer=_init_worker) as executor:
+        futures = [executor.submit(process_experiment, row, cache_dir, key) for row, key in zip(rows, keys)]
+        for row, future in zip(rows, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger1.error(f"Experiment {row.ExpId} failed: {e}. Experiment dropped.")
+                results.append(None)
+    return results
+
+
+def main(jobs=None, use_cache=True):
     df_exps, reports_dir, datasets_dir = select_paths()
     
     if df_exps is None:
         return
     
     plt.ioff()
-    exps_summary = []
     tribu_id = df_exps.TribuId.unique()[0]
     
     pdf_path = os.path.join(reports_dir, f"LoadReports-{tribu_id}.pdf")
+
+    # Analyze the experiments in parallel, the figures are merged in the df_exps order
+    cache = AnalysisCache(os.path.join(datasets_dir, "AnalysisCache")) if use_cache else None
+    if cache is not None:
+        cache.add_known_hashes(df_exps.attrs.get("file_hashes", {}))
+    results = run_batch(df_exps, jobs=jobs, cache=cache)
+    if cache is not None:
+        cache.evict()
+    exps_summary = [[exp_summary, exp_df] for exp_summary, exp_df, _ in filter(None, results)]
     
     with PdfPages(pdf_path) as pdf:
-        for exp_idx, row in df_exps.iterrows():
-            logger1.info(f"\nProcessing: {row.ExpId}")
-            df_data, cycles_list = LoadFiles(row.MotorFile, row.DaqFile)
-            
-            if df_data is None:
-                logger1.warning(f"Experiment {row.ExpId} dropped.")
-                continue
-            
-            if np.all(df_data["Current"] == 0):
-                logger1.warning(f"Column Current not found in experiment {row.ExpId}. Cannot verify Ohm's Law.")
-            else:
-                i_theo = df_data["Voltage"] / (row.Req/1e6)
-                ratio = df_data["Current"] / i_theo
-                tolerance = np.abs(1 - ratio).max()
-                logger1.info(f"Experiment {row.ExpId}: Ohm's Law satisfied within {100*tolerance:.0f}% tolerance.")
-                
-            exp_df = experiment_analysis(row, df_data, cycles_list, pdf)
-            
-            exp_summary = {
-                "ExpId": row.ExpId,
-                "TribuId": row.TribuId,
-                "Date": row.Date,
-                # "Temperature": row.Temperature,
-                # "Humidity": row.Humidity,
-                "Req": row.Req,
-                "NumCycles": len(cycles_list),
-                "Duration": df_data.Time.iloc[-1],
-                "AvgVoltageMax": exp_df.VoltageMax.mean(),
-                "VarVoltageMax": exp_df.VoltageMax.var(),
-                "AvgVoltageMin": exp_df.VoltageMin.mean(),
-                "VarVoltageMin": exp_df.VoltageMin.var(),
-                "AvgPosPeakWidth": exp_df.PosPeakWidth.mean(),
-                "VarPosPeakWidth": exp_df.PosPeakWidth.var(),
-                "AvgNegPeakWidth": exp_df.NegPeakWidth.mean(),
-                "VarNegPeakWidth": exp_df.NegPeakWidth.var(),
-                "AvgPosEnergy": exp_df.PosEnergy.mean(),
-                "VarPosEnergy": exp_df.PosEnergy.var(),
-                "AvgNegEnergy": exp_df.NegEnergy.mean(),
-                "VarNegEnergy": exp_df.NegEnergy.var(),
-                "AvgTotEnergy": exp_df.TotEnergy.mean(),
-                "VarTotEnergy": exp_df.TotEnergy.var()
-            }
-            exps_summary.append([exp_summary, exp_df])
+        for result in filter(None, results):
+            for png in result[2]:
+                add_png_page(pdf, png)
         
         # Save datasets
         summary_df = pd.DataFrame([d[0] for d in exps_summary])
@@ -481,7 +654,13 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Batch analysis of the experiments of a TribuId.")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs, 1 to run serially).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Analyze all the experiments again without using the DataSets analysis cache.")
+    args, _ = parser.parse_known_args()
+    main(jobs=args.jobs, use_cache=not args.no_cache)
 
 
 
@@ -0,0 +1,287 @@
+"""
+End-to-end acquisition throughput benchmark with the simulated DAQ backend.
+
+Each configuration (sample rate x channels x DAQ_USB_TRANSFER_FREQUENCY x BUFFER_SAVING_TIME_INTERVAL) runs a
+DAQ task -> BufferProcessor (QThread) -> file acquisition in realtime and reports:
+    - callback latency: delay between the end of a block acquisition and the EveryNCallback call (percentiles)
+    - callback and save durations, and the queue delay of the save slots until the BufferProcessor saves them
+    - overruns: DAQ buffer overflows and save slot ring full errors, maximum save slots in use
+    - CPU time of the callback thread, of the save thread and of the whole process
+The results are written in a JSON file to compare runs and choose safe DAQ profile settings.
+
+Example:
+    python AcquisitionThroughputBenchmark.py --rates 10000 100000 1000000 --channels 1 4 --duration 10
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+os.environ.setdefault("PYTENG_DAQ_BACKEND", "simulated")
+
+from PyQt5.QtCore import QCoreApplication, QObject, QThread, QTimer, QEventLoop, pyqtSignal
+from ClassStructures import DaqBackend, SimulatedDaq
+from ClassStructures.DaqBackend import DAQmx_Val_Diff
+from ClassStructures.DaqInterface import AnalogRead, DigitalRead
+from ClassStructures.BufferProcessor import BufferProcessor
+
+
+def percentiles(values, scale=1e3):
+    """Percentiles in ms of a list of durations in seconds."""
+    if len(values) == 0:
+        return None
+    values = np.asarray(values) * scale
+    return {"p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()),
+            "count": int(len(values))}
+
+
+class BenchmarkWindow(QObject):
+    """Minimal AcquisitionProgram replacement with the attributes used by the DAQ tasks and BufferProcessor."""
+    trigger_acquisition_signal = pyqtSignal()
+
+    def __init__(self, local_path):
+        super().__init__()
+        self.local_path = [local_path]
+        self.exp_id = "BENCHMARK"
+        self.xRecording = [True]
+        self.moveLinMot = [True]
+        self.error_flag = False
+        self.automatic_mode = False
+        self.errors = []
+        self.trigger_acquisition_signal.connect(lambda: self.errors.append(time.perf_counter()))
+
+
+class BenchmarkBufferProcessor(BufferProcessor):
+    """BufferProcessor measuring the queue delay, the duration and the CPU time of each save."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commit_times = []
+        self.queue_delays = []
+        self.save_durations = []
+        self.cpu_time = 0.0
+
+    def instrument_ring(self):
+        # The commit time of each slot is recorded to measure how long it waits to be saved
+        commit = self.save_ring.commit
+
+        def timed_commit(n_samples):
+            self.commit_times.append(time.perf_counter())
+            return commit(n_samples)
+
+        self.save_ring.commit = timed_commit
+
+    def save_data(self, data):
+        t0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        if len(self.queue_delays) < len(self.commit_times):
+            self.queue_delays.append(t0 - self.commit_times[len(self.queue_delays)])
+        super().save_data(data)
+        self.cpu_time += time.thread_time() - cpu0
+        self.save_durations.append(time.perf_counter() - t0)
+
+
+def instrumented_task(TaskClass):
+    """DAQ task subclass measuring the latency, the duration and the CPU time of each EveryNCallback."""
+
+    class BenchmarkTask(TaskClass):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.callback_latencies = []
+            self.callback_durations = []
+            self.cpu_time = 0.0
+
+        def EveryNCallback(self):
+            t0 = time.perf_counter()
+            cpu0 = time.thread_time()
+            if self.start_time is not None:
+                # The block is complete when its last sample is acquired
+                block_end = self.start_time + (self.samples_read + self.SAMPLES_PER_CALLBACK) / self.sample_rate
+                self.callback_latencies.append(t0 - block_end)
+            result = super().EveryNCallback()
+            self.cpu_time += time.thread_time() - cpu0
+            self.callback_durations.append(time.perf_counter() - t0)
+            return result
+
+    return BenchmarkTask
+
+
+def build_task_definition(task_type, sample_rate, n_channels):
+    if task_type == "analog":
+        channels = {f"AI{idx}": {"port": f"Dev1/ai{idx}", "port_config": DAQmx_Val_Diff,
+                                 "conversion_source": "none", "conversion_factor": None, "keithley_sense": "none"}
+                    for idx in range(n_channels)}
+    else:
+        channels = {f"DI{idx}": {"port": f"Dev2/port0/line{idx}", "port_config": None,
+                                 "conversion_source": "none", "conversion_factor": None, "keithley_sense": "none"}
+                    for idx in range(n_channels)}
+    return {"NAME": "Benchmark", "SAMPLE_RATE": sample_rate, "DAQ_CHANNELS": channels,
+            "TRIGGER_SOURCE": None, "TYPE": task_type}
+
+
+def wait(app, seconds):
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    loop.exec_()
+
+
+def run_configuration(app, task_type, sample_rate, n_channels, usb_frequency, saving_interval, duration,
+                      storage_format, save_slots, work_folder):
+    window = BenchmarkWindow(work_folder)
+    TASK = build_task_definition(task_type, sample_rate, n_channels)
+
+    processor_thread = QThread()
+    processor = BenchmarkBufferProcessor(TASK, window, STORAGE_FORMAT=storage_format)
+    processor.moveToThread(processor_thread)
+    processor_thread.start()
+
+    TaskClass = instrumented_task(AnalogRead if task_type == "analog" else DigitalRead)
+    task = TaskClass(TASK=TASK,
+                     BUFFER_PROCESSOR=processor,
+                     DAQ_USB_TRANSFER_FREQUENCY=usb_frequency,
+                     BUFFER_SAVING_TIME_INTERVAL=saving_interval,
+                     TimeWindowLength=2,
+                     AcquisitionProgramReference=window,
+                     SAVE_BUFFER_SLOTS=save_slots)
+    processor.instrument_ring()
+    processor.open_file()
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    task.StartTask()
+
+    # Run until the duration is reached or an error stops the acquisition
+    elapsed = 0.0
+    while elapsed < duration and not window.error_flag:
+        wait(app, min(0.2, duration - elapsed))
+        elapsed = time.perf_counter() - t0
+
+    window.moveLinMot[0] = False
+    task.StopTask()
+    acquisition_time = time.perf_counter() - t0
+    task.flush_save_buffer()
+
+    # Wait for the pending save slots
+    deadline = time.perf_counter() + 60
+    while task.save_ring.occupancy() > 0 and time.perf_counter() < deadline:
+        wait(app, 0.05)
+    drain_time = time.perf_counter() - t0 - acquisition_time
+    process_cpu = time.process_time() - cpu0
+
+    processor.close_file()
+    task.ClearTask()
+    processor_thread.quit()
+    processor_thread.wait()
+
+    samples_acquired = int(acquisition_time * sample_rate)
+    samples_read = int(task.samples_read)
+    overflow = window.error_flag and task.save_ring.max_occupancy < task.save_ring.N_SLOTS
+
+    return {
+        "config": {
+            "task_type": task_type,
+            "sample_rate": sample_rate,
+            "channels": n_channels,
+            "DAQ_USB_TRANSFER_FREQUENCY": usb_frequency,
+            "BUFFER_SAVING_TIME_INTERVAL": saving_interval,
+            "SAMPLES_PER_CALLBACK": task.SAMPLES_PER_CALLBACK,
+            "BUFFER_SIZE": task.BUFFER_SIZE,
+            "SAVE_BUFFER_SLOTS": save_slots,
+            "STORAGE_FORMAT": storage_format,
+            "duration": duration,
+        },
+        "sustainable": not window.error_flag,
+        "acquisition_time_s": acquisition_time,
+        "drain_time_s": drain_time,
+        "samples_acquired": samples_acquired,
+        "samples_read": samples_read,
+        "throughput_samples_per_s": samples_read * n_channels / acquisition_time,
+        "callback_latency_ms": percentiles(task.callback_latencies),
+        "callback_duration_ms": percentiles(task.callback_durations),
+        "save_queue_delay_ms": percentiles(processor.queue_delays),
+        "save_duration_ms": percentiles(processor.save_durations),
+        "overruns": {
+            "errors": len(window.errors),
+            "daq_buffer_overflow": bool(overflow),
+            "save_ring_full": bool(window.error_flag and not overflow),
+            "max_save_slots_in_use": task.save_ring.max_occupancy,
+        },
+        "cpu_s": {
+            "callback_thread": task.cpu_time,
+            "save_thread": processor.cpu_time,
+            "process": process_cpu,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquisition throughput benchmark (simulated DAQ backend)")
+    parser.add_argument("--task-type", choices=("analog", "digital"), default="analog")
+    parser.add_argument("--rates", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--usb-frequencies", type=float, nargs="+", default=[20, 50])
+    parser.add_argument("--save-intervals", type=float, nargs="+", default=[1, 5])
+    parser.add_argument("--duration", type=float, default=10, help="Acquisition time of each configuration (s)")
+    parser.add_argument("--storage", choices=("hdf5", "bin"), default="hdf5")
+    parser.add_argument("--save-slots", type=int, default=8)
+    parser.add_argument("--output", default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    if DaqBackend.BACKEND != "simulated":
+        raise SystemExit("The benchmark uses the simulated DAQ backend, set PYTENG_DAQ_BACKEND=simulated")
+    SimulatedDaq.SIMULATION["realtime"] = True
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    work_folder = tempfile.mkdtemp(prefix="pyTENG_benchmark_")
+
+    results = []
+    configurations = list(itertools.product(args.rates, args.channels, args.usb_frequencies, args.save_intervals))
+    try:
+        for idx, (rate, channels, usb_frequency, saving_interval) in enumerate(configurations, start=1):
+            print(f"[{idx}/{len(configurations)}] {rate} S/s x {channels} channels, "
+                  f"USB {usb_frequency} Hz, saving every {saving_interval} s")
+            result = run_configuration(app, args.task_type, rate, channels, usb_frequency, saving_interval,
+                                       args.duration, args.storage, args.save_slots, work_folder)
+            results.append(result)
+
+            latency = result["callback_latency_ms"] or {}
+            status = "OK" if result["sustainable"] else "\033[91mOVERRUN\033[0m"
+            print(f"    {status}: callback latency p99 {latency.get('p99', float('nan')):.2f} ms, "
+                  f"max save slots in use {result['overruns']['max_save_slots_in_use']}, "
+                  f"CPU {result['cpu_s']['process']:.2f} s")
+
+            for file in os.listdir(work_folder):
+                os.remove(os.path.join(work_folder, file))
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+        report = {
+            "created": datetime.now().isoformat(),
+            "backend": DaqBackend.BACKEND,
+            "simulation": {key: value for key, value in SimulatedDaq.SIMULATION.items() if key != "loopback"},
+            "system": {"python": platform.python_version(), "platform": platform.platform(),
+                       "cpu_count": os.cpu_count()},
+            "results": results,
+        }
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
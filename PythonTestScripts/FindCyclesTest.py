@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PostProcessingScripts"))
+
+from LoadData import FindCycles
+
+
+def FindCycles_Loop(df):
+    """Previous FindCycles implementation (one Python iteration per sample), used as reference."""
+    state_series = df['Bool1'] + df['Bool2']
+    cycles = []
+    prev_state = state_series.iloc[0]
+    start = None
+
+    for i, s in enumerate(state_series[1:], start=1):
+        if s != prev_state:
+            if s == 2:
+                if start is not None:
+                    cycles.append([start, i - 1])
+                start = i
+            elif s == 0 and start is not None:
+                cycles.append([start, i - 1])
+                start = None
+            prev_state = s
+
+    if start is not None:
+        cycles.append([start, len(state_series) - 1])
+
+    return cycles
+
+
+def square_wave_dataframe(fs, duration, period, duty=0.5, enable_gaps=True, seed=0):
+    """LinMot synchronization signals: Bool1 = Enable, Bool2 = Up/Down square wave with some jitter."""
+    rng = np.random.default_rng(seed)
+    n = int(fs * duration)
+    t = np.arange(n) / fs
+
+    jitter = rng.normal(0, 0.01 * period, size=int(duration / period) + 2)
+    phase = (t / period) - np.repeat(jitter, int(fs * period) + 1)[:n] / period
+    bool2 = ((phase % 1) < duty).astype(np.int64)
+
+    bool1 = np.ones(n, dtype=np.int64)
+    if enable_gaps:
+        # Disable the motor a few times during the experiment
+        for gap_start in rng.integers(0, n, size=5):
+            bool1[gap_start:gap_start + int(2 * fs)] = 0
+            bool2[gap_start:gap_start + int(2 * fs)] = 0
+
+    return pd.DataFrame({'Bool1': bool1, 'Bool2': bool2})
+
+
+# %% Equivalence test with random states and edge cases
+cases = [
+    pd.DataFrame({'Bool1': [1], 'Bool2': [1]}),
+    pd.DataFrame({'Bool1': [1, 1, 1, 0], 'Bool2': [1, 1, 0, 0]}),
+    pd.DataFrame({'Bool1': [1, 1, 1, 1, 1], 'Bool2': [0, 1, 1, 0, 1]}),
+    pd.DataFrame({'Bool1': [0, 1, 1, 1, 0, 1, 1], 'Bool2': [0, 0, 1, 1, 0, 1, 0]}),
+    pd.DataFrame({'Bool1': [1.0, np.nan, 1.0, 1.0], 'Bool2': [1.0, 1.0, 1.0, 0.0]}),
+]
+rng = np.random.default_rng(1)
+for k in range(200):
+    n = rng.integers(1, 300)
+    cases.append(pd.DataFrame({'Bool1': rng.integers(0, 2, n), 'Bool2': rng.integers(0, 2, n)}))
+for k in range(20):
+    cases.append(square_wave_dataframe(fs=1000, duration=30, period=1.3, seed=k))
+
+for k, df in enumerate(cases):
+    expected = FindCycles_Loop(df)
+    result = FindCycles(df)
+    assert result == expected, f"Case {k}: {result[:5]} != {expected[:5]}"
+print(f"Equivalence test passed ({len(cases)} cases)")
+
+
+# %% Benchmark on one hour square waves at 10 kS/s
+fs = 10000
+duration = 3600
+df = square_wave_dataframe(fs=fs, duration=duration, period=1.0)
+print(f"\nBenchmark: {len(df)} samples ({duration} s at {fs} S/s)")
+
+t0 = time.perf_counter()
+result = FindCycles(df)
+t_numpy = time.perf_counter() - t0
+print(f"NumPy FindCycles: {t_numpy:.3f} s, {len(result)} cycles")
+
+t0 = time.perf_counter()
+expected = FindCycles_Loop(df)
+t_loop = time.perf_counter() - t0
+print(f"Loop FindCycles:  {t_loop:.3f} s, {len(expected)} cycles")
+
+assert result == expected
+print(f"Speed-up: x{t_loop / t_numpy:.0f}")
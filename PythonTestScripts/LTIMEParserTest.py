@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PostProcessingScripts"))
+
+from LoadData import LTIME_to_nanoseconds, LTIME_to_seconds, LTIME_UNITS_NS
+
+UNITS = list(LTIME_UNITS_NS)
+
+
+def random_LTIME(rng, prefix="LTIME#"):
+    """LTIME string with a random subset of the units (in the CodeSys order) and its exact value in ns."""
+    units = [unit for unit in UNITS if rng.random() < 0.5] or [UNITS[rng.integers(len(UNITS))]]
+    values = [int(rng.integers(0, 1000)) for _ in units]
+    string = prefix + "".join(f"{value}{unit}" for value, unit in zip(values, units))
+    return string, sum(value * LTIME_UNITS_NS[unit] for value, unit in zip(values, units))
+
+
+# %% Correctness test: every unit, ambiguous m/ms, prefixes, different lengths in the same column
+cases = [
+    ("LTIME#1d", LTIME_UNITS_NS["d"]),
+    ("LTIME#1h", LTIME_UNITS_NS["h"]),
+    ("LTIME#1m", LTIME_UNITS_NS["m"]),
+    ("LTIME#1s", LTIME_UNITS_NS["s"]),
+    ("LTIME#1ms", LTIME_UNITS_NS["ms"]),
+    ("LTIME#1us", LTIME_UNITS_NS["us"]),
+    ("LTIME#1ns", LTIME_UNITS_NS["ns"]),
+    ("LTIME#0ns", 0),
+    ("LTIME#2m3ms", 2 * LTIME_UNITS_NS["m"] + 3 * LTIME_UNITS_NS["ms"]),
+    ("LTIME#12m34s", 12 * LTIME_UNITS_NS["m"] + 34 * LTIME_UNITS_NS["s"]),
+    ("LTIME#19d23h59m59s999ms999us999ns", 19 * LTIME_UNITS_NS["d"] + 23 * LTIME_UNITS_NS["h"]
+     + 59 * LTIME_UNITS_NS["m"] + 59 * LTIME_UNITS_NS["s"] + 999 * LTIME_UNITS_NS["ms"]
+     + 999 * LTIME_UNITS_NS["us"] + 999),
+    ("T#5s", 5 * LTIME_UNITS_NS["s"]),
+    ("7us", 7 * LTIME_UNITS_NS["us"]),
+]
+rng = np.random.default_rng(0)
+cases += [random_LTIME(rng) for _ in range(20000)]
+
+strings = [string for string, _ in cases]
+expected = np.array([value for _, value in cases], dtype=np.int64)
+
+for data in (strings, np.array(strings), pd.Series(strings), pd.Series(strings, dtype="string")):
+    result = LTIME_to_nanoseconds(data)
+    assert result.dtype == np.int64
+    wrong = np.flatnonzero(result != expected)
+    assert len(wrong) == 0, f"{strings[wrong[0]]}: {result[wrong[0]]} != {expected[wrong[0]]}"
+
+# Same seconds as the previous parser
+seconds = np.array([LTIME_to_seconds(string) for string in strings])
+assert np.allclose(LTIME_to_nanoseconds(strings) / 1e9, seconds, rtol=1e-12, atol=1e-9)
+
+# Numbers without a valid unit are rejected
+for string in ("LTIME#5", "LTIME#5x", "LTIME#1s5", "LTIME#3u"):
+    try:
+        LTIME_to_nanoseconds(["LTIME#1s", string])
+    except ValueError:
+        continue
+    raise AssertionError(f"{string} was not rejected")
+
+print(f"Correctness test passed ({len(cases)} values)")
+
+
+# %% Benchmark on a one million rows motor log (1 kS/s)
+n = 1_000_000
+time_ns = np.arange(n, dtype=np.int64) * LTIME_UNITS_NS["ms"] + 3 * LTIME_UNITS_NS["h"]
+column = pd.Series([f"LTIME#{t // LTIME_UNITS_NS['h']}h{t // LTIME_UNITS_NS['m'] % 60}m"
+                    f"{t // LTIME_UNITS_NS['s'] % 60}s{t // LTIME_UNITS_NS['ms'] % 1000}ms" for t in time_ns])
+print(f"\nBenchmark: {n} LTIME values")
+
+t0 = time.perf_counter()
+result = LTIME_to_nanoseconds(column)
+t_vectorized = time.perf_counter() - t0
+print(f"LTIME_to_nanoseconds:     {t_vectorized:.3f} s")
+
+t0 = time.perf_counter()
+expected = column.apply(LTIME_to_seconds).astype(float)
+t_apply = time.perf_counter() - t0
+print(f"apply(LTIME_to_seconds):  {t_apply:.3f} s")
+
+assert np.array_equal(result, time_ns)
+assert np.allclose(result / 1e9, expected.to_numpy(), rtol=1e-12)
+print(f"Speed-up: x{t_apply / t_vectorized:.0f}")
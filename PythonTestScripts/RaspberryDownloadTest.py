@@ -0,0 +1,75 @@
+"""
+Download test of RaspberryInterface against the local SSH/SFTP stand-in of the Raspberry (SimulatedRaspberry).
+
+Creates a folder of CSV chunks like the CODESYS ones, downloads it with 1 and with N SFTP channels, checks that
+the downloaded files are identical and prints the duration and throughput of each download. With
+--corrupt-probability the stand-in flips bytes of the transfers, the corrupted chunks must be downloaded again.
+
+    python PythonTestScripts/RaspberryDownloadTest.py --files 40 --size-mb 2 --channels 1 4 --read-delay 0.002
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ClassStructures.RaspberryInterface import RaspberryInterface
+from ClassStructures.SimulatedRaspberry import LocalRaspberryServer
+
+
+def create_remote_folder(folder, n_files, size_mb):
+    """CSV files of size_mb MB, the last ones in a subfolder (download_folder is recursive)."""
+    row = "2024-01-01-00:00:00.000000000;1.2345;0.1234;1;0\n"
+    rows = int(size_mb * 1e6 / len(row))
+    os.makedirs(os.path.join(folder, "Sub"), exist_ok=True)
+    for n in range(n_files):
+        sub = "Sub" if n >= n_files - 2 else ""
+        with open(os.path.join(folder, sub, f"Motor_{n:03d}.csv"), "w") as file:
+            file.write(f"# chunk {n}\n")
+            file.write(row * rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-mb", type=float, default=2)
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--read-delay", type=float, default=0.002,
+                        help="Seconds added to each SFTP read request by the stand-in")
+    parser.add_argument("--corrupt-probability", type=float, default=0.0,
+                        help="Probability of a corrupted byte in each SFTP read response")
+    args = parser.parse_args()
+
+    server = LocalRaspberryServer(read_delay=args.read_delay, corrupt_probability=args.corrupt_probability).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        remote_folder = os.path.join(tmp, "FTP_Folder")
+        create_remote_folder(remote_folder, args.files, args.size_mb)
+
+        results = {}
+        for channels in args.channels:
+            raspberry = RaspberryInterface(hostname="127.0.0.1", port=server.port, username="TENG",
+                                           password="raspberry", sftp_channels=channels)
+            if not raspberry.connect():
+                sys.exit(1)
+
+            local_folder = raspberry.download_folder(remote_folder, local_path=os.path.join(tmp, f"Local_{channels}"))
+            raspberry.disconnect()
+
+            # Compare the downloaded files with the remote ones
+            comparison = filecmp.dircmp(remote_folder, local_folder)
+            different = comparison.diff_files + comparison.left_only + comparison.subdirs["Sub"].diff_files \
+                        + comparison.subdirs["Sub"].left_only
+            if different:
+                print(f"\033[91mDownloaded files differ from the remote ones: {different}\033[0m")
+                sys.exit(1)
+
+            results[channels] = raspberry.last_download_stats
+
+    server.stop()
+
+    print("\nChannels  Files  MB       Repaired MB  Time (s)  MB/s")
+    for channels, stats in results.items():
+        print(f"{channels:<9} {stats['Files']:<6} {stats['Bytes'] / 1e6:<8.1f} {stats['RepairedBytes'] / 1e6:<12.1f} "
+              f"{stats['Duration (s)']:<9.2f} {stats['Throughput (MB/s)']:.2f}")
@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PostProcessingScripts"))
+
+from LoadExperiments import update_catalog
+from ClassStructures.ExperimentIndex import ExperimentIndex, describe_file
+
+
+def write_sheet(rawdata_dir, df_sheet, mtime_ns):
+    """Experiments.ods with a given modification time (each write is a new version for update_catalog)."""
+    file_path = os.path.join(rawdata_dir, "Experiments.ods")
+    df_sheet.to_excel(file_path, engine="odf", index=False)
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+
+
+# %% Experiments.ods with empty ExpId cells: pandas reads the column as float (12.0, NaN, 14.0, NaN)
+rawdata_dir = tempfile.mkdtemp()
+daq_files = []
+for name in ("DAQ-12.h5", "DAQ-a.h5", "DAQ-14.h5", "DAQ-b.h5"):
+    with open(os.path.join(rawdata_dir, name), "wb") as f:
+        f.write(name.encode())
+    daq_files.append(name)
+
+df_sheet = pd.DataFrame({
+    "ExpId": [12, np.nan, 14, np.nan],
+    "TribuId": ["T1", "T1", "T2", "T2"],
+    "RloadId": ["R1", "R2", "R1", "R2"],
+    "DaqFile": daq_files,
+})
+write_sheet(rawdata_dir, df_sheet, 1_000_000_000)
+
+with ExperimentIndex(os.path.join(rawdata_dir, "Experiments.sqlite")) as catalog:
+    update_catalog(catalog, rawdata_dir)
+    exp_ids = [experiment["ExpId"] for experiment in catalog.query()]
+    assert exp_ids == ["12", "Experiments.ods row 3", "14", "Experiments.ods row 5"], exp_ids
+    print(f"Experiment ids imported as text: {exp_ids}")
+
+    # The rows without ExpId have their data files, so they are analyzed
+    daq_paths = [experiment["DaqFile"] for experiment in catalog.catalog()]
+    assert daq_paths == [os.path.join(catalog.rawdata_folder, name) for name in daq_files], daq_paths
+
+    # Hashes of experiment 12 computed by the finalization step (add_folder_files) or the analysis
+    description = describe_file(os.path.join(rawdata_dir, "DAQ-12.h5"))
+    description.update(path="DAQ-12.h5", kind="daq")
+    catalog.set_files("12", [description])
+
+# %% A new version of the spreadsheet replaces its rows: last row without ExpId removed
+write_sheet(rawdata_dir, df_sheet.iloc[:3], 2_000_000_000)
+
+with ExperimentIndex(os.path.join(rawdata_dir, "Experiments.sqlite")) as catalog:
+    update_catalog(catalog, rawdata_dir)
+    exp_ids = [experiment["ExpId"] for experiment in catalog.query()]
+    assert sorted(exp_ids) == ["12", "14", "Experiments.ods row 3"], exp_ids
+    print(f"Experiments after a new import: {len(catalog)}")
+
+    # The hash of the unchanged file is kept
+    hashes = catalog.file_hashes(["12"])
+    assert [value["sha256"] for value in hashes.values()] == [description["sha256"]], hashes
+    print("Cataloged hash kept after the new import")
@@ -1,10 +1,10 @@
 import sys
 from PyQt5.QtWidgets import QApplication
 
-from PyDAQmx.DAQmxConstants import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
-                                    DAQmx_Val_Rising, DAQmx_Val_ContSamps,
-                                    DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
-                                    DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
+from ClassStructures.DaqBackend import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
+                                       DAQmx_Val_Rising, DAQmx_Val_ContSamps,
+                                       DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                       DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
 
 from ClassStructures.RLoadSwitch import R_LOAD_SWITCH
 
@@ -59,38 +59,41 @@ R_LOAD_PROFILE = [
                                "conversion_factor": None, "keithley_sense": "none"}
         },
 
-        # "TRIGGER_SOURCE": "PFI0",
-        "TRIGGER_SOURCE": None,
+        # Same start trigger as the analog task, the files are aligned by sample index
+        "TRIGGER_SOURCE": "PFI0",
+        # "TRIGGER_SOURCE": None,
         "TYPE": "digital"
     }
 ]
 
-app = QApplication(sys.argv)
+# The guard is required by the finalization worker processes, they import this module when they start
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
 
-# To debug, use this
-debug = False
-tribo_lab = True
-if debug:
-    if tribo_lab:
-        exp_dir = r"C:\Users\mmartic\Desktop\RogerTest"
+    # To debug, use this
+    debug = False
+    tribo_lab = True
+    if debug:
+        if tribo_lab:
+            exp_dir = r"C:\Users\mmartic\Desktop\RogerTest"
+        else:
+            exp_dir = r"C:\Users\rpieres\Desktop\Test"
+        tribu_id = "PDMSvsNylon"
+        rload_id = "R10"
+        SampleIdTriboNeg = "PDMS"
+        SampleIdTriboPos = "Nylon"
     else:
-        exp_dir = r"C:\Users\rpieres\Desktop\Test"
-    tribu_id = "PDMSvsNylon"
-    rload_id = "R10"
-    SampleIdTriboNeg = "PDMS"
-    SampleIdTriboPos = "Nylon"
-else:
-    exp_dir = None
-    tribu_id = None
-    rload_id = None
-    SampleIdTriboNeg = None
-    SampleIdTriboPos = None
+        exp_dir = None
+        tribu_id = None
+        rload_id = None
+        SampleIdTriboNeg = None
+        SampleIdTriboPos = None
 
-w = R_LOAD_SWITCH(METADATA_COLUMNS=METADATA_COLUMNS,
-                  R_LOAD_PROFILE=R_LOAD_PROFILE,
-                  tribu_id="TribuTest",
-                  sample_id_neg="SampleNegTest",
-                  sample_id_pos="SamplePosTest",
-                  exp_dir=exp_dir)
-w.show()
-sys.exit(app.exec_())
\ No newline at end of file
+    w = R_LOAD_SWITCH(METADATA_COLUMNS=METADATA_COLUMNS,
+                      R_LOAD_PROFILE=R_LOAD_PROFILE,
+                      tribu_id="TribuTest",
+                      sample_id_neg="SampleNegTest",
+                      sample_id_pos="SamplePosTest",
+                      exp_dir=exp_dir)
+    w.show()
+    sys.exit(app.exec_())
\ No newline at end of file
@@ -1,10 +1,10 @@
 import sys
 from PyQt5.QtWidgets import QApplication
 
-from PyDAQmx.DAQmxConstants import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
-                                    DAQmx_Val_Rising, DAQmx_Val_ContSamps,
-                                    DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
-                                    DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
+from ClassStructures.DaqBackend import (DAQmx_Val_RSE, DAQmx_Val_Volts, DAQmx_Val_Diff,
+                                       DAQmx_Val_Rising, DAQmx_Val_ContSamps,
+                                       DAQmx_Val_GroupByScanNumber, DAQmx_Val_Acquired_Into_Buffer,
+                                       DAQmx_Val_GroupByChannel, DAQmx_Val_ChanForAllLines)
 
 from ClassStructures.MeasurementCore import AcquisitionProgram
 
@@ -35,8 +35,9 @@ R_LOAD_PROFILE = [
             "LinMot_Up_Down": {"port":"Dev2/port0/line1", "port_config":None, "conversion_source": "none", "conversion_factor": None, "keithley_sense": "none"}
         },
 
-        # "TRIGGER_SOURCE": "PFI0",
-        "TRIGGER_SOURCE": None,
+        # Same start trigger as the analog task, the files are aligned by sample index
+        "TRIGGER_SOURCE": "PFI0",
+        # "TRIGGER_SOURCE": None,
         "TYPE": "digital"
     }
 ]
@@ -174,39 +175,41 @@ resistance_list = [{'VALUE': 5,
                   'DAQ_CODE': [0, 1, 1, 0, 0, 1],
                   'RLOAD_ID': 'Resistance 6'}]
 
-app = QApplication(sys.argv)
-
-# To debug, use this
-debug = False
-tribo_lab = True
-if debug:
-    if tribo_lab:
-        exp_dir = r"C:\Users\mmartic\Desktop\RogerTest"
+# The guard is required by the finalization worker processes, they import this module when they start
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+
+    # To debug, use this
+    debug = False
+    tribo_lab = True
+    if debug:
+        if tribo_lab:
+            exp_dir = r"C:\Users\mmartic\Desktop\RogerTest"
+        else:
+            exp_dir = r"C:\Users\rpieres\Desktop\Test"
+        tribu_id = "PDMSvsNylon"
+        rload_id = "R10"
+        SampleIdTriboNeg = "PDMS"
+        SampleIdTriboPos = "Nylon"
     else:
-        exp_dir = r"C:\Users\rpieres\Desktop\Test"
-    tribu_id = "PDMSvsNylon"
-    rload_id = "R10"
-    SampleIdTriboNeg = "PDMS"
-    SampleIdTriboPos = "Nylon"
-else:
-    exp_dir = None
-    tribu_id = None
-    rload_id = None
-    SampleIdTriboNeg = None
-    SampleIdTriboPos = None
-
-window = AcquisitionProgram(DAQ_PROFILES=DAQ_PROFILES,
-                            METADATA_COLUMNS=METADATA_COLUMNS,
-                            automatic_mode=False,
-                            RESISTANCE_DATA=resistance_list,
-                            measure_time=1,
-                            exp_dir=exp_dir,
-                            tribu_id=tribu_id,
-                            rload_id=rload_id,
-                            SampleIdTriboNeg=SampleIdTriboNeg,
-                            SampleIdTriboPos=SampleIdTriboPos,
-                            use_keithley=True,
-                            use_raspberry=True,
-                            keithley_resource_name='GPIB0::14::INSTR')
-window.show()
-sys.exit(app.exec_())
+        exp_dir = None
+        tribu_id = None
+        rload_id = None
+        SampleIdTriboNeg = None
+        SampleIdTriboPos = None
+
+    window = AcquisitionProgram(DAQ_PROFILES=DAQ_PROFILES,
+                                METADATA_COLUMNS=METADATA_COLUMNS,
+                                automatic_mode=False,
+                                RESISTANCE_DATA=resistance_list,
+                                measure_time=1,
+                                exp_dir=exp_dir,
+                                tribu_id=tribu_id,
+                                rload_id=rload_id,
+                                SampleIdTriboNeg=SampleIdTriboNeg,
+                                SampleIdTriboPos=SampleIdTriboPos,
+                                use_keithley=True,
+                                use_raspberry=True,
+                                keithley_resource_name='GPIB0::14::INSTR')
+    window.show()
+    sys.exit(app.exec_())
@@ -1,8 +1,38 @@
 import os
+import json
+import h5py
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 
+# CodeSys motor CSV columns and their names in the analysis
+MotColumnsRenames = {
+    'Time(s)': 'Time',
+    'MC SW Overview - Actual Position(mm)': 'Position',
+    'MC SW Force Control - Measured Force(N)': 'Force',
+    'MC SW Force Control - Target Force(N)': 'TargetForce',
+    'LINMOT_MOVING_BOOL': 'Bool1',
+    'LINMOT_UP_AND_DOWN_BOOL': 'Bool2'
+}
+
+# Dtypes used to parse the motor CSV columns (the LTIME strings are parsed in the analysis)
+MotColumnsDtypes = {
+    'Time(s)': str,
+    'MC SW Overview - Actual Position(mm)': np.float64,
+    'MC SW Force Control - Measured Force(N)': np.float64,
+    'MC SW Force Control - Target Force(N)': np.float64,
+    'LINMOT_MOVING_BOOL': np.int8,
+    'LINMOT_UP_AND_DOWN_BOOL': np.int8
+}
+
+# Chunk length (rows) and compression of the merged motor HDF5 datasets, and length of the stored LTIME strings
+# (lzf: about twice as fast as gzip for the LTIME strings, the file is still less than half the CSV size)
+MOTOR_HDF5_CHUNK_ROWS = 65536
+MOTOR_HDF5_COMPRESSION = "lzf"
+MOTOR_TIME_BYTES = 48
+
 def group_files_by_keyword(file_list, keywords):
     """
     Group files based on shared keywords found in their filenames.
@@ -50,48 +80,164 @@ def sort_function_Pickle(string):
     split_string = string.split("_")
     return int(split_string[-2]) + int(split_string[-1].split(".")[0])
 
-def CSV_merge(folder_path, exp_id):
-    """This function merges the CSV files found in folder_path and saves the merged file in the same directory."""
-    files = [f for f in os.listdir(folder_path) if f.endswith('.csv')]
+def _read_motor_csv(file_path):
+    """Parse one CodeSys CSV file with the columns and dtypes of MotColumnsDtypes (no type inference)."""
+    df = pd.read_csv(file_path, header=0, index_col=False, delimiter=';', decimal='.', engine='c',
+                     usecols=list(MotColumnsDtypes), dtype=MotColumnsDtypes)
+    return df
+
+
+def _open_motor_file(file_path):
+    """
+    Open (or create) the HDF5 motor file. The rows after the 'n_rows' attribute belong to a merge interrupted
+    before it was committed, they are removed so the merge can be repeated.
+    """
+    h5_file = h5py.File(file_path, "a")
+    if "columns" not in h5_file:
+        h5_file.attrs["format"] = "pyTENG-Motor"
+        h5_file.attrs["version"] = 1
+        h5_file.attrs["n_rows"] = 0
+        h5_file.attrs["merged_files"] = json.dumps([])
+        group = h5_file.create_group("columns")
+        for column, dtype in MotColumnsDtypes.items():
+            dataset = group.create_dataset(MotColumnsRenames[column],
+                                           shape=(0,),
+                                           maxshape=(None,),
+                                           dtype=f"S{MOTOR_TIME_BYTES}" if dtype is str else dtype,
+                                           chunks=(MOTOR_HDF5_CHUNK_ROWS,),
+                                           compression=MOTOR_HDF5_COMPRESSION)
+            dataset.attrs["column"] = column
+
+    n_rows = int(h5_file.attrs["n_rows"])
+    for dataset in h5_file["columns"].values():
+        if dataset.shape[0] != n_rows:
+            dataset.resize((n_rows,))
+    return h5_file
+
+
+def _append_motor_block(h5_file, file, df):
+    """Append the rows of a parsed CSV file and commit them with the list of merged files."""
+    n_rows = int(h5_file.attrs["n_rows"])
+    for column in MotColumnsDtypes:
+        values = df[column].to_numpy()
+        dataset = h5_file["columns"][MotColumnsRenames[column]]
+        if MotColumnsDtypes[column] is str:
+            values = values.astype(bytes)
+            if values.dtype.itemsize > MOTOR_TIME_BYTES:
+                raise ValueError(f"{file}: '{column}' values longer than {MOTOR_TIME_BYTES} bytes")
+        dataset.resize((n_rows + len(df),))
+        dataset[n_rows:] = values
+
+    h5_file.attrs["merged_files"] = json.dumps(json.loads(h5_file.attrs["merged_files"]) + [file])
+    h5_file.attrs["n_rows"] = n_rows + len(df)
+    h5_file.flush()
+
+
+def _append_parsed_file(h5_file, file, future):
+    """Appends the CSV file parsed by future to the merged HDF5 file."""
+    _append_motor_block(h5_file, file, future.result())
+    print(file)
+
+
+def CSV_merge(folder_path, exp_id, max_workers=4):
+    """
+    Merges the CodeSys CSV files found in folder_path into the HDF5 file Motor-{exp_id}.h5 (one dataset per
+    column of MotColumnsRenames).
+
+    Parameters
+    ----------
+    folder_path : str
+        Folder with the CSV chunk files (Data_<n>.csv).
+    exp_id : str
+        Experiment id, used in the name of the merged file.
+    max_workers : int
+        Number of CSV files parsed at the same time.
+
+    Returns
+    -------
+    str or None
+        Name of the merged file, None if there is nothing to merge.
+
+    Notes
+    -----
+    - The files are parsed in parallel with the fixed dtypes of MotColumnsDtypes, and appended in order to the
+      HDF5 file as they are parsed, so the merge time and memory stay linear in the data size.
+    - If the merged file already exists the new CSV files are appended to it, so the merge can be called again
+      as new chunks arrive. The merged files are recorded in the HDF5 file and each CSV file is deleted only
+      after its rows are committed, an interrupted merge can be safely repeated.
+    """
+    filename = f'Motor-{exp_id}.h5'
+    file_path = os.path.join(folder_path, filename)
+    files = [f for f in os.listdir(folder_path) if f.endswith('.csv') and not f.startswith('Motor-')]
 
     if not files:
+        if os.path.isfile(file_path):
+            return filename
         return
- 
-    files.sort(key=sort_function)
 
-    # Create an empty DataFrame
-    combined_DataFrame = pd.DataFrame()
+    files.sort(key=sort_function)
 
-    # Iterate the CSV files found in the folder path
     print("\nMerging...")
-    for file in files:
-        # Read CSV
-        df = pd.read_csv(os.path.join(folder_path, file), header=0, 
-                         index_col=False, delimiter=';', decimal='.')
+    with _open_motor_file(file_path) as h5_file:
+        merged_files = set(json.loads(h5_file.attrs["merged_files"]))
+        pending = [f for f in files if f not in merged_files]
+
+        # Sliding window of max_workers parsed files: the next files are parsed while one is written, and at
+        # most max_workers DataFrames are held in memory
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = deque()
+            for file in pending:
+                in_flight.append((file, executor.submit(_read_motor_csv, os.path.join(folder_path, file))))
+                if len(in_flight) >= max_workers:
+                    _append_parsed_file(h5_file, *in_flight.popleft())
+            while in_flight:
+                _append_parsed_file(h5_file, *in_flight.popleft())
+
+        n_rows = int(h5_file.attrs["n_rows"])
 
-        print(file)
-
-        # Concatenate CSV file
-        combined_DataFrame = pd.concat([combined_DataFrame, df], ignore_index=True)
-    
     # Delete individual CSV files after successful merge
     for file in files:
-        file_path = os.path.join(folder_path, file)
         try:
-            os.remove(file_path)
+            os.remove(os.path.join(folder_path, file))
             print(f"Deleted: {file}")
         except Exception as e:
             print(f"Warning: Could not delete {file}: {e}")
 
-    # Save concatenated DataFrame
-    filename = f'Motor-{exp_id}.csv'
-    combined_DataFrame.to_csv(os.path.join(folder_path, filename), index=False)
-
-    print("Data saved to location:", os.path.join(folder_path, filename), "\n")
+    print(f"Data saved to location: {file_path} ({n_rows} rows)\n")
 
     return filename
 
 
+def read_motor_file(file_path, columns=None):
+    """
+    Reads a merged motor file into a DataFrame with the CodeSys column names.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the Motor-*.h5 file written by CSV_merge, or to a Motor-*.csv file of an older experiment.
+    columns : list of str, optional
+        CodeSys columns to read, all the columns if None.
+
+    Returns
+    -------
+    pd.DataFrame
+        The motor data, the Time column as str.
+    """
+    if file_path.endswith('.csv'):
+        return pd.read_csv(file_path, header=0, index_col=False, delimiter=',', decimal='.', usecols=columns)
+
+    data = {}
+    with h5py.File(file_path, "r") as f:
+        n_rows = int(f.attrs["n_rows"])
+        for column, name in MotColumnsRenames.items():
+            if columns is None or column in columns:
+                values = f["columns"][name][:n_rows]
+                data[column] = values.astype(str) if values.dtype.kind == "S" else values
+
+    return pd.DataFrame(data)
+
+
 def Pickle_merge(folder_path, exp_id, groupby=None):
     """This function merges the Pickle files found in folder_path and saves the merged file in the same directory."""
     files = [f for f in os.listdir(folder_path) if f.endswith('.pkl')]
@@ -164,7 +310,123 @@ def validate_binary_column(df, column):
         raise ValueError(f"Error: The column '{column}' contains not binary values: {wrong_values}")
 
 
-def synchronize_dataframes(dataframes_list, time_col='Time (s)', filter_time=True, binary_cols=("LinMot_Enable", "LinMot_Up_Down")):
+# Number of output samples resampled at once by resample_dataframe
+RESAMPLE_CHUNK_SIZE = 1_000_000
+
+
+def _uniform_time_step(time, chunk_size=RESAMPLE_CHUNK_SIZE):
+    """Return the time step if the time samples are uniformly spaced (t0 + k * dt), None otherwise."""
+    n = len(time)
+    if n < 2:
+        return None
+    dt = (time[-1] - time[0]) / (n - 1)
+    if not dt > 0:
+        return None
+
+    tolerance = 1e-6 * dt
+    for start in range(0, n, chunk_size):
+        k = np.arange(start, min(start + chunk_size, n))
+        if np.abs(time[start:start + chunk_size] - (time[0] + k * dt)).max() > tolerance:
+            return None
+    return dt
+
+
+def resample_dataframe(df, time_col, new_time, binary_cols=(), chunk_size=RESAMPLE_CHUNK_SIZE):
+    """
+    Resamples the columns of a DataFrame at the new_time timestamps.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Data with a strictly increasing time column.
+    time_col : str
+        Name of the time column.
+    new_time : np.ndarray
+        Timestamps of the resampled data.
+    binary_cols : iterable of str
+        0/1 columns, resampled to the nearest sample (ties give 0) and returned as integers.
+    chunk_size : int
+        Number of output samples processed at once, the temporary arrays don't depend on the data length.
+
+    Returns
+    -------
+    pd.DataFrame
+        Resampled columns with new_time as index.
+
+    Notes
+    -----
+    - The source sample of each output timestamp is computed analytically for uniformly sampled data
+      and with a binary search (np.searchsorted) otherwise.
+    - The result is the same as the union + interpolate(method='index') approach: linear interpolation
+      ignoring the NaN values, NaN before the first valid sample and the last value after the last one.
+    """
+    time = df[time_col].to_numpy(dtype=float)
+    new_time = np.asarray(new_time, dtype=float)
+    n, n_out = len(time), len(new_time)
+    dt = _uniform_time_step(time, chunk_size)
+
+    columns = [col for col in df.columns if col != time_col]
+    values = {col: df[col].to_numpy() for col in columns}
+    binary_cols = set(binary_cols)
+
+    result = {}
+    for col in columns:
+        if col in binary_cols:
+            values[col] = values[col].astype(int, copy=False)
+            result[col] = np.empty(n_out, dtype=int)
+        else:
+            values[col] = values[col].astype(float, copy=False)
+            result[col] = np.empty(n_out, dtype=float)
+
+    # Valid samples of the columns with NaN values, selected once for all the chunks
+    valid_samples = {}
+    for col in columns:
+        if col not in binary_cols:
+            valid = ~np.isnan(values[col])
+            if not valid.all():
+                valid_samples[col] = (time[valid], values[col][valid])
+
+    for start in range(0, n_out, chunk_size):
+        x = new_time[start:start + chunk_size]
+        out = slice(start, start + len(x))
+
+        # Left sample index and interpolation fraction of each output timestamp
+        if n == 1:
+            idx = np.zeros(len(x), dtype=np.int64)
+            frac = np.where(x < time[0], -1.0, 0.0)
+            right = idx
+        else:
+            if dt is not None:
+                position = (x - time[0]) / dt
+                idx = np.clip(np.floor(position).astype(np.int64), 0, n - 2)
+                frac = position - idx
+            else:
+                idx = np.clip(np.searchsorted(time, x, side='right') - 1, 0, n - 2)
+                frac = (x - time[idx]) / (time[idx + 1] - time[idx])
+            frac = np.minimum(frac, 1.0)
+            right = idx + 1
+
+        for col in columns:
+            v = values[col]
+            if col in binary_cols:
+                # Nearest sample without float arithmetic, an exact tie rounds 0.5 to 0 as round() does
+                left_value, right_value = v[idx], v[right]
+                result[col][out] = np.where(frac < 0.5, left_value,
+                                            np.where(frac > 0.5, right_value, left_value & right_value))
+            elif col in valid_samples:
+                valid_time, valid_values = valid_samples[col]
+                result[col][out] = np.interp(x, valid_time, valid_values, left=np.nan) if len(valid_time) else np.nan
+            else:
+                left_value = v[idx]
+                interpolated = left_value + frac * (v[right] - left_value)
+                interpolated[frac < 0] = np.nan
+                result[col][out] = interpolated
+
+    return pd.DataFrame(result, index=pd.Index(new_time, name=time_col))
+
+
+def synchronize_dataframes(dataframes_list, time_col='Time (s)', filter_time=True,
+                           binary_cols=("LinMot_Enable", "LinMot_Up_Down"), chunk_size=RESAMPLE_CHUNK_SIZE):
     """
     Synchronizes a list of DataFrames to the highest sampling rate found among them.
     It does a temporal boundary alignment as well (make all data have the same physical duration).
@@ -173,6 +435,7 @@ def synchronize_dataframes(dataframes_list, time_col='Time (s)', filter_time=Tru
     Args:
         dataframes_list (list): List of Pandas DataFrames.
         time_col (str): The name of the time column (must be present in all DFs).
+        chunk_size (int): Number of samples resampled at once (see resample_dataframe).
 
     Returns:
         List of Pandas DataFrames having the same time column as an index
@@ -187,7 +450,7 @@ def synchronize_dataframes(dataframes_list, time_col='Time (s)', filter_time=Tru
 
     # Check that timestamps are correct:
     for df in dataframes_list:
-        if not (df[time_col].is_monotonic_increasing and df[time_col].is_unique):
+        if not np.all(np.diff(df[time_col].to_numpy()) > 0):
             raise ValueError("The time column must be strictly increasing for interpolation.")
 
     # Check that all dataframes start at the same time
@@ -241,51 +504,189 @@ def synchronize_dataframes(dataframes_list, time_col='Time (s)', filter_time=Tru
 
     for df in dataframes_list:
 
-        # 1. Prepare the DF: remove duplicates and set the time column as the index
-        df_temp = df.drop_duplicates(subset=[time_col]).set_index(time_col)
-
-        # 2. Reindex and Interpolate
-        # - union(): Merges the dataframe's timestamp with the higher sampling rate timestamp
-        # - interpolate(method='index'): Uses the actual time values to calculate data in the new timesteps
-        # - loc[master_time_index]: Keeps only the points belonging to the master timestamp
-        df_sync = (
-            df_temp
-            .reindex(df_temp.index.union(master_time_index))
-            .interpolate(method='index')
-            .loc[master_time_index]
-        )
-
-        # 3. Ensure binary columns to be int data type
-        found_binary_columns = [col for col in binary_cols if col in df_sync.columns]
-        if found_binary_columns:
-            # Apply rounding and cast to integer for all matching columns simultaneously (Vectorization)
-            df_sync[found_binary_columns] = df_sync[found_binary_columns].round().astype(int)
+        # Resample each column at the master timestamps (linear interpolation, nearest sample for binary columns)
+        df_sync = resample_dataframe(df, time_col, master_time_index,
+                                     binary_cols=[col for col in binary_cols if col in df.columns],
+                                     chunk_size=chunk_size)
 
         synced_dataframes.append(df_sync)
 
     return synced_dataframes
 
-def merge_DAQ_data(folder_path, time_col='Time (s)'):
-    files = [f for f in os.listdir(folder_path) if f.endswith('.pkl')]
+def read_DAQ_attributes(file_path):
+    """
+    Reads the attributes of a DAQ HDF5 file without loading any sample.
 
-    dataframes = []
+    Returns
+    -------
+    dict
+        Task name and type, sample rate, start timestamp, DAQ backend ('nidaqmx' or 'simulated', '' in the files
+        written before the backend attribute), number of samples, channel names,
+        conversion factors and units (after conversion) of each channel, and the synchronization of the task:
+        shared start trigger and sample clock ('' if none) and index of the first sample counted from the
+        trigger (0 in the files written before the synchronization attributes).
+    """
+    with h5py.File(file_path, "r") as f:
+        return {
+            "task_name": f.attrs["task_name"],
+            "task_type": f.attrs["task_type"],
+            "sample_rate": float(f.attrs["sample_rate"]),
+            "start_timestamp": f.attrs["start_timestamp"],
+            "daq_backend": str(f.attrs.get("daq_backend", "")),
+            "n_samples": int(f.attrs["n_samples"]),
+            "channel_names": json.loads(f.attrs["channel_names"]),
+            "conversion_factors": json.loads(f.attrs["conversion_factors"]),
+            "units": {dataset.attrs["name"]: dataset.attrs.get("unit", "") for dataset in f["channels"].values()},
+            "start_trigger": str(f.attrs.get("start_trigger", "")),
+            "sample_clock": str(f.attrs.get("sample_clock", "")),
+            "start_sample": int(f.attrs.get("start_sample", 0)),
+        }
+
+
+def read_DAQ_file(file_path, channels=None, start=0, stop=None, time_col='Time (s)', scaled=False):
+    """
+    Reads a DAQ HDF5 file into a DataFrame, only the selected channels and samples are read from disk.
 
-    for file in files:
+    Parameters
+    ----------
+    file_path : str
+        Path to the DAQ-*.h5 file written by the BufferProcessor.
+    channels : list of str, optional
+        Channels to read, all the channels if None. Channels not present in the file are ignored.
+    start, stop : int, optional
+        Sample range to read (same meaning as a Python slice).
+    time_col : str
+        Name of the time column, synthesized from the sample rate.
+    scaled : bool
+        If True, the channels with a conversion factor are returned in engineering units (raw value times the
+        factor, unit in the dataset 'unit' attribute). The file only stores the raw values.
+
+    Returns
+    -------
+    pd.DataFrame
+        The time column followed by the selected channels.
+    """
+    with h5py.File(file_path, "r") as f:
+        fs = float(f.attrs["sample_rate"])
+        n_samples = int(f.attrs["n_samples"])
+        start, stop, _ = slice(start, stop).indices(n_samples)
+
+        data = {time_col: np.arange(start, stop) / fs}
+        for dataset in f["channels"].values():
+            name = dataset.attrs["name"]
+            if channels is None or name in channels:
+                data[name] = dataset[start:stop]
+                factor = float(dataset.attrs.get("conversion_factor", np.nan))
+                if scaled and np.isfinite(factor):
+                    data[name] = data[name] * factor
+
+    return pd.DataFrame(data)
+
+
+def read_aligned_DAQ_files(file_paths, channels=None, time_col='Time (s)', scaled=False,
+                           binary_cols=("LinMot_Enable", "LinMot_Up_Down")):
+    """
+    Reads the DAQ files of tasks started by the same hardware trigger into one DataFrame, aligned by index.
+
+    The sample i of a file is the sample start_sample + i counted from the trigger, so the range acquired by all
+    the tasks is read from each file with a slice, without interpolation.
+
+    Parameters
+    ----------
+    file_paths : list of str
+        DAQ-*.h5 files of the experiment.
+    channels, time_col, scaled :
+        See read_DAQ_file.
+    binary_cols : tuple of str
+        Columns returned as integers, the other channels are returned as floats (same types as
+        synchronize_dataframes).
+
+    Returns
+    -------
+    pd.DataFrame or None
+        The time column (seconds since the trigger) followed by the channels of all the files, None if the
+        files are not synchronized by the same start trigger, don't have the same sample rate or don't have any
+        sample acquired by all the tasks (a task that never received the trigger).
+    """
+    attributes = [read_DAQ_attributes(file_path) for file_path in file_paths]
+    start_triggers = {file_attributes["start_trigger"] for file_attributes in attributes}
+    sample_rates = {file_attributes["sample_rate"] for file_attributes in attributes}
+    if not attributes or len(start_triggers) != 1 or "" in start_triggers or len(sample_rates) != 1:
+        return None
+
+    first = max(file_attributes["start_sample"] for file_attributes in attributes)
+    end = min(file_attributes["start_sample"] + file_attributes["n_samples"] for file_attributes in attributes)
+    if end <= first:
+        empty_files = [os.path.basename(file_path) for file_path, file_attributes in zip(file_paths, attributes)
+                       if file_attributes["n_samples"] == 0]
+        warnings.warn(f"The DAQ files don't have any sample acquired by all the tasks (files without samples: "
+                      f"{empty_files}), they are not aligned by their start sample")
+        return None
+
+    data = {time_col: np.arange(first, end) / sample_rates.pop()}
+    for file_path, file_attributes in zip(file_paths, attributes):
+        offset = file_attributes["start_sample"]
+        df = read_DAQ_file(file_path, channels=channels, start=first - offset, stop=end - offset,
+                           time_col=time_col, scaled=scaled)
+        for column in df.columns.drop(time_col):
+            data[column] = df[column].to_numpy(dtype=int if column in binary_cols else float)
+
+    return pd.DataFrame(data)
+
+
+def merge_DAQ_data(folder_path, time_col='Time (s)', channels=None, scaled=False):
+    """
+    Reads and synchronizes all the DAQ files of an experiment folder.
+
+    The HDF5 files are read lazily (only the requested channels), older experiments saved as pickle files are
+    still supported. With scaled=True the HDF5 channels are converted to engineering units (see read_DAQ_file).
+    The files of tasks started by the same trigger are aligned by their start sample (read_aligned_DAQ_files),
+    the other ones are resampled on the time base of the fastest task (synchronize_dataframes), as well as the
+    files that can't be aligned. The files without samples are skipped.
+    """
+    h5_files = sorted(f for f in os.listdir(folder_path) if f.startswith('DAQ-') and f.endswith('.h5'))
+    files = h5_files or [f for f in os.listdir(folder_path) if f.endswith('.pkl')]
+
+    # The LinMot synchronization columns are always needed to find the start and end of the experiment
+    if channels is not None:
+        channels = set(channels) | {"LinMot_Enable", "LinMot_Up_Down"}
+
+    df = None
+    if h5_files:
         try:
-            df = pd.read_pickle(os.path.join(folder_path, file))
-            dataframes.append(df)
+            df = read_aligned_DAQ_files([os.path.join(folder_path, file) for file in h5_files], channels=channels,
+                                        time_col=time_col, scaled=scaled)
         except Exception as e:
-            raise Exception(f'Error reading DAQ file {file}: {e}.')
+            raise Exception(f'Error reading the DAQ files of {folder_path}: {e}.')
 
-    # Synchronize dataframes
-    synced_dataframes = synchronize_dataframes(dataframes, time_col=time_col)
+    if df is None:
+        dataframes = []
 
-    # Concatenate directly (since all DFs share the same master time index)
-    df = pd.concat(synced_dataframes, axis=1)
-
-    # Restore the time index as a standard column
-    df.index.name = time_col
-    df = df.reset_index()
+        for file in files:
+            try:
+                if h5_files:
+                    df = read_DAQ_file(os.path.join(folder_path, file), channels=channels, time_col=time_col,
+                                       scaled=scaled)
+                else:
+                    df = pd.read_pickle(os.path.join(folder_path, file))
+            except Exception as e:
+                raise Exception(f'Error reading DAQ file {file}: {e}.')
+
+            # Skip the files without any of the requested channels or without samples (task never triggered)
+            if len(df) == 0:
+                warnings.warn(f"DAQ file {file} doesn't have any sample, it is not merged")
+            elif len(df.columns) > 1:
+                dataframes.append(df)
+
+        # Synchronize dataframes
+        synced_dataframes = synchronize_dataframes(dataframes, time_col=time_col)
+
+        # Concatenate directly (since all DFs share the same master time index)
+        df = pd.concat(synced_dataframes, axis=1)
+
+        # Restore the time index as a standard column
+        df.index.name = time_col
+        df = df.reset_index()
 
     # Check synchronization columns:
     if not ("LinMot_Enable" in df.columns and "LinMot_Up_Down" in df.columns):